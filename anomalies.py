@@ -1,54 +1,460 @@
 import os
+import time
 import datetime as dt
-import requests
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
 
+import metrics
+import polygon_api
+from db import get_db
+
 POLYGON_API_KEY = os.getenv("POLYGON_API_KEY")
+# Number of time slices downloaded concurrently by ``fetch_ticks``
+TICK_WORKERS = int(os.getenv("TICK_WORKERS", "8"))
+# Extended trading session (US/Eastern) covered by a single trading day
+SESSION_START = "04:00"
+SESSION_END = "20:00"
+SESSION_TZ = "America/New_York"
+SESSION_MINUTES = 16 * 60
+SESSION_SECONDS = SESSION_MINUTES * 60
+# Activity bin widths in seconds, all produced from one pass over the ticks
+RESOLUTIONS = {"1s": 1, "10s": 10, "1min": 60, "5min": 300}
+BIN_FIELDS = ("count", "volume", "vwap")
+# Completed trading days are cached here as compressed NumPy arrays
+TICK_CACHE_DIR = os.getenv("TICK_CACHE_DIR", "tick_cache")
+# Number of recent days in each ticker's minute-of-day baseline
+BASELINE_DAYS = int(os.getenv("BASELINE_DAYS", "20"))
+# Fewer baseline days than this falls back to same-day statistics
+MIN_BASELINE_DAYS = 3
+# Number of tickers analysed concurrently by ``scan_watchlist``
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", "8"))
 
 
-def fetch_ticks(ticker: str, date: str):
-    """Fetch raw tick data for a single trading day using Polygon's v3 endpoint."""
-    if not POLYGON_API_KEY:
-        raise ValueError("POLYGON_API_KEY not set")
-    url = f"https://api.polygon.io/v3/trades/{ticker}"
+def session_today():
+    """Return today's date in the session timezone as ``YYYY-MM-DD``."""
+    return pd.Timestamp.now(tz=SESSION_TZ).strftime("%Y-%m-%d")
+
+
+def session_bounds(date: str):
+    """Return the UTC start and end timestamps of the trading session."""
+    start = pd.Timestamp(f"{date} {SESSION_START}", tz=SESSION_TZ).tz_convert("UTC")
+    end = pd.Timestamp(f"{date} {SESSION_END}", tz=SESSION_TZ).tz_convert("UTC")
+    return start, end
+
+
+def _fetch_slice(ticker: str, start: str, end: str, last: bool):
+    """Fetch every trade in ``[start, end)`` following the ``next_url`` cursor."""
+    url = f"/v3/trades/{ticker}"
     params = {
-        "timestamp.gte": f"{date}T04:00:00Z",
-        "timestamp.lte": f"{date}T20:00:00Z",
+        "timestamp.gte": start,
+        "timestamp.lte" if last else "timestamp.lt": end,
+        "order": "asc",
+        "sort": "timestamp",
         "limit": 50000,
-        "apiKey": POLYGON_API_KEY,
     }
     trades = []
     while True:
-        resp = requests.get(url, params=params, timeout=10)
-        data = resp.json()
+        data = polygon_api.get_json(url, params=params, endpoint="trades")
         trades.extend(data.get("results", []))
         next_url = data.get("next_url")
         if not next_url:
             break
         url = next_url
-        params = {"apiKey": POLYGON_API_KEY}
+        params = None
     return trades
 
 
-def detect_anomalies(ticker: str, date: str, threshold: float = 3.0):
-    """Return trade count anomalies for the given ticker and date."""
-    trades = fetch_ticks(ticker, date)
-    if not trades:
-        return pd.Series(dtype=int), 0.0, 0.0
-    df = pd.DataFrame(trades)
-    df["time"] = pd.to_datetime(df["sip_timestamp"], unit="ns")
-    counts = df.resample("1min", on="time").size()
-    mean = counts.mean()
-    std = counts.std()
-    anomalies = counts[counts > mean + threshold * std]
-    return anomalies, mean, std
+@metrics.timed("fetch_ticks")
+def fetch_ticks(ticker: str, date: str, slice_minutes: int = 60):
+    """Fetch raw tick data for a single trading day using Polygon's v3 endpoint.
+
+    The session is split into ``slice_minutes`` wide windows that are paginated
+    independently on a bounded worker pool. Slices are requested in ascending
+    timestamp order, so concatenating them in order yields a sorted day.
+    """
+    if not POLYGON_API_KEY:
+        raise ValueError("POLYGON_API_KEY not set")
+    start, end = session_bounds(date)
+    edges = pd.date_range(start, end, freq=f"{slice_minutes}min")
+    if edges[-1] != end:
+        edges = edges.append(pd.DatetimeIndex([end]))
+    bounds = [
+        (
+            edges[i].strftime("%Y-%m-%dT%H:%M:%SZ"),
+            edges[i + 1].strftime("%Y-%m-%dT%H:%M:%SZ"),
+            i == len(edges) - 2,
+        )
+        for i in range(len(edges) - 1)
+    ]
+    with ThreadPoolExecutor(max_workers=min(TICK_WORKERS, len(bounds))) as pool:
+        slices = pool.map(lambda b: _fetch_slice(ticker, *b), bounds)
+        trades = []
+        for chunk in slices:
+            trades.extend(chunk)
+    metrics.inc("tick_trades_total", len(trades))
+    return trades
+
+
+def _is_complete(date: str):
+    """Return True once the session for ``date`` has finished."""
+    return session_bounds(date)[1] < pd.Timestamp.now(tz="UTC")
+
+
+def load_ticks(ticker: str, date: str):
+    """Return a day's trades as ``ts``/``price``/``size`` arrays.
+
+    Completed days are served from ``TICK_CACHE_DIR`` and fetched from the
+    market data provider only once.
+    """
+    from providers import get_provider
+
+    path = os.path.join(TICK_CACHE_DIR, ticker, f"{date}.npz")
+    if os.path.exists(path):
+        with np.load(path) as cached:
+            return {k: cached[k] for k in ("ts", "price", "size")}
+    provider = get_provider()
+    ticks = provider.ticks(ticker, date)
+    if provider.remote and _is_complete(date):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez_compressed(tmp, **ticks)
+        os.replace(tmp, path)
+    return ticks
+
+
+def cached_dates(ticker: str):
+    """Return the dates cached locally for ``ticker`` in ascending order."""
+    folder = os.path.join(TICK_CACHE_DIR, ticker)
+    if not os.path.isdir(folder):
+        return []
+    return sorted(
+        name[:-4]
+        for name in os.listdir(folder)
+        if name.endswith(".npz") and name.count(".") == 1
+    )
+
+
+def activity_bins(ticks, date: str):
+    """Return count/volume/VWAP bins at every resolution in ``RESOLUTIONS``.
+
+    The ticks are scanned once to build cumulative trade, volume and notional
+    sums; each resolution then only reads those sums at its bin edges.
+    """
+    start, _ = session_bounds(date)
+    ts = ticks["ts"]
+    order = None
+    if len(ts) > 1 and (np.diff(ts) < 0).any():
+        order = np.argsort(ts, kind="stable")
+        ts = ts[order]
+    price = ticks["price"] if order is None else ticks["price"][order]
+    size = ticks["size"] if order is None else ticks["size"][order]
+
+    offsets = ts - start.value
+    cum_volume = np.concatenate(([0.0], np.cumsum(size)))
+    cum_notional = np.concatenate(([0.0], np.cumsum(price * size)))
+    bins = {}
+    for name, seconds in RESOLUTIONS.items():
+        edges = np.arange(0, SESSION_SECONDS + seconds, seconds, dtype=np.int64)
+        idx = np.searchsorted(offsets, edges * 1_000_000_000, side="left")
+        count = np.diff(idx).astype(np.float64)
+        volume = np.diff(cum_volume[idx])
+        notional = np.diff(cum_notional[idx])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            vwap = np.where(volume > 0, notional / volume, np.nan)
+        bins[name] = {"count": count, "volume": volume, "vwap": vwap}
+    return bins
+
+
+def load_bins(ticker: str, date: str):
+    """Return ``activity_bins`` for a day, cached next to its ticks."""
+    path = os.path.join(TICK_CACHE_DIR, ticker, f"{date}.bins.npz")
+    if os.path.exists(path):
+        with np.load(path) as cached:
+            return {
+                name: {field: cached[f"{name}_{field}"] for field in BIN_FIELDS}
+                for name in RESOLUTIONS
+            }
+    bins = activity_bins(load_ticks(ticker, date), date)
+    if _is_complete(date):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez_compressed(
+            tmp,
+            **{
+                f"{name}_{field}": values[field]
+                for name, values in bins.items()
+                for field in BIN_FIELDS
+            },
+        )
+        os.replace(tmp, path)
+    return bins
+
+
+def load_baseline(ticker: str):
+    """Return ``(dates, mean, m2)`` of the stored minute-of-day baseline."""
+    conn = get_db()
+    row = conn.execute(
+        "SELECT dates, mean, m2 FROM anomaly_baselines WHERE ticker = ?", (ticker,)
+    ).fetchone()
+    if row is None:
+        zeros = np.zeros(SESSION_MINUTES)
+        return [], zeros, zeros.copy()
+    dates = row["dates"].split(",") if row["dates"] else []
+    return (
+        dates,
+        np.frombuffer(row["mean"], dtype=np.float64).copy(),
+        np.frombuffer(row["m2"], dtype=np.float64).copy(),
+    )
+
+
+def _welford_add(n, mean, m2, x):
+    n += 1
+    delta = x - mean
+    mean = mean + delta / n
+    m2 = m2 + delta * (x - mean)
+    return n, mean, m2
+
+
+def _welford_remove(n, mean, m2, x):
+    if n <= 1:
+        zeros = np.zeros_like(mean)
+        return 0, zeros, zeros.copy()
+    n -= 1
+    delta = x - mean
+    mean = mean - delta / n
+    m2 = np.maximum(m2 - delta * (x - mean), 0.0)
+    return n, mean, m2
+
+
+def _day_counts(conn, ticker: str, date: str):
+    row = conn.execute(
+        "SELECT counts FROM anomaly_days WHERE ticker = ? AND date = ?", (ticker, date)
+    ).fetchone()
+    return np.frombuffer(row["counts"], dtype=np.float64) if row else None
+
+
+def ingest_day(ticker: str, date: str, counts):
+    """Fold one day's minute counts into the rolling baseline.
+
+    The baseline keeps the ``BASELINE_DAYS`` most recent days; the oldest day
+    is removed with the reverse Welford update so nothing is recomputed.
+    """
+    dates, mean, m2 = load_baseline(ticker)
+    if date in dates:
+        return False
+    if len(dates) >= BASELINE_DAYS and date < dates[0]:
+        return False
+    conn = get_db()
+    conn.execute(
+        "INSERT OR REPLACE INTO anomaly_days (ticker, date, counts) VALUES (?, ?, ?)",
+        (ticker, date, np.asarray(counts, dtype=np.float64).tobytes()),
+    )
+    n, mean, m2 = _welford_add(len(dates), mean, m2, counts)
+    dates = sorted(dates + [date])
+    while len(dates) > BASELINE_DAYS:
+        oldest = dates.pop(0)
+        old_counts = _day_counts(conn, ticker, oldest)
+        if old_counts is not None:
+            n, mean, m2 = _welford_remove(n, mean, m2, old_counts)
+        conn.execute(
+            "DELETE FROM anomaly_days WHERE ticker = ? AND date = ?", (ticker, oldest)
+        )
+    conn.execute(
+        "INSERT OR REPLACE INTO anomaly_baselines (ticker, dates, mean, m2) VALUES (?, ?, ?, ?)",
+        (ticker, ",".join(dates), mean.tobytes(), m2.tobytes()),
+    )
+    conn.commit()
+    return True
+
+
+def build_baseline(ticker: str, days: int = BASELINE_DAYS, end: str = None):
+    """Ingest the last ``days`` weekdays before ``end`` into the baseline."""
+    end_date = pd.Timestamp(end) if end else pd.Timestamp.now(tz=SESSION_TZ).normalize()
+    candidates = pd.bdate_range(end=end_date - pd.Timedelta(days=1), periods=days)
+    ingested = 0
+    for day in candidates.strftime("%Y-%m-%d"):
+        counts = load_bins(ticker, day)["1min"]["count"]
+        if counts.any() and ingest_day(ticker, day, counts):
+            ingested += 1
+    return ingested
+
+
+def detect_anomalies(ticker: str, date: str, threshold: float = 3.0, resolution: str = "1min"):
+    """Return trade count anomalies for the given ticker and date.
+
+    Each bin is scored against the mean and standard deviation of the same
+    time of day over the stored minute baseline, so the open and close spikes
+    are expected rather than flagged. Coarser bins sum the minute baseline and
+    finer bins split it evenly; with too short a baseline the day's own
+    statistics are used instead. The result is a DataFrame of ``count``,
+    ``volume``, ``vwap``, ``expected`` and ``zscore`` per anomalous bin plus the
+    average mean and std.
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown resolution: {resolution}")
+    columns = ["count", "volume", "vwap", "expected", "zscore"]
+    bins = load_bins(ticker, date)
+    minutes = bins["1min"]["count"]
+    if not minutes.any():
+        return pd.DataFrame(columns=columns), 0.0, 0.0
+    counts = bins[resolution]["count"]
+
+    dates, mean, m2 = load_baseline(ticker)
+    n = len(dates)
+    if date in dates:
+        n, mean, m2 = _welford_remove(n, mean, m2, minutes)
+    seconds = RESOLUTIONS[resolution]
+    if n >= MIN_BASELINE_DAYS:
+        var = m2 / (n - 1)
+        if seconds >= 60:
+            per_bin = seconds // 60
+            mean = mean.reshape(-1, per_bin).sum(axis=1)
+            std = np.sqrt(var.reshape(-1, per_bin).sum(axis=1))
+        else:
+            per_minute = 60 // seconds
+            mean = np.repeat(mean / per_minute, per_minute)
+            std = np.repeat(np.sqrt(var / per_minute), per_minute)
+    else:
+        active = counts[counts > 0]
+        mean = np.full(len(counts), active.mean())
+        std = np.full(len(counts), active.std(ddof=1) if len(active) > 1 else 0.0)
+    # Trade counts are at least Poisson-noisy; floor the std so quiet bins
+    # with near-zero sample variance do not explode the score
+    zscore = (counts - mean) / np.maximum(std, np.sqrt(np.maximum(mean, 1.0)))
+
+    if _is_complete(date):
+        ingest_day(ticker, date, minutes)
+
+    index = pd.date_range(
+        f"{date} {SESSION_START}", periods=len(counts), freq=f"{seconds}s"
+    )
+    frame = pd.DataFrame(
+        {
+            "count": counts.astype(int),
+            "volume": bins[resolution]["volume"],
+            "vwap": bins[resolution]["vwap"],
+            "expected": mean,
+            "zscore": zscore,
+        },
+        index=index,
+    )
+    anomalies = frame[(zscore > threshold) & (counts > 0)]
+    return anomalies, float(mean.mean()), float(std.mean())
+
+
+def _scan_ticker(ticker: str, date: str, threshold: float):
+    started = time.perf_counter()
+    try:
+        anomalies, _, _ = detect_anomalies(ticker, date, threshold)
+        error = None
+    except Exception as e:
+        anomalies = pd.DataFrame(columns=["count", "expected", "zscore"])
+        error = str(e)
+    return ticker, anomalies, time.perf_counter() - started, error
+
+
+def scan_watchlist(date: str, threshold: float = 3.0, workers: int = SCAN_WORKERS):
+    """Run ``detect_anomalies`` for every saved ticker and rank the results.
+
+    Tickers are analysed on a bounded thread pool while all Polygon traffic
+    still goes through the shared rate limit. Results replace any earlier scan
+    for ``date`` and are returned as ``(ranked rows, per-ticker timings)``.
+    """
+    conn = get_db()
+    tickers = [row["ticker"] for row in conn.execute("SELECT ticker FROM tickers")]
+
+    rows = []
+    timings = []
+    if tickers:
+        with ThreadPoolExecutor(max_workers=min(workers, len(tickers))) as pool:
+            futures = [pool.submit(_scan_ticker, t, date, threshold) for t in tickers]
+            for future in futures:
+                ticker, anomalies, seconds, error = future.result()
+                timings.append(
+                    {
+                        "ticker": ticker,
+                        "seconds": seconds,
+                        "anomalies": len(anomalies),
+                        "error": error,
+                    }
+                )
+                for ts, row in anomalies.iterrows():
+                    rows.append(
+                        {
+                            "ticker": ticker,
+                            "time": ts.strftime("%H:%M"),
+                            "count": int(row["count"]),
+                            "expected": float(row["expected"]),
+                            "zscore": float(row["zscore"]),
+                        }
+                    )
+    rows.sort(key=lambda r: r["zscore"], reverse=True)
+
+    conn = get_db()
+    conn.execute("DELETE FROM anomaly_scans WHERE date = ?", (date,))
+    conn.execute("DELETE FROM anomaly_scan_tickers WHERE date = ?", (date,))
+    conn.executemany(
+        "INSERT INTO anomaly_scans (date, ticker, time, count, expected, zscore) VALUES (?, ?, ?, ?, ?, ?)",
+        [(date, r["ticker"], r["time"], r["count"], r["expected"], r["zscore"]) for r in rows],
+    )
+    conn.executemany(
+        "INSERT INTO anomaly_scan_tickers (date, ticker, seconds, anomalies, error) VALUES (?, ?, ?, ?, ?)",
+        [(date, t["ticker"], t["seconds"], t["anomalies"], t["error"]) for t in timings],
+    )
+    conn.commit()
+    return rows, timings
+
+
+def load_scan(date: str, limit: int = 100):
+    """Return the stored ranked rows and per-ticker timings for ``date``."""
+    conn = get_db()
+    rows = [
+        dict(r)
+        for r in conn.execute(
+            "SELECT ticker, time, count, expected, zscore FROM anomaly_scans "
+            "WHERE date = ? ORDER BY zscore DESC LIMIT ?",
+            (date, limit),
+        )
+    ]
+    timings = [
+        dict(r)
+        for r in conn.execute(
+            "SELECT ticker, seconds, anomalies, error FROM anomaly_scan_tickers "
+            "WHERE date = ? ORDER BY seconds DESC",
+            (date,),
+        )
+    ]
+    return rows, timings
 
 
 def main():
     import sys
+    import db
 
+    db.init_db()
     if len(sys.argv) < 2:
         print("Usage: python anomalies.py TICKER [YYYY-MM-DD] [threshold]")
+        print("       python anomalies.py --baseline TICKER [days]")
+        print("       python anomalies.py --scan [YYYY-MM-DD] [threshold]")
+        return
+    if sys.argv[1] == "--scan":
+        date = sys.argv[2] if len(sys.argv) > 2 else dt.date.today().strftime("%Y-%m-%d")
+        threshold = float(sys.argv[3]) if len(sys.argv) > 3 else 3.0
+        started = time.perf_counter()
+        rows, timings = scan_watchlist(date, threshold)
+        print(f"Scanned {len(timings)} tickers in {time.perf_counter() - started:.1f}s")
+        for t in sorted(timings, key=lambda t: t["seconds"], reverse=True):
+            status = t["error"] or f"{t['anomalies']} anomalies"
+            print(f"  {t['ticker']:<8} {t['seconds']:6.2f}s  {status}")
+        for r in rows[:20]:
+            print(r["ticker"], r["time"], r["count"], f"z {r['zscore']:.1f}")
+        return
+    if sys.argv[1] == "--baseline":
+        ticker = sys.argv[2].upper()
+        days = int(sys.argv[3]) if len(sys.argv) > 3 else BASELINE_DAYS
+        ingested = build_baseline(ticker, days)
+        print(f"Ingested {ingested} new days into the {ticker} baseline")
         return
     ticker = sys.argv[1].upper()
     date = sys.argv[2] if len(sys.argv) > 2 else dt.date.today().strftime("%Y-%m-%d")
@@ -59,8 +465,12 @@ def main():
         print("No anomalies detected")
     else:
         print(f"Anomalies for {ticker} on {date} (mean {mean:.2f}, std {std:.2f})")
-        for ts, count in anomalies.items():
-            print(ts.strftime("%H:%M"), int(count))
+        for ts, row in anomalies.iterrows():
+            print(
+                ts.strftime("%H:%M"),
+                int(row["count"]),
+                f"(expected {row['expected']:.1f}, z {row['zscore']:.1f})",
+            )
 
 
 if __name__ == "__main__":
@@ -1,17 +1,45 @@
-from flask import Flask
+from flask import Flask, jsonify
 import os
 
 import db
+import http_cache
+import metrics
 from auth import bp as auth_bp
 from stocks import bp as stocks_bp
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", os.urandom(24))
 
+db.init_app(app)
+metrics.init_app(app)
+http_cache.init_app(app)
 app.register_blueprint(auth_bp)
 app.register_blueprint(stocks_bp)
 
-db.init_db()
+
+@app.route("/healthz")
+def healthz():
+    """Readiness probe: the app is loaded and the database answers."""
+    try:
+        db.get_db().execute("SELECT 1").fetchone()
+    except Exception as e:
+        return jsonify(status="error", error=str(e)), 503
+    return jsonify(status="ok")
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Expose stage latencies and counters for Prometheus."""
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+
+@app.cli.command("init-db")
+def init_db_command():
+    """Create or upgrade the SQLite schema."""
+    db.init_db()
+    print("Initialized the database.")
+
 
 if __name__ == '__main__':
+    db.init_db()
     app.run(debug=True, host='0.0.0.0')
@@ -1,8 +1,10 @@
+from collections import OrderedDict
 from functools import wraps
 import secrets
 import sqlite3
+import threading
+import time
 import os
-import requests
 from dotenv import load_dotenv
 from flask import (
     Blueprint,
@@ -128,6 +130,8 @@ def send_verification_email(to_email, verify_url):
         return False
     sender = os.environ.get("MAILGUN_FROM", f"no-reply@{mailgun_domain}")
     try:
+        import requests
+
         resp = requests.post(
             f"https://api.mailgun.net/v3/{mailgun_domain}/messages",
             auth=("api", mailgun_key),
@@ -146,15 +150,44 @@ def send_verification_email(to_email, verify_url):
         print(f"Failed to send email via Mailgun: {e}")
         return False
 
+# Logged-in users are cached per process so most requests skip the users query
+USER_CACHE_SIZE = 1024
+USER_CACHE_TTL = 30  # seconds
+_user_cache = OrderedDict()
+_user_cache_lock = threading.Lock()
+
+
+def get_user(user_id):
+    """Return the users row for ``user_id`` from the LRU cache or SQLite."""
+    now = time.monotonic()
+    with _user_cache_lock:
+        entry = _user_cache.get(user_id)
+        if entry is not None and entry[0] > now:
+            _user_cache.move_to_end(user_id)
+            return entry[1]
+    conn = get_db()
+    user = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
+    with _user_cache_lock:
+        _user_cache[user_id] = (now + USER_CACHE_TTL, user)
+        _user_cache.move_to_end(user_id)
+        while len(_user_cache) > USER_CACHE_SIZE:
+            _user_cache.popitem(last=False)
+    return user
+
+
+def invalidate_user(user_id):
+    """Drop ``user_id`` from the cache after its row changes."""
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+
+
 @bp.before_app_request
 def load_logged_in_user():
     user_id = session.get('user_id')
-    if user_id is None:
+    if user_id is None or request.endpoint == 'static':
         g.user = None
     else:
-        conn = get_db()
-        g.user = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
-        conn.close()
+        g.user = get_user(user_id)
 
 
 def login_required(view):
@@ -175,12 +208,12 @@ def login():
         password = request.form['password']
         conn = get_db()
         user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
-        conn.close()
         if user and check_password_hash(user['password_hash'], password):
             if not user['is_verified']:
                 message = '로그인 하기 전에 이메일 인증을 완료해주세요.'
             else:
                 session.clear()
+                invalidate_user(user['id'])
                 session['user_id'] = user['id']
                 return redirect(url_for('stocks.index'))
         else:
@@ -214,8 +247,6 @@ def register():
                 return render_template_string(verify_template, message=message)
             except sqlite3.IntegrityError:
                 message = '이미 사용 중인 사용자 이름 또는 이메일입니다.'
-            finally:
-                conn.close()
     return render_template_string(register_template, message=message)
 
 
@@ -229,13 +260,16 @@ def verify(token):
             (user['id'],),
         )
         conn.commit()
+        invalidate_user(user['id'])
         message = '이메일 인증이 완료되었습니다. 이제 로그인 하실 수 있습니다.'
     else:
         message = '유효하지 않은 인증 토큰입니다.'
-    conn.close()
     return render_template_string(verify_template, message=message)
 
 @bp.route('/logout')
 def logout():
+    user_id = session.get('user_id')
+    if user_id is not None:
+        invalidate_user(user_id)
     session.clear()
     return redirect(url_for('auth.login'))
@@ -0,0 +1,325 @@
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from anomalies import cached_dates, load_ticks
+from db import get_db
+
+# Bar kinds built from ticks and the trade quantity each one accumulates
+TICK_BAR_KINDS = ("volume", "dollar", "tick")
+# Thresholds default to the day's total divided by this many bars
+TARGET_BARS_PER_DAY = 390
+# Trades processed per vectorized step; bounds memory for any day size
+CHUNK_SIZE = 1_000_000
+# Intraday intervals derived from stored 1-minute bars, in minutes
+DERIVED_INTERVALS = {"5m": 5, "15m": 15, "1h": 60}
+NS_PER_MS = 1_000_000
+
+
+def ts_unit(kind):
+    """Return the unit of stored ``ts`` values for bars of ``kind``.
+
+    Tick-derived bars can open within the same millisecond, so they keep
+    the nanosecond stamp of their first trade; time bars use milliseconds
+    like Polygon.
+    """
+    return "ns" if kind in TICK_BAR_KINDS else "ms"
+
+
+def to_stamps(index, kind):
+    """Return ``index`` as stored ``ts`` integers for bars of ``kind``."""
+    return index.as_unit(ts_unit(kind)).asi8.tolist()
+
+
+def to_stamp(value, kind):
+    """Return one timestamp as a stored ``ts`` integer for bars of ``kind``."""
+    ns = int(pd.Timestamp(value).value)
+    return ns if ts_unit(kind) == "ns" else ns // NS_PER_MS
+
+
+def from_stamps(stamps, kind):
+    """Return stored ``ts`` integers of ``kind`` as a ``DatetimeIndex``."""
+    return pd.to_datetime(stamps, unit=ts_unit(kind))
+
+
+class BarBuilder:
+    """Stream trades into bars that close every ``threshold`` units.
+
+    ``kind`` selects the accumulated quantity: share volume, dollar value or
+    trade count. A bar closes on the trade whose cumulative quantity crosses
+    the next multiple of ``threshold``. Trades are fed in chunks and handled
+    with vectorized reductions; only the still-open bar is carried between
+    chunks, so memory does not grow with the day.
+    """
+
+    def __init__(self, kind, threshold):
+        if kind not in TICK_BAR_KINDS:
+            raise ValueError(f"Unknown bar kind: {kind}")
+        if threshold <= 0:
+            raise ValueError("threshold must be positive")
+        self.kind = kind
+        self.threshold = float(threshold)
+        self.total = 0.0
+        self.partial = None
+        self.bars = []
+
+    def update(self, ts, price, size):
+        """Add a chunk of trades and return the number of bars completed."""
+        if not len(ts):
+            return 0
+        if self.kind == "volume":
+            measure = size
+        elif self.kind == "dollar":
+            measure = price * size
+        else:
+            measure = np.ones(len(ts))
+        cum_after = self.total + np.cumsum(measure)
+        cum_before = cum_after - measure
+        self.total = float(cum_after[-1])
+        ids = np.floor(cum_before / self.threshold).astype(np.int64)
+
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        ends = np.r_[starts[1:], len(ids)]
+        groups = {
+            "id": ids[starts],
+            "ts": ts[starts],
+            "open": price[starts],
+            "high": np.maximum.reduceat(price, starts),
+            "low": np.minimum.reduceat(price, starts),
+            "close": price[ends - 1],
+            "volume": np.add.reduceat(size, starts),
+            "notional": np.add.reduceat(price * size, starts),
+            "trades": ends - starts,
+        }
+        rows = [dict(zip(groups, values)) for values in zip(*groups.values())]
+        if self.partial is not None:
+            if rows[0]["id"] == self.partial["id"]:
+                rows[0] = self._merge(self.partial, rows[0])
+            else:
+                rows.insert(0, self.partial)
+        last_complete = cum_after[-1] >= (rows[-1]["id"] + 1) * self.threshold
+        self.partial = None if last_complete else rows.pop()
+        self.bars.extend(rows)
+        return len(rows)
+
+    @staticmethod
+    def _merge(first, second):
+        return {
+            "id": first["id"],
+            "ts": first["ts"],
+            "open": first["open"],
+            "high": max(first["high"], second["high"]),
+            "low": min(first["low"], second["low"]),
+            "close": second["close"],
+            "volume": first["volume"] + second["volume"],
+            "notional": first["notional"] + second["notional"],
+            "trades": first["trades"] + second["trades"],
+        }
+
+    def flush(self):
+        """Close the open bar, if any, at the end of the stream."""
+        if self.partial is not None:
+            self.bars.append(self.partial)
+            self.partial = None
+
+    def frame(self):
+        """Return the completed bars in the layout of ``fetch_stock_history``."""
+        bars = self.bars
+        df = pd.DataFrame(
+            {
+                "Open": [b["open"] for b in bars],
+                "High": [b["high"] for b in bars],
+                "Low": [b["low"] for b in bars],
+                "Close": [b["close"] for b in bars],
+                "Volume": [b["volume"] for b in bars],
+                "VWAP": [b["notional"] / b["volume"] if b["volume"] else b["close"] for b in bars],
+                "Trades": [int(b["trades"]) for b in bars],
+            },
+            index=pd.to_datetime([int(b["ts"]) for b in bars], unit="ns"),
+        )
+        return df
+
+
+def default_thresholds(ticks):
+    """Return per-kind thresholds giving about ``TARGET_BARS_PER_DAY`` bars."""
+    volume = float(ticks["size"].sum())
+    dollar = float((ticks["price"] * ticks["size"]).sum())
+    count = float(len(ticks["ts"]))
+    return {
+        "volume": max(volume / TARGET_BARS_PER_DAY, 1.0),
+        "dollar": max(dollar / TARGET_BARS_PER_DAY, 1.0),
+        "tick": max(round(count / TARGET_BARS_PER_DAY), 1),
+    }
+
+
+def build_tick_bars(ticks, thresholds=None):
+    """Build volume, dollar and tick bars from one pass over ``ticks``."""
+    thresholds = thresholds or default_thresholds(ticks)
+    builders = [BarBuilder(kind, thresholds[kind]) for kind in TICK_BAR_KINDS]
+    ts, price, size = ticks["ts"], ticks["price"], ticks["size"]
+    for start in range(0, len(ts), CHUNK_SIZE):
+        chunk = slice(start, start + CHUNK_SIZE)
+        for builder in builders:
+            builder.update(ts[chunk], price[chunk], size[chunk])
+    for builder in builders:
+        builder.flush()
+    return {builder.kind: builder.frame() for builder in builders}
+
+
+def save_bars(ticker, kind, df):
+    """Insert or replace bars of ``kind`` for ``ticker`` in the bar store."""
+    if df is None or df.empty:
+        return
+    stamps = to_stamps(df.index, kind)
+    vwap = df["VWAP"] if "VWAP" in df else pd.Series(np.nan, index=df.index)
+    trades = df["Trades"] if "Trades" in df else pd.Series(np.nan, index=df.index)
+    conn = get_db()
+    conn.executemany(
+        "INSERT OR REPLACE INTO bars (ticker, kind, ts, open, high, low, close, volume, vwap, trades) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (ticker, kind, ts, *values)
+            for ts, values in zip(
+                stamps,
+                zip(
+                    df["Open"].astype(float).tolist(),
+                    df["High"].astype(float).tolist(),
+                    df["Low"].astype(float).tolist(),
+                    df["Close"].astype(float).tolist(),
+                    df["Volume"].astype(float).tolist(),
+                    [None if pd.isna(v) else float(v) for v in vwap],
+                    [None if pd.isna(v) else int(v) for v in trades],
+                ),
+            )
+        ],
+    )
+    conn.commit()
+
+
+def load_bars(ticker, kind, start=None):
+    """Return stored bars of ``kind`` as an OHLCV DataFrame, oldest first."""
+    conn = get_db()
+    query = "SELECT ts, open, high, low, close, volume, vwap, trades FROM bars WHERE ticker = ? AND kind = ?"
+    params = [ticker, kind]
+    if start is not None:
+        query += " AND ts >= ?"
+        params.append(to_stamp(start, kind))
+    rows = conn.execute(query + " ORDER BY ts", params).fetchall()
+    return pd.DataFrame(
+        {
+            "Open": [r["open"] for r in rows],
+            "High": [r["high"] for r in rows],
+            "Low": [r["low"] for r in rows],
+            "Close": [r["close"] for r in rows],
+            "Volume": [r["volume"] for r in rows],
+            "VWAP": [r["vwap"] for r in rows],
+            "Trades": [r["trades"] for r in rows],
+        },
+        index=from_stamps([r["ts"] for r in rows], kind),
+    )
+
+
+def load_sparklines(tickers, kind="1d", points=30):
+    """Return the last ``points`` closes of ``kind`` bars for many tickers."""
+    if not tickers:
+        return {}
+    conn = get_db()
+    rows = conn.execute(
+        "SELECT ticker, close FROM ("
+        "  SELECT ticker, ts, close, ROW_NUMBER() OVER (PARTITION BY ticker ORDER BY ts DESC) AS rn"
+        f"  FROM bars WHERE kind = ? AND ticker IN ({','.join('?' * len(tickers))})"
+        ") WHERE rn <= ? ORDER BY ticker, ts",
+        (kind, *tickers, points),
+    ).fetchall()
+    closes = {}
+    for row in rows:
+        closes.setdefault(row["ticker"], []).append(row["close"])
+    return closes
+
+
+def resample_bars(df, minutes):
+    """Aggregate time bars into ``minutes``-wide buckets aligned to the UTC hour.
+
+    Bars must be sorted. Each bucket is labelled by its start like Polygon's
+    aggregates; VWAP is volume-weighted and trade counts are summed.
+    """
+    if df.empty:
+        return df
+    ts = df.index.as_unit("ms").asi8
+    width = minutes * 60_000
+    bucket = ts - ts % width
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(ts)]
+    volume = df["Volume"].to_numpy(dtype=np.float64)
+    out = {
+        "Open": df["Open"].to_numpy(dtype=np.float64)[starts],
+        "High": np.maximum.reduceat(df["High"].to_numpy(dtype=np.float64), starts),
+        "Low": np.minimum.reduceat(df["Low"].to_numpy(dtype=np.float64), starts),
+        "Close": df["Close"].to_numpy(dtype=np.float64)[ends - 1],
+        "Volume": np.add.reduceat(volume, starts),
+    }
+    if "VWAP" in df:
+        vwap = pd.to_numeric(df["VWAP"]).to_numpy(dtype=np.float64)
+        known = ~np.isnan(vwap)
+        weighted = np.add.reduceat(np.where(known, vwap * volume, 0.0), starts)
+        weight = np.add.reduceat(np.where(known, volume, 0.0), starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out["VWAP"] = np.where(weight > 0, weighted / weight, np.nan)
+    if "Trades" in df:
+        trades = pd.to_numeric(df["Trades"]).to_numpy(dtype=np.float64)
+        known = np.add.reduceat((~np.isnan(trades)).astype(np.int64), starts)
+        out["Trades"] = np.where(known > 0, np.add.reduceat(np.nan_to_num(trades), starts), np.nan)
+    return pd.DataFrame(out, index=pd.to_datetime(bucket[starts], unit="ms"))
+
+
+def derive_bars(ticker, interval):
+    """Extend stored ``interval`` bars from stored 1-minute bars.
+
+    Only minutes from the start of the newest derived bar onwards are read,
+    so that possibly partial bar is rebuilt and later buckets are appended.
+    Returns the number of bars written.
+    """
+    minutes = DERIVED_INTERVALS[interval]
+    row = get_db().execute(
+        "SELECT MAX(ts) AS ts FROM bars WHERE ticker = ? AND kind = ?", (ticker, interval)
+    ).fetchone()
+    start = pd.Timestamp(row["ts"], unit="ms") if row["ts"] is not None else None
+    derived = resample_bars(load_bars(ticker, "1m", start), minutes)
+    save_bars(ticker, interval, derived)
+    return len(derived)
+
+
+def build_day(ticker, date):
+    """Build and store the tick-derived bars for one cached trading day."""
+    ticks = load_ticks(ticker, date)
+    if not len(ticks["ts"]):
+        return {}
+    frames = build_tick_bars(ticks)
+    for kind, df in frames.items():
+        save_bars(ticker, kind, df)
+    return frames
+
+
+def main():
+    import db
+
+    db.init_db()
+    if len(sys.argv) < 2:
+        print("Usage: python bars.py TICKER [YYYY-MM-DD ...]")
+        return
+    ticker = sys.argv[1].upper()
+    dates = sys.argv[2:] or cached_dates(ticker)
+    if not dates:
+        print(f"No cached tick days for {ticker}")
+        return
+    for date in dates:
+        started = time.perf_counter()
+        frames = build_day(ticker, date)
+        elapsed = time.perf_counter() - started
+        counts = ", ".join(f"{len(df)} {kind}" for kind, df in frames.items())
+        print(f"{ticker} {date}: {counts or 'no trades'} bars in {elapsed:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""Local stand-in for the Polygon and OpenAI HTTP APIs used by the benchmarks.
+
+Serves the endpoints the app calls with deterministic synthetic data, or with
+a recorded JSON body when ``--fixtures DIR`` holds a file named after the
+request path (``/v2/reference/news`` -> ``v2_reference_news.json``). Every
+response is delayed by ``--latency`` milliseconds to mimic the network.
+
+    python benchmarks/fake_upstream.py --port 8099 --latency 50
+    POLYGON_BASE_URL=http://127.0.0.1:8099 OPENAI_BASE_URL=http://127.0.0.1:8099/v1 python app.py
+"""
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+import datetime as dt
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+# Average trades per minute in the synthetic tick stream
+TRADES_PER_MINUTE = 200
+PAGE_LIMIT = 50000
+
+
+def _rng(*parts):
+    seed = hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest()
+    return random.Random(int(seed[:16], 16))
+
+
+def _ns(stamp):
+    return int(dt.datetime.strptime(stamp, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=dt.timezone.utc).timestamp()) * 10**9
+
+
+def daily_bars(ticker, start, end):
+    rng = _rng("bars", ticker)
+    price = rng.uniform(20, 400)
+    day = dt.date.fromisoformat(start)
+    last = dt.date.fromisoformat(end)
+    results = []
+    while day <= last:
+        if day.weekday() < 5:
+            open_ = price
+            price = max(1.0, price * (1 + rng.gauss(0.0005, 0.02)))
+            results.append(
+                {
+                    "t": int(dt.datetime.combine(day, dt.time(), dt.timezone.utc).timestamp() * 1000),
+                    "o": round(open_, 2),
+                    "h": round(max(open_, price) * (1 + rng.random() * 0.01), 2),
+                    "l": round(min(open_, price) * (1 - rng.random() * 0.01), 2),
+                    "c": round(price, 2),
+                    "v": rng.randint(100_000, 5_000_000),
+                }
+            )
+        day += dt.timedelta(days=1)
+    return results
+
+
+def _ms(value, end=False):
+    """Parse an aggregates range bound: a millisecond timestamp or a date."""
+    if value.isdigit():
+        return int(value)
+    day = dt.datetime.combine(dt.date.fromisoformat(value), dt.time(), dt.timezone.utc)
+    return int(day.timestamp() * 1000) + (86_400_000 - 1 if end else 0)
+
+
+def minute_bars(ticker, start_ms, end_ms):
+    """Return regular-session minute bars of ``ticker`` within ``[start_ms, end_ms]``."""
+    results = []
+    day = dt.datetime.fromtimestamp(start_ms / 1000, dt.timezone.utc).date()
+    last = dt.datetime.fromtimestamp(end_ms / 1000, dt.timezone.utc).date()
+    while day <= last:
+        if day.weekday() < 5:
+            rng = _rng("minutes", ticker, day)
+            price = rng.uniform(20, 400)
+            open_ms = int(dt.datetime.combine(day, dt.time(13, 30), dt.timezone.utc).timestamp() * 1000)
+            for i in range(390):
+                t = open_ms + i * 60_000
+                open_ = price
+                price = max(1.0, price * (1 + rng.gauss(0, 0.001)))
+                if start_ms <= t <= end_ms:
+                    results.append(
+                        {
+                            "t": t,
+                            "o": round(open_, 2),
+                            "h": round(max(open_, price) * 1.0005, 2),
+                            "l": round(min(open_, price) * 0.9995, 2),
+                            "c": round(price, 2),
+                            "v": rng.randint(1_000, 50_000),
+                        }
+                    )
+        day += dt.timedelta(days=1)
+    return results
+
+
+def trades(ticker, start_ns, end_ns):
+    """Return the synthetic trades of ``ticker`` in ``[start_ns, end_ns)``."""
+    rng = _rng("trades", ticker, start_ns)
+    minutes = max(1, (end_ns - start_ns) // 60_000_000_000)
+    count = int(minutes * TRADES_PER_MINUTE * rng.uniform(0.8, 1.2))
+    stamps = sorted(rng.randrange(start_ns, end_ns) for _ in range(count))
+    price = rng.uniform(20, 400)
+    return [
+        {"sip_timestamp": ts, "price": round(price * (1 + rng.gauss(0, 0.001)), 2), "size": rng.randint(1, 500)}
+        for ts in stamps
+    ]
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, body):
+        time.sleep(self.server.latency)
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _fixture(self, path):
+        if not self.server.fixtures:
+            return None
+        name = os.path.join(self.server.fixtures, path.strip("/").replace("/", "_") + ".json")
+        if os.path.exists(name):
+            with open(name) as f:
+                return json.load(f)
+        return None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        parts = url.path.strip("/").split("/")
+        body = self._fixture(url.path)
+        if body is not None:
+            return self._send(body)
+        if url.path.startswith("/v2/aggs/ticker/") and parts[-1] == "prev":
+            bars = daily_bars(parts[3], "2020-01-01", dt.date.today().isoformat())
+            return self._send({"status": "OK", "results": bars[-1:]})
+        if url.path.startswith("/v2/aggs/ticker/") and parts[6] == "minute":
+            bars = minute_bars(parts[3], _ms(parts[7]), _ms(parts[8], end=True))
+            return self._send({"status": "OK", "results": bars[: int(query.get("limit", 5000))]})
+        if url.path.startswith("/v2/aggs/ticker/"):
+            start = dt.datetime.fromtimestamp(_ms(parts[7]) / 1000, dt.timezone.utc).date()
+            end = dt.datetime.fromtimestamp(_ms(parts[8], end=True) / 1000, dt.timezone.utc).date()
+            return self._send({"status": "OK", "results": daily_bars(parts[3], start.isoformat(), end.isoformat())})
+        if url.path == "/v2/reference/news":
+            ticker = query.get("ticker", "")
+            rng = _rng("news", ticker, dt.date.today())
+            words = ["beats", "misses", "surges", "falls", "expands", "cuts", "upgrades", "downgrades"]
+            midnight = dt.datetime.combine(dt.date.today(), dt.time(), dt.timezone.utc)
+            since = query.get("published_utc.gt", "")
+            results = []
+            for i in range(int(query.get("limit", 5))):
+                published = (midnight - dt.timedelta(hours=i)).strftime("%Y-%m-%dT%H:%M:%SZ")
+                if published <= since:
+                    break
+                results.append(
+                    {
+                        "title": f"{ticker} {rng.choice(words)} expectations in quarter {i}",
+                        "article_url": f"https://example.com/{ticker}/{i}",
+                        "publisher": {"name": "Bench Wire"},
+                        "published_utc": published,
+                    }
+                )
+            return self._send({"results": results})
+        if url.path == "/v2/snapshot/locale/us/markets/stocks/tickers":
+            items = []
+            for ticker in filter(None, query.get("tickers", "").split(",")):
+                bars = daily_bars(ticker, "2020-01-01", dt.date.today().isoformat())[-2:]
+                prev, day = bars[0], bars[-1]
+                items.append(
+                    {
+                        "ticker": ticker,
+                        "lastTrade": {"p": day["c"]},
+                        "day": {"c": day["c"]},
+                        "prevDay": {"c": prev["c"]},
+                        "todaysChange": round(day["c"] - prev["c"], 2),
+                        "todaysChangePerc": round((day["c"] / prev["c"] - 1) * 100, 2),
+                        "min": {"t": int(time.time() // 60 * 60000), "n": 50},
+                    }
+                )
+            return self._send({"status": "OK", "tickers": items})
+        if url.path.startswith("/v3/trades/"):
+            ticker = parts[2]
+            start = _ns(query["timestamp.gte"])
+            end = _ns(query.get("timestamp.lt") or query["timestamp.lte"])
+            offset = int(query.get("offset", 0))
+            limit = int(query.get("limit", PAGE_LIMIT))
+            rows = trades(ticker, start, end)
+            body = {"results": rows[offset : offset + limit]}
+            if offset + limit < len(rows):
+                query.update(offset=offset + limit, limit=limit)
+                body["next_url"] = f"{self.server.base_url}{url.path}?{urlencode(query)}"
+            return self._send(body)
+        if url.path == "/v3/reference/tickers":
+            return self._send({"results": []})
+        self.send_error(404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            return self.send_error(404)
+        prompt = request.get("messages", [{}])[-1].get("content", "")
+        if "sentiment score" in prompt:
+            content = "0.15"
+        elif "Predict the next" in prompt:
+            days = int(prompt.split("Predict the next ")[1].split()[0])
+            content = ", ".join(f"{100 + i * 0.5:.2f}" for i in range(days))
+        else:
+            content = "Recent headlines and the price trend suggest a gradual rise."
+        self._send(
+            {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "gpt-3.5-turbo"),
+                "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+                ],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }
+        )
+
+
+class FakeUpstream:
+    """Run the fake API server on a background thread."""
+
+    def __init__(self, port=0, latency_ms=0.0, fixtures=None):
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.server.latency = latency_ms / 1000
+        self.server.fixtures = fixtures
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.server.base_url = self.url
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    port = int(sys.argv[sys.argv.index("--port") + 1]) if "--port" in sys.argv else 8099
+    latency = float(sys.argv[sys.argv.index("--latency") + 1]) if "--latency" in sys.argv else 0.0
+    fixtures = sys.argv[sys.argv.index("--fixtures") + 1] if "--fixtures" in sys.argv else None
+    upstream = FakeUpstream(port, latency, fixtures)
+    print(f"Fake Polygon/OpenAI at {upstream.url} (latency {latency:.0f} ms)")
+    upstream.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Measure cold import time of the app and CLI entry points.
+
+Runs ``python -X importtime -c "import <module>"`` in a fresh interpreter for
+each module, several times, and reports the best cumulative import time plus
+the slowest top-level dependencies. Results can be saved as JSON to compare
+commits:
+
+    python benchmarks/importtime.py --json bench_importtime.json
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ["app", "simulation", "anomalies", "realtime", "symbols", "market"]
+RUNS = 5
+LINE_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(module):
+    """Return ``(total_us, {direct import: cumulative_us})`` for one run."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    total = 0
+    children = {}
+    for line in proc.stderr.splitlines():
+        m = LINE_RE.match(line)
+        if not m:
+            continue
+        cumulative, indent, name = int(m.group(2)), len(m.group(3)), m.group(4)
+        if indent == 1:
+            # children are printed before their parent; keep only the target's
+            if name == module:
+                total = cumulative
+                break
+            children = {}
+        elif indent == 3:
+            children[name] = cumulative
+    return total, children
+
+
+def main():
+    out = None
+    if "--json" in sys.argv:
+        out = sys.argv[sys.argv.index("--json") + 1]
+    results = {}
+    for module in MODULES:
+        try:
+            runs = [measure(module) for _ in range(RUNS)]
+        except RuntimeError as e:
+            print(f"{module:<12} failed: {e}")
+            continue
+        total, top = min(runs, key=lambda r: r[0])
+        slowest = sorted(top.items(), key=lambda kv: kv[1], reverse=True)[:5]
+        results[module] = {"total_ms": total / 1000, "slowest": dict(slowest)}
+        deps = ", ".join(f"{name} {us / 1000:.0f}ms" for name, us in slowest)
+        print(f"{module:<12} {total / 1000:8.1f} ms   {deps}")
+    if out:
+        with open(out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
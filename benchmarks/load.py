@@ -0,0 +1,214 @@
+"""End-to-end load test of the Flask app against the fake upstream server.
+
+Starts ``fake_upstream.FakeUpstream`` and the app (Werkzeug, threaded) in this
+process with a throwaway database and tick cache, logs in one session per
+client and fires each scenario ``--requests`` times from ``--clients`` threads.
+Reports p50/p95/p99 latency, throughput and peak RSS, and optionally saves
+them as JSON or compares with an earlier run:
+
+    python benchmarks/load.py --clients 8 --requests 200 --latency 50 --json bench_load.json
+    python benchmarks/load.py --compare bench_load.json
+"""
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_upstream import FakeUpstream  # noqa: E402
+
+TICKER = "AAPL"
+WATCHLIST = ["AAPL", "MSFT", "NVDA", "AMZN", "GOOG", "META", "TSLA", "AMD", "NFLX", "INTC"]
+# A completed weekday, so the anomaly page reads ticks from the cache after the warm-up
+ANOMALY_DATE = "2026-10-16"
+USERNAME = "bench"
+PASSWORD = "bench-password"
+SCENARIOS = [
+    ("index", "GET", "/", None),
+    ("stock_get", "GET", f"/stock/{TICKER}", None),
+    ("stock_post", "POST", f"/stock/{TICKER}", {"seed": "10000", "days": "5"}),
+    ("anomalies", "GET", f"/anomalies/{TICKER}?date={ANOMALY_DATE}", None),
+]
+
+
+def arg(name, default):
+    if name in sys.argv:
+        return type(default)(sys.argv[sys.argv.index(name) + 1])
+    return default
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(values)))
+    return values[min(rank, len(values)) - 1]
+
+
+def max_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def start_app(workdir, upstream):
+    """Import the app against ``upstream`` and serve it on a free port."""
+    os.chdir(workdir)
+    os.environ.update(
+        POLYGON_API_KEY="bench",
+        POLYGON_BASE_URL=upstream.url,
+        OPENAI_API_KEY="bench",
+        OPENAI_BASE_URL=upstream.url + "/v1",
+        TICK_CACHE_DIR=os.path.join(workdir, "tick_cache"),
+        FLASK_SECRET_KEY="bench",
+    )
+    from werkzeug.security import generate_password_hash
+    from werkzeug.serving import make_server
+
+    import db
+    from app import app
+
+    db.init_db()
+    conn = db.connect()
+    conn.execute(
+        "INSERT INTO users (username, email, password_hash, is_verified) VALUES (?, ?, ?, 1)",
+        (USERNAME, "bench@example.com", generate_password_hash(PASSWORD)),
+    )
+    conn.executemany("INSERT INTO tickers (ticker) VALUES (?)", [(t,) for t in WATCHLIST])
+    conn.commit()
+    conn.close()
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def login(base):
+    import requests
+
+    session = requests.Session()
+    resp = session.post(
+        base + "/login", data={"username": USERNAME, "password": PASSWORD}, allow_redirects=False
+    )
+    if resp.status_code != 302:
+        raise RuntimeError(f"login failed with {resp.status_code}")
+    return session
+
+
+def run_scenario(sessions, base, method, path, data, total):
+    """Send ``total`` requests spread over ``sessions``; return latencies and errors."""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def client(session, count):
+        nonlocal errors
+        for _ in range(count):
+            started = time.perf_counter()
+            try:
+                resp = session.request(method, base + path, data=data, allow_redirects=False)
+                # views report upstream failures inline with a 200
+                ok = resp.status_code == 200 and "alert-danger" not in resp.text
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                errors += not ok
+
+    per_client = [total // len(sessions) + (i < total % len(sessions)) for i in range(len(sessions))]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(len(sessions)) as pool:
+        list(pool.map(client, sessions, per_client))
+    wall = time.perf_counter() - started
+    return sorted(latencies), errors, wall
+
+
+def git_commit():
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        )
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(old, new):
+    print(f"\n{'scenario':<12} {'p50 old→new (ms)':>24} {'p95 old→new (ms)':>24} {'rps old→new':>20}")
+    for name, result in new["scenarios"].items():
+        before = old.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        print(
+            f"{name:<12} {before['p50_ms']:>10.1f} → {result['p50_ms']:<10.1f}"
+            f" {before['p95_ms']:>10.1f} → {result['p95_ms']:<10.1f}"
+            f" {before['rps']:>8.1f} → {result['rps']:<8.1f}"
+        )
+
+
+def main():
+    clients = arg("--clients", 8)
+    total = arg("--requests", 200)
+    latency = arg("--latency", 20.0)
+    out = arg("--json", "")
+    baseline = arg("--compare", "")
+    previous = None
+    if baseline:
+        with open(baseline if os.path.isabs(baseline) else os.path.join(ROOT, baseline)) as f:
+            previous = json.load(f)
+
+    upstream = FakeUpstream(latency_ms=latency).start()
+    workdir = tempfile.mkdtemp(prefix="aitrade-bench-")
+    server, base = start_app(workdir, upstream)
+    sessions = [login(base) for _ in range(clients)]
+
+    results = {}
+    print(f"{clients} clients, {total} requests per scenario, upstream latency {latency:.0f} ms")
+    print(f"{'scenario':<12} {'first':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'rps':>8} {'errors':>7} {'rss MB':>8}")
+    for name, method, path, data in SCENARIOS:
+        # the first request fills caches (history, tick download) and is reported apart
+        first, first_errors, _ = run_scenario(sessions[:1], base, method, path, data, 1)
+        latencies, errors, wall = run_scenario(sessions, base, method, path, data, total)
+        results[name] = {
+            "first_ms": first[0] * 1000,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "mean_ms": sum(latencies) / len(latencies) * 1000,
+            "rps": len(latencies) / wall,
+            "requests": len(latencies),
+            "errors": errors + first_errors,
+            "max_rss_mb": max_rss_mb(),
+        }
+        r = results[name]
+        print(
+            f"{name:<12} {r['first_ms']:8.1f} {r['p50_ms']:8.1f} {r['p95_ms']:8.1f} {r['p99_ms']:8.1f}"
+            f" {r['rps']:8.1f} {r['errors']:7d} {r['max_rss_mb']:8.1f}"
+        )
+
+    report = {
+        "commit": git_commit(),
+        "clients": clients,
+        "requests": total,
+        "upstream_latency_ms": latency,
+        "scenarios": results,
+    }
+    server.shutdown()
+    upstream.stop()
+    if out:
+        with open(os.path.join(ROOT, out) if not os.path.isabs(out) else out, "w") as f:
+            json.dump(report, f, indent=2)
+    if previous:
+        compare(previous, report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Micro-benchmarks for the forecasting, simulation and anomaly hot paths.
+
+Runs on synthetic data with no network access: OpenAI is disabled so
+``predict_prices`` takes the AR(1) path, the indicator refresh runs over a
+synthetic watchlist and the anomaly benchmarks use ticks written to a
+temporary cache. Prints the best and median time per call and
+optionally saves them as JSON:
+
+    python benchmarks/micro.py --json bench_micro.json
+"""
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+REPEAT = 7
+TICKER = "BENCH"
+BASELINE_DAYS = 20
+TRADES_PER_DAY = 400_000
+WATCHLIST_SIZE = 50
+
+
+def bench(func, number):
+    """Return ``(best, median)`` seconds per call over ``REPEAT`` rounds."""
+    rounds = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        rounds.append((time.perf_counter() - started) / number)
+    return min(rounds), statistics.median(rounds)
+
+
+def synthetic_history(days=264):
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(0)
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, days)))
+    index = pd.bdate_range(end="2026-10-16", periods=days)
+    return pd.DataFrame(
+        {"Open": closes, "High": closes * 1.01, "Low": closes * 0.99, "Close": closes, "Volume": 1e6},
+        index=index,
+    )
+
+
+def write_tick_days(anomalies, dates):
+    """Cache ``TRADES_PER_DAY`` synthetic trades for each date."""
+    import numpy as np
+
+    rng = np.random.default_rng(1)
+    for date in dates:
+        start, end = anomalies.session_bounds(date)
+        ts = np.sort(rng.integers(start.value, end.value, TRADES_PER_DAY))
+        ticks = {
+            "ts": ts.astype(np.int64),
+            "price": 100 + rng.normal(0, 0.5, TRADES_PER_DAY),
+            "size": rng.integers(1, 500, TRADES_PER_DAY).astype(np.float64),
+        }
+        path = os.path.join(anomalies.TICK_CACHE_DIR, TICKER, f"{date}.npz")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(path, **ticks)
+
+
+def main():
+    out = sys.argv[sys.argv.index("--json") + 1] if "--json" in sys.argv else None
+    workdir = tempfile.mkdtemp(prefix="aitrade-micro-")
+    os.chdir(workdir)
+    os.environ["TICK_CACHE_DIR"] = os.path.join(workdir, "tick_cache")
+    os.environ.pop("OPENAI_API_KEY", None)
+
+    import pandas as pd
+
+    import anomalies
+    import db
+    import indicators
+    from bars import save_bars
+    from market import predict_prices, run_simulation
+
+    db.init_db()
+    data = synthetic_history()
+    watchlist = [f"W{i}" for i in range(WATCHLIST_SIZE)]
+    for ticker in watchlist:
+        save_bars(ticker, "1d", data)
+    indicators.refresh_all(watchlist)
+    preds = predict_prices(data, days=30)
+    dates = pd.bdate_range(end="2026-10-16", periods=BASELINE_DAYS + 1).strftime("%Y-%m-%d")
+    write_tick_days(anomalies, dates)
+    anomalies.build_baseline(TICKER, BASELINE_DAYS, end=dates[-1])
+    target = dates[-1]
+    ticks = anomalies.load_ticks(TICKER, target)
+    anomalies.load_bins(TICKER, target)
+
+    cases = [
+        ("predict_prices", lambda: predict_prices(data, days=5), 200),
+        ("run_simulation", lambda: run_simulation(data, preds, 10000.0), 200),
+        ("indicators_compute", lambda: indicators.compute(data), 50),
+        ("indicators_refresh_all", lambda: indicators.refresh_all(watchlist), 20),
+        ("activity_bins", lambda: anomalies.activity_bins(ticks, target), 5),
+        ("detect_anomalies_1min", lambda: anomalies.detect_anomalies(TICKER, target, 3.0, "1min"), 20),
+        ("detect_anomalies_1s", lambda: anomalies.detect_anomalies(TICKER, target, 3.0, "1s"), 5),
+    ]
+    results = {}
+    for name, func, number in cases:
+        best, median = bench(func, number)
+        results[name] = {"best_ms": best * 1000, "median_ms": median * 1000}
+        print(f"{name:<24} best {best * 1000:9.3f} ms   median {median * 1000:9.3f} ms")
+    if out:
+        with open(out if os.path.isabs(out) else os.path.join(ROOT, out), "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
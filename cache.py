@@ -0,0 +1,501 @@
+"""Cache shared by every process: web workers, job workers, the bot and CLIs.
+
+``get_cache()`` returns the backend selected by ``CACHE_BACKEND``:
+
+* ``sqlite`` (default) keeps entries in the SQLite file ``CACHE_PATH``. Writes
+  are atomic transactions, and the least recently used entries are evicted
+  once the total exceeds ``CACHE_MAX_BYTES``.
+* ``redis`` talks to ``REDIS_URL`` with the ``redis`` package. Any server
+  that speaks the Redis protocol will do.
+
+Values are stored without pickle. JSON types are stored as JSON. NumPy
+arrays, dicts of arrays and numeric DataFrames are stored as a small JSON
+header followed by the raw column buffers, so decoding is a handful of
+``np.frombuffer`` calls. NumPy and pandas are imported only to decode such
+entries.
+
+``get_or_compute`` is single-flight. Only one process computes a missing key
+while the others wait for its result.
+
+    python cache.py stats
+    python cache.py clear
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import uuid
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite")
+CACHE_PATH = os.getenv("CACHE_PATH", "cache.db")
+# Evict least recently used entries beyond this many bytes of values
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# A computing process holding a key longer than this is presumed dead
+LOCK_TIMEOUT = 60.0
+LOCK_POLL_SECONDS = 0.05
+# Reads refresh an entry's LRU position at most this often
+TOUCH_SECONDS = 60
+# Sets between checks of the total cache size
+EVICT_EVERY = 50
+
+_MISSING = object()
+_HEADER = struct.Struct("<I")
+
+
+def _buffers_header(arrays):
+    """Return ``(specs, payload)`` for contiguous copies of ``arrays``."""
+    import numpy as np
+
+    specs, parts, offset = [], [], 0
+    for a in arrays:
+        a = np.ascontiguousarray(a)
+        if a.dtype.hasobject:
+            raise TypeError("object arrays cannot be cached")
+        specs.append({"dtype": a.dtype.str, "shape": a.shape, "offset": offset})
+        parts.append(a.tobytes())
+        offset += a.nbytes
+    return specs, b"".join(parts)
+
+
+def _array(spec, payload, start):
+    import numpy as np
+
+    dtype = np.dtype(spec["dtype"])
+    count = int(np.prod(spec["shape"], dtype=np.int64))
+    out = np.frombuffer(payload, dtype, count, start + spec["offset"])
+    # frombuffer views are read-only; callers may modify what they get
+    return out.reshape(spec["shape"]).copy()
+
+
+def _pack(tag, header, payload=b""):
+    head = json.dumps(header).encode()
+    return tag + _HEADER.pack(len(head)) + head + payload
+
+
+def encode(value):
+    """Serialize ``value`` to bytes without pickle."""
+    if isinstance(value, bytes):
+        return b"B" + value
+    # arrays and frames can only exist once their library is loaded
+    np = sys.modules.get("numpy")
+    pd = sys.modules.get("pandas")
+    if np is not None and isinstance(value, np.ndarray):
+        specs, payload = _buffers_header([value])
+        return _pack(b"N", specs[0], payload)
+    if (
+        np is not None
+        and isinstance(value, dict)
+        and value
+        and all(isinstance(v, np.ndarray) for v in value.values())
+    ):
+        specs, payload = _buffers_header(list(value.values()))
+        return _pack(b"A", {"names": list(value), "specs": specs}, payload)
+    if pd is not None and isinstance(value, pd.DataFrame):
+        index = value.index
+        header = {"columns": [], "index": {"name": index.name}}
+        arrays = []
+        if isinstance(index, pd.DatetimeIndex):
+            header["index"].update(unit=index.unit, tz=str(index.tz) if index.tz else None)
+            arrays.append(index.asi8)
+        elif index.dtype.kind in "biuf":
+            arrays.append(index.to_numpy())
+        else:
+            header["index"]["values"] = index.tolist()
+        for name in value.columns:
+            column = value[name]
+            if column.dtype.kind in "biufcmM":
+                header["columns"].append({"name": name})
+                arrays.append(column.to_numpy())
+            else:
+                # strings and mixed columns travel in the JSON header
+                header["columns"].append({"name": name, "values": column.tolist()})
+        specs, payload = _buffers_header(arrays)
+        header["specs"] = specs
+        return _pack(b"F", header, payload)
+    return b"J" + json.dumps(value).encode()
+
+
+def decode(data):
+    """Inverse of ``encode``."""
+    tag, body = data[:1], data[1:]
+    if tag == b"B":
+        return bytes(body)
+    if tag == b"J":
+        return json.loads(body)
+    (size,) = _HEADER.unpack_from(body)
+    header = json.loads(body[_HEADER.size : _HEADER.size + size])
+    start = _HEADER.size + size
+    if tag == b"N":
+        return _array(header, body, start)
+    if tag == b"A":
+        return {n: _array(s, body, start) for n, s in zip(header["names"], header["specs"])}
+    if tag == b"F":
+        import pandas as pd
+
+        specs = iter(header["specs"])
+        info = header["index"]
+        if "values" in info:
+            index = pd.Index(info["values"], name=info["name"])
+        elif "unit" in info:
+            raw = _array(next(specs), body, start)
+            index = pd.DatetimeIndex(raw.view(f"M8[{info['unit']}]"), name=info["name"])
+            if info["tz"]:
+                index = index.tz_localize("UTC").tz_convert(info["tz"])
+        else:
+            index = pd.Index(_array(next(specs), body, start), name=info["name"])
+        columns = {
+            c["name"]: c["values"] if "values" in c else _array(next(specs), body, start)
+            for c in header["columns"]
+        }
+        return pd.DataFrame(columns, index=index)
+    raise ValueError(f"Unknown cache entry type: {tag!r}")
+
+
+def make_key(prefix, *parts):
+    """Return ``prefix:`` plus a hash of ``parts`` for arbitrarily long inputs."""
+    digest = hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()
+    return f"{prefix}:{digest}"
+
+
+class DiskCache:
+    """Cache entries in a SQLite file shared by every process on the host."""
+
+    name = "sqlite"
+
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.owner = uuid.uuid4().hex
+        self._local = threading.local()
+        self._sets = 0
+        os.register_at_fork(after_in_child=self._after_fork)
+        self._init()
+
+    def _after_fork(self):
+        self._local = threading.local()
+        self.owner = uuid.uuid4().hex
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init(self):
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, size INTEGER, "
+            "expires_at REAL, accessed_at REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_lru_idx ON cache(accessed_at)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_locks (key TEXT PRIMARY KEY, owner TEXT, expires_at REAL)"
+        )
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        now = time.time()
+        conn = self._conn()
+        rows = conn.execute(
+            f"SELECT key, value, accessed_at FROM cache WHERE key IN ({','.join('?' * len(keys))}) "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (*keys, now),
+        ).fetchall()
+        stale = [key for key, _, accessed in rows if accessed < now - TOUCH_SECONDS]
+        if stale:
+            conn.execute(
+                f"UPDATE cache SET accessed_at = ? WHERE key IN ({','.join('?' * len(stale))})",
+                (now, *stale),
+            )
+        return {key: decode(value) for key, value, _ in rows}
+
+    def set_many(self, mapping, ttl=None):
+        now = time.time()
+        expires = now + ttl if ttl else None
+        rows = []
+        for key, value in mapping.items():
+            data = encode(value)
+            rows.append((key, data, len(data), expires, now))
+        conn = self._conn()
+        conn.executemany(
+            "INSERT OR REPLACE INTO cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+        self._sets += 1
+        if self._sets % EVICT_EVERY == 0:
+            self.evict()
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones beyond ``max_bytes``."""
+        conn = self._conn()
+        conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        conn.execute(
+            "DELETE FROM cache WHERE key IN (SELECT key FROM ("
+            "  SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC) AS kept FROM cache"
+            ") WHERE kept > ?)",
+            (self.max_bytes,),
+        )
+
+    def acquire(self, key, timeout=LOCK_TIMEOUT):
+        now = time.time()
+        cur = self._conn().execute(
+            "INSERT INTO cache_locks (key, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE cache_locks.expires_at <= ?",
+            (key, self.owner, now + timeout, now),
+        )
+        return cur.rowcount == 1
+
+    def release(self, key):
+        self._conn().execute(
+            "DELETE FROM cache_locks WHERE key = ? AND owner = ?", (key, self.owner)
+        )
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM cache")
+        conn.execute("DELETE FROM cache_locks")
+
+    def stats(self):
+        entries, size = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache"
+        ).fetchone()
+        return {"backend": self.name, "entries": entries, "bytes": size, "max_bytes": self.max_bytes}
+
+
+class RedisCache:
+    """Cache entries in Redis, or any server speaking its protocol."""
+
+    name = "redis"
+
+    def __init__(self, url=REDIS_URL):
+        try:
+            import redis
+        except ImportError:
+            raise ValueError("CACHE_BACKEND=redis needs: pip install redis")
+        self.client = redis.Redis.from_url(url)
+        self.owner = uuid.uuid4().hex
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self.owner = uuid.uuid4().hex
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        values = self.client.mget(keys)
+        return {k: decode(v) for k, v in zip(keys, values) if v is not None}
+
+    def set_many(self, mapping, ttl=None):
+        pipe = self.client.pipeline()
+        for key, value in mapping.items():
+            pipe.set(key, encode(value), px=int(ttl * 1000) if ttl else None)
+        pipe.execute()
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def evict(self):
+        # the server evicts by its own maxmemory-policy
+        pass
+
+    def acquire(self, key, timeout=LOCK_TIMEOUT):
+        return bool(self.client.set(f"lock:{key}", self.owner, nx=True, px=int(timeout * 1000)))
+
+    def release(self, key):
+        lock = f"lock:{key}"
+        if self.client.get(lock) == self.owner.encode():
+            self.client.delete(lock)
+
+    def clear(self):
+        self.client.flushdb()
+
+    def stats(self):
+        info = self.client.info("memory")
+        return {
+            "backend": self.name,
+            "entries": self.client.dbsize(),
+            "bytes": info.get("used_memory"),
+            "max_bytes": info.get("maxmemory"),
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the shared cache backend selected by ``CACHE_BACKEND``."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            if CACHE_BACKEND == "sqlite":
+                _cache = DiskCache()
+            elif CACHE_BACKEND == "redis":
+                _cache = RedisCache()
+            else:
+                raise ValueError(f"Unknown cache backend: {CACHE_BACKEND}")
+        return _cache
+
+
+def get(key, default=None):
+    return get_cache().get_many([key]).get(key, default)
+
+
+def set(key, value, ttl=None):
+    get_cache().set_many({key: value}, ttl)
+
+
+def get_many(keys):
+    return get_cache().get_many(list(keys))
+
+
+def set_many(mapping, ttl=None):
+    if mapping:
+        get_cache().set_many(mapping, ttl)
+
+
+def delete(key):
+    get_cache().delete(key)
+
+
+class _Flight:
+    """One key being computed in this process, shared by the threads asking for it."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = 0
+        self.done = False
+        self.value = None
+        self.error = None
+
+
+def _wait_for(cache, key, timeout):
+    """Poll until ``key`` is cached or this process holds its backend lock.
+
+    Returns the cached value, ``None`` when another process released the
+    lock without storing anything, or ``_MISSING`` when the caller should
+    compute the value itself.
+    """
+    deadline = time.monotonic() + timeout
+    waited = False
+    while True:
+        value = cache.get_many([key]).get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if cache.acquire(key, timeout):
+            if not waited:
+                return _MISSING
+            # the holder may have stored its value just before releasing
+            value = cache.get_many([key]).get(key, _MISSING)
+            if value is _MISSING and time.monotonic() < deadline:
+                # it finished without a value; asking again would repeat its failure
+                cache.release(key)
+                return None
+            return value
+        if time.monotonic() >= deadline:
+            return _MISSING
+        waited = True
+        time.sleep(LOCK_POLL_SECONDS)
+
+
+def _release(cache, key):
+    try:
+        cache.release(key)
+    except Exception:
+        # the lock expires on its own after ``timeout``
+        pass
+
+
+def get_or_compute(key, func, ttl=None, timeout=LOCK_TIMEOUT):
+    """Return the cached value of ``key``, computing it with ``func`` once.
+
+    Threads of one process queue on an in-process lock per key and share the
+    first one's result, including ``None`` or the exception it raised.
+    Across processes, the first to take the backend lock computes the value
+    while the others poll for it. If it finishes without storing a value the
+    others return ``None``, and if it holds the lock past ``timeout`` seconds
+    they compute the value themselves. ``None`` results are not cached.
+
+    A failing backend (an unwritable file, Redis down) counts as a miss, so
+    callers still get ``func()``.
+    """
+    try:
+        cache = get_cache()
+        value = cache.get_many([key]).get(key, _MISSING)
+    except Exception:
+        return func()
+    if value is not _MISSING:
+        return value
+    with _flights_lock:
+        flight = _flights.get(key)
+        if flight is None:
+            flight = _flights[key] = _Flight()
+        flight.users += 1
+    try:
+        with flight.lock:
+            if flight.done:
+                if flight.error is not None:
+                    raise flight.error
+                return flight.value
+            try:
+                value = _wait_for(cache, key, timeout)
+            except Exception:
+                value = _MISSING
+            if value is not _MISSING:
+                flight.done, flight.value = True, value
+                return value
+            try:
+                value = func()
+            except Exception as e:
+                _release(cache, key)
+                flight.done, flight.error = True, e
+                raise
+            flight.done, flight.value = True, value
+            try:
+                if value is not None:
+                    cache.set_many({key: value}, ttl)
+            except Exception:
+                # the computed value is good even if the backend cannot keep it
+                pass
+            _release(cache, key)
+            return value
+    finally:
+        with _flights_lock:
+            flight.users -= 1
+            if not flight.users:
+                del _flights[key]
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    cache = get_cache()
+    if command == "clear":
+        cache.clear()
+        print("Cache cleared")
+    elif command == "evict":
+        cache.evict()
+        print(cache.stats())
+    else:
+        print(cache.stats())
+
+
+if __name__ == "__main__":
+    main()
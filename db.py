@@ -1,20 +1,244 @@
+import os
 import sqlite3
+import sys
+import threading
 
 DB_PATH = 'stocks.db'
+# How long a writer waits for a competing lock before "database is locked"
+BUSY_TIMEOUT_MS = 5000
+# Prepared statements kept per connection
+CACHED_STATEMENTS = 256
 
+_local = threading.local()
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
+
+def _reset_after_fork():
+    # a forked worker must never reuse the parent's connections
+    global _local
+    _local = threading.local()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def connect():
+    """Open a new connection with the journal and locking pragmas applied."""
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=CACHED_STATEMENTS,
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+    return conn
+
+
+def get_db():
+    """Return the connection for the current request or thread.
+
+    Inside a Flask app context the connection lives on ``g`` and is closed by
+    ``close_db`` at teardown. Elsewhere (CLIs, worker threads) each thread
+    keeps one connection for its lifetime. Callers must not close it.
+    """
+    # CLIs never import Flask, so only consult it when it is already loaded
+    flask = sys.modules.get('flask')
+    if flask is not None and flask.has_app_context():
+        if 'db' not in flask.g:
+            flask.g.db = connect()
+        return flask.g.db
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = _local.conn = connect()
     return conn
 
 
+def close_db(e=None):
+    from flask import g
+
+    conn = g.pop('db', None)
+    if conn is not None:
+        conn.close()
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
+
+
 def init_db():
-    conn = get_db()
+    conn = connect()
     conn.execute(
         'CREATE TABLE IF NOT EXISTS tickers (id INTEGER PRIMARY KEY AUTOINCREMENT, ticker TEXT UNIQUE)'
     )
 
+    # per-ticker minute-of-day trade count baselines for anomaly detection
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS anomaly_baselines (ticker TEXT PRIMARY KEY, dates TEXT, mean BLOB, m2 BLOB)'
+    )
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS anomaly_days (ticker TEXT, date TEXT, counts BLOB, PRIMARY KEY (ticker, date))'
+    )
+
+    # ranked results of watchlist-wide anomaly scans
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS anomaly_scans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT,
+            ticker TEXT,
+            time TEXT,
+            count INTEGER,
+            expected REAL,
+            zscore REAL
+        )
+        '''
+    )
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS anomaly_scans_date_idx ON anomaly_scans(date, zscore)'
+    )
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS anomaly_scan_tickers (date TEXT, ticker TEXT, seconds REAL, anomalies INTEGER, error TEXT, PRIMARY KEY (date, ticker))'
+    )
+
+    # bar store: time bars from Polygon plus tick-derived volume/dollar/tick bars
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS bars (
+            ticker TEXT,
+            kind TEXT,
+            ts INTEGER,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL,
+            volume REAL,
+            vwap REAL,
+            trades INTEGER,
+            PRIMARY KEY (ticker, kind, ts)
+        )
+        '''
+    )
+
+    # technical indicators per stored bar, plus the running state that extends them
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS indicators (
+            ticker TEXT,
+            kind TEXT,
+            ts INTEGER,
+            sma REAL,
+            ema_fast REAL,
+            ema_slow REAL,
+            rsi REAL,
+            macd REAL,
+            macd_signal REAL,
+            macd_hist REAL,
+            bb_upper REAL,
+            bb_lower REAL,
+            atr REAL,
+            vwap REAL,
+            PRIMARY KEY (ticker, kind, ts)
+        )
+        '''
+    )
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS indicator_state (ticker TEXT, kind TEXT, state TEXT, prev TEXT, PRIMARY KEY (ticker, kind))'
+    )
+    # tick-derived bars were once keyed by millisecond; they now keep nanoseconds
+    tick_kinds = "('volume', 'dollar', 'tick')"
+    migrated = conn.execute(
+        f"UPDATE bars SET ts = ts * 1000000 WHERE kind IN {tick_kinds} AND ts < 100000000000000"
+    ).rowcount
+    if migrated:
+        conn.execute(f"DELETE FROM indicators WHERE kind IN {tick_kinds}")
+        conn.execute(f"DELETE FROM indicator_state WHERE kind IN {tick_kinds}")
+
+    # reference symbol universe with a substring index over ticker and name
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS symbols (ticker TEXT PRIMARY KEY, name TEXT, market TEXT, type TEXT, exchange TEXT, active INTEGER DEFAULT 1)'
+    )
+    try:
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS symbols_fts USING fts5(ticker, name, tokenize='trigram')"
+        )
+    except sqlite3.OperationalError:
+        # SQLite older than 3.34 has no trigram tokenizer
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS symbols_fts USING fts5(ticker, name, prefix='2 3')"
+        )
+
+    # ingested news: one row per article, linked to each ticker it was found for
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS news (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            url_hash TEXT UNIQUE,
+            title_hash TEXT UNIQUE,
+            url TEXT,
+            title TEXT,
+            publisher TEXT,
+            published_at INTEGER,
+            fetched_at REAL
+        )
+        '''
+    )
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS news_tickers (ticker TEXT, news_id INTEGER, published_at INTEGER, PRIMARY KEY (ticker, news_id))'
+    )
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS news_tickers_time_idx ON news_tickers(ticker, published_at)'
+    )
+    conn.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS news_fts USING fts5(title, publisher)"
+    )
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS news_polls (ticker TEXT PRIMARY KEY, polled_at REAL, added INTEGER, error TEXT)'
+    )
+
+    # background job queue; at most one queued job per kind and ticker
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT,
+            ticker TEXT,
+            priority INTEGER DEFAULT 0,
+            status TEXT DEFAULT 'queued',
+            run_after REAL,
+            attempts INTEGER DEFAULT 0,
+            error TEXT,
+            created_at REAL,
+            started_at REAL,
+            finished_at REAL
+        )
+        '''
+    )
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS jobs_queued_idx ON jobs(kind, ticker) WHERE status = 'queued'"
+    )
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS jobs_next_idx ON jobs(status, priority DESC, id)'
+    )
+
+    # forecasts, sentiment and explanations computed ahead of page views
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS precomputed (
+            ticker TEXT PRIMARY KEY,
+            computed_at REAL,
+            news TEXT,
+            news_hash TEXT,
+            sentiment REAL,
+            predictions TEXT,
+            reason TEXT,
+            period TEXT,
+            interval TEXT,
+            days INTEGER
+        )
+        '''
+    )
+
     # check if the users table exists
     table = conn.execute(
         "SELECT name FROM sqlite_master WHERE type='table' AND name='users'"
@@ -1,40 +1,425 @@
+import asyncio
+import datetime as dt
 import os
-import requests
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import aiohttp
 import discord
 from discord import app_commands
+from discord.ext import tasks
+
+import cache
+from polygon_api import POLYGON_API_KEY, POLYGON_BASE_URL, POLYGON_MAX_CONCURRENCY
 
 TOKEN = os.getenv("DISCORD_TOKEN")
-POLYGON_API_KEY = os.getenv("POLYGON_API_KEY")
+# Seconds a previous-close lookup is reused before asking Polygon again
+PREV_CLOSE_TTL = int(os.getenv("PREV_CLOSE_TTL", "60"))
+# Seconds to wait for Polygon before giving up on a lookup
+POLYGON_TIMEOUT = 10
+# Threads running heavy commands; /stock never waits on them
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "4"))
+# Channel receiving watchlist alerts; the scheduler is off when unset
+ALERT_CHANNEL_ID = int(os.getenv("ALERT_CHANNEL_ID", "0"))
+# Seconds between watchlist scans
+ALERT_INTERVAL = int(os.getenv("ALERT_INTERVAL", "180"))
+# Daily move, in percent, reported each time another step is crossed
+ALERT_MOVE_PCT = float(os.getenv("ALERT_MOVE_PCT", "5"))
+# Minute-bar trade count z-score reported as an activity spike
+ALERT_THRESHOLD = float(os.getenv("ALERT_THRESHOLD", "4"))
+# Scans observed per ticker before spikes can be reported
+ALERT_WARMUP = int(os.getenv("ALERT_WARMUP", "10"))
+NS_PER_MS = 1_000_000
+NS_PER_MINUTE = 60_000_000_000
+
+
+class JobStats:
+    """Queue depth and latency per command, updated from worker threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.commands = {}
+
+    def submitted(self):
+        with self.lock:
+            self.queued += 1
+
+    def started(self, name, waited):
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+            entry = self.commands.setdefault(
+                name, {"count": 0, "errors": 0, "wait": 0.0, "run": 0.0, "max_run": 0.0}
+            )
+            entry["wait"] += waited
+
+    def finished(self, name, elapsed, failed):
+        with self.lock:
+            self.running -= 1
+            entry = self.commands[name]
+            entry["count"] += 1
+            entry["errors"] += failed
+            entry["run"] += elapsed
+            entry["max_run"] = max(entry["max_run"], elapsed)
+
+    def summary(self):
+        with self.lock:
+            lines = [f"대기 {self.queued}, 실행 중 {self.running} (작업자 {BOT_WORKERS})"]
+            for name, entry in sorted(self.commands.items()):
+                n = entry["count"] or 1
+                lines.append(
+                    f"/{name}: {entry['count']}회, 오류 {entry['errors']}, "
+                    f"평균 대기 {entry['wait'] / n:.2f}s, 평균 실행 {entry['run'] / n:.2f}s, "
+                    f"최대 {entry['max_run']:.2f}s"
+                )
+        return "\n".join(lines)
+
+
+class WatchlistScanner:
+    """Turn periodic watchlist snapshots into price-move and activity alerts.
+
+    One scan costs one snapshot request per ``SNAPSHOT_BATCH`` tickers, so a
+    500-ticker watchlist needs two requests. Only state from earlier scans is
+    kept: the last minute bar seen and the move step already reported per
+    ticker. Each new minute bar's trade count is fed to an ``OnlineDetector``
+    clocked by the number of bars observed for that ticker. Scans that bring
+    no new bar, and the time between polls, are therefore not mistaken for
+    quiet minutes.
+    """
+
+    def __init__(self):
+        from realtime import OnlineDetector
+
+        self.detector = OnlineDetector(ALERT_THRESHOLD, ALERT_WARMUP, on_alert=lambda alert: None)
+        self.last_bar = {}
+        self.move_steps = {}
+        self.bars_seen = {}
+
+    def watchlist(self):
+        from db import get_db
+
+        return [row["ticker"] for row in get_db().execute("SELECT ticker FROM tickers")]
+
+    def scan(self):
+        """Fetch snapshots for the watchlist and return alert messages."""
+        from market import fetch_snapshots
+
+        tickers = self.watchlist()
+        if not tickers:
+            return []
+        today = dt.datetime.now(dt.timezone.utc).strftime("%Y-%m-%d")
+        messages = []
+        for ticker, snap in fetch_snapshots(tickers).items():
+            pct = snap.get("change_pct")
+            if pct is not None and ALERT_MOVE_PCT > 0:
+                step = int(abs(pct) // ALERT_MOVE_PCT)
+                day, seen = self.move_steps.get(ticker, (today, 0))
+                if day != today:
+                    seen = 0
+                if step > seen:
+                    icon, arrow = ("📈", "상승") if pct > 0 else ("📉", "하락")
+                    messages.append(f"{icon} {ticker} {arrow} {pct:+.2f}% (현재가 {snap['price']})")
+                self.move_steps[ticker] = (today, max(step, seen))
+
+            minute = snap.get("minute") or {}
+            bar_ts = minute.get("t")
+            if not bar_ts or bar_ts <= self.last_bar.get(ticker, 0):
+                continue
+            self.last_bar[ticker] = bar_ts
+            # consecutive observed bars are consecutive detector minutes
+            seen = self.bars_seen[ticker] = self.bars_seen.get(ticker, 0) + 1
+            alert = self.detector.observe(ticker, seen * NS_PER_MINUTE, minute.get("n") or 0)
+            if alert:
+                at = dt.datetime.fromtimestamp(bar_ts * NS_PER_MS / 1e9, dt.timezone.utc)
+                messages.append(
+                    f"⚡ {ticker} {at:%H:%M}Z 거래 {alert['count']}건 "
+                    f"(평균 {alert['mean']:.1f}, z={alert['zscore']:.1f})"
+                )
+        return messages
+
 
 class StockBot(discord.Client):
     def __init__(self):
         intents = discord.Intents.default()
         super().__init__(intents=intents)
         self.tree = app_commands.CommandTree(self)
+        self.http_session = None
+        self.polygon_slots = asyncio.Semaphore(POLYGON_MAX_CONCURRENCY)
+        self.prev_close_cache = {}
+        self.prev_close_pending = {}
+        self.pool = ThreadPoolExecutor(BOT_WORKERS, thread_name_prefix="bot-job")
+        self.job_stats = JobStats()
+        self.scanner = WatchlistScanner()
 
     async def setup_hook(self):
+        self.http_session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=POLYGON_TIMEOUT)
+        )
         await self.tree.sync()
+        if ALERT_CHANNEL_ID:
+            self.watch_watchlist.start()
+
+    @tasks.loop(seconds=ALERT_INTERVAL)
+    async def watch_watchlist(self):
+        try:
+            messages = await self.run_job("watchlist", self.scanner.scan)
+        except Exception as e:
+            print(f"Watchlist scan failed: {e}")
+            return
+        if not messages:
+            return
+        channel = self.get_channel(ALERT_CHANNEL_ID) or await self.fetch_channel(ALERT_CHANNEL_ID)
+        chunk = ""
+        for line in messages:
+            if len(chunk) + len(line) + 1 > 2000:
+                await channel.send(chunk)
+                chunk = ""
+            chunk += line + "\n"
+        await channel.send(chunk)
+
+    @watch_watchlist.before_loop
+    async def before_watch_watchlist(self):
+        await self.wait_until_ready()
+
+    async def close(self):
+        if self.watch_watchlist.is_running():
+            self.watch_watchlist.cancel()
+        if self.http_session is not None:
+            await self.http_session.close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        await super().close()
+
+    async def run_job(self, name, func, *args):
+        """Run a blocking ``func`` on the worker pool and await its result."""
+        stats = self.job_stats
+        queued_at = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            stats.started(name, started - queued_at)
+            failed = True
+            try:
+                result = func(*args)
+                failed = False
+                return result
+            finally:
+                stats.finished(name, time.perf_counter() - started, failed)
+
+        stats.submitted()
+        return await asyncio.get_running_loop().run_in_executor(self.pool, job)
+
+    async def polygon_json(self, path, params=None):
+        """GET a Polygon path without blocking the event loop."""
+        if not POLYGON_API_KEY:
+            raise ValueError("POLYGON_API_KEY not set")
+        params = dict(params or {})
+        params["apiKey"] = POLYGON_API_KEY
+        async with self.polygon_slots:
+            async with self.http_session.get(POLYGON_BASE_URL + path, params=params) as resp:
+                return await resp.json()
+
+    def cached_prev_close(self, ticker):
+        entry = self.prev_close_cache.get(ticker)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    async def prev_close(self, ticker):
+        """Return the previous close for ``ticker`` or ``None`` if unknown.
+
+        Results are cached in memory and in the shared cache for
+        ``PREV_CLOSE_TTL`` seconds, and concurrent lookups of the same ticker
+        share a single Polygon request.
+        """
+        close = self.cached_prev_close(ticker)
+        if close is not None:
+            return close
+        task = self.prev_close_pending.get(ticker)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_prev_close(ticker))
+            self.prev_close_pending[ticker] = task
+            task.add_done_callback(lambda _: self.prev_close_pending.pop(ticker, None))
+        # shield so one cancelled caller does not cancel the shared request
+        return await asyncio.shield(task)
+
+    async def _fetch_prev_close(self, ticker):
+        loop = asyncio.get_running_loop()
+        # the shared cache is blocking SQLite or Redis, so keep it off the loop
+        close = await loop.run_in_executor(self.pool, shared_prev_close, ticker)
+        if close is None:
+            data = await self.polygon_json(
+                f"/v2/aggs/ticker/{ticker}/prev", {"adjusted": "true"}
+            )
+            result = (data.get("results") or [{}])[0]
+            close = result.get("c")
+            if close is not None:
+                loop.run_in_executor(self.pool, store_prev_close, ticker, close)
+        if close is not None:
+            self.prev_close_cache[ticker] = (time.monotonic() + PREV_CLOSE_TTL, close)
+        return close
+
+
+def shared_prev_close(ticker):
+    """Return a previous close another process stored, or ``None``."""
+    try:
+        return cache.get(f"prev_close:{ticker}")
+    except Exception:
+        return None
+
+
+def store_prev_close(ticker, close):
+    try:
+        cache.set(f"prev_close:{ticker}", close, PREV_CLOSE_TTL)
+    except Exception:
+        pass
+
+
+def predict_report(ticker, days):
+    from indicators import indicators_for
+    from market import analyze_sentiment, fetch_news, fetch_stock_history, predict_prices
+
+    data = fetch_stock_history(ticker, period="6mo")
+    if data.empty or "Close" not in data:
+        return f"가격을 찾을 수 없습니다: {ticker}"
+    sentiment = analyze_sentiment(fetch_news(ticker))
+    ind = indicators_for(ticker, "1d", data)
+    preds = predict_prices(data, days=days, sentiment=sentiment, indicators=ind)
+    if not preds:
+        return f"예측할 수 없습니다: {ticker}"
+    last_close = float(data["Close"].iloc[-1])
+    lines = [f"{ticker} 종가 {last_close:.2f}, {days}일 예측:"]
+    lines += [f"{i}일 후: {p:.2f}" for i, p in enumerate(preds, start=1)]
+    return "\n".join(lines)
+
+
+def sentiment_report(ticker):
+    from market import analyze_sentiment, fetch_news, sentiment_to_label
+
+    news = fetch_news(ticker)
+    if not news:
+        return f"뉴스를 찾을 수 없습니다: {ticker}"
+    score = analyze_sentiment(news)
+    lines = [f"{ticker} 뉴스 감성: {sentiment_to_label(score)} ({score:.2f})"]
+    lines += [f"- {n['title']}" for n in news[:5]]
+    return "\n".join(lines)
+
+
+def simulate_report(ticker, balance, days):
+    from indicators import indicators_for
+    from market import (
+        analyze_sentiment,
+        fetch_news,
+        fetch_stock_history,
+        predict_prices,
+        run_simulation,
+    )
+
+    data = fetch_stock_history(ticker, period="6mo")
+    if data.empty or "Close" not in data:
+        return f"가격을 찾을 수 없습니다: {ticker}"
+    sentiment = analyze_sentiment(fetch_news(ticker))
+    ind = indicators_for(ticker, "1d", data)
+    preds = predict_prices(data, days=days, sentiment=sentiment, indicators=ind)
+    results, trades, note = run_simulation(data, preds, balance, indicators=ind)
+    if not results:
+        return f"시뮬레이션할 수 없습니다: {ticker}"
+    final = trades[-1]["value"] if trades else results[-1]["value"]
+    lines = [f"{ticker} 시뮬레이션: ${balance:,.2f} → ${final:,.2f}"]
+    lines += [
+        f"{t['date']} {t['action']} {t['shares']:.2f}주 @ {t['price']:.2f}" for t in trades
+    ]
+    if note:
+        lines.append(note)
+    return "\n".join(lines)
+
+
+def anomalies_report(ticker, date, threshold):
+    from anomalies import detect_anomalies
+
+    df, mean, std = detect_anomalies(ticker, date, threshold)
+    if df.empty:
+        return f"{ticker} {date}: 이상 거래가 없습니다 (평균 {mean:.2f}, 표준편차 {std:.2f})"
+    top = df.sort_values("zscore", ascending=False).head(10)
+    lines = [f"{ticker} {date}: 이상 거래 {len(df)}건 (상위 {len(top)}건)"]
+    lines += [
+        f"{idx.strftime('%H:%M')} 거래 {int(row['count'])}건, 예상 {row['expected']:.1f}, z={row['zscore']:.1f}"
+        for idx, row in top.iterrows()
+    ]
+    return "\n".join(lines)
+
 
 bot = StockBot()
 
+
+async def deferred(interaction, name, func, *args):
+    """Acknowledge ``interaction`` now and post ``func``'s report when done."""
+    await interaction.response.defer(thinking=True)
+    try:
+        message = await bot.run_job(name, func, *args)
+    except Exception as e:
+        message = f"오류 발생: {e}"
+    # Discord rejects messages longer than 2000 characters
+    await interaction.followup.send(message[:2000])
+
+
 @bot.tree.command(name="stock", description="Get latest closing price for a ticker")
 @app_commands.describe(ticker="Ticker symbol (e.g. AAPL)")
 async def stock(interaction: discord.Interaction, ticker: str):
     ticker = ticker.upper()
-    url = f"https://api.polygon.io/v2/aggs/ticker/{ticker}/prev"
-    params = {"adjusted": "true", "apiKey": POLYGON_API_KEY}
+    close = bot.cached_prev_close(ticker)
+    if close is not None:
+        await interaction.response.send_message(f"{ticker} 종가: {close}")
+        return
+    # Polygon may take longer than Discord's 3 second reply window
+    await interaction.response.defer()
     try:
-        resp = requests.get(url, params=params, timeout=10)
-        data = resp.json()
-        result = data.get("results", [{}])[0]
-        close = result.get("c")
+        close = await bot.prev_close(ticker)
         if close is None:
-            await interaction.response.send_message(f"가격을 찾을 수 없습니다: {ticker}", ephemeral=True)
-            return
-        message = f"{ticker} 종가: {close}"
+            message = f"가격을 찾을 수 없습니다: {ticker}"
+        else:
+            message = f"{ticker} 종가: {close}"
     except Exception as e:
         message = f"오류 발생: {e}"
-    await interaction.response.send_message(message)
+    await interaction.followup.send(message)
+
+
+
+@bot.tree.command(name="predict", description="Predict closing prices for the next days")
+@app_commands.describe(ticker="Ticker symbol (e.g. AAPL)", days="Days to predict")
+async def predict(interaction: discord.Interaction, ticker: str, days: app_commands.Range[int, 1, 30] = 5):
+    await deferred(interaction, "predict", predict_report, ticker.upper(), days)
+
+
+@bot.tree.command(name="sentiment", description="Score recent news sentiment for a ticker")
+@app_commands.describe(ticker="Ticker symbol (e.g. AAPL)")
+async def sentiment(interaction: discord.Interaction, ticker: str):
+    await deferred(interaction, "sentiment", sentiment_report, ticker.upper())
+
+
+@bot.tree.command(name="simulate", description="Simulate trading on predicted prices")
+@app_commands.describe(ticker="Ticker symbol (e.g. AAPL)", balance="Starting cash", days="Days to simulate")
+async def simulate(
+    interaction: discord.Interaction,
+    ticker: str,
+    balance: app_commands.Range[float, 1] = 10000.0,
+    days: app_commands.Range[int, 1, 30] = 5,
+):
+    await deferred(interaction, "simulate", simulate_report, ticker.upper(), balance, days)
+
+
+@bot.tree.command(name="anomalies", description="Find unusual trading activity on a day")
+@app_commands.describe(ticker="Ticker symbol (e.g. AAPL)", date="YYYY-MM-DD (default today)", threshold="Z-score threshold")
+async def anomalies(interaction: discord.Interaction, ticker: str, date: str = None, threshold: float = 3.0):
+    date = date or dt.datetime.now(dt.timezone.utc).strftime("%Y-%m-%d")
+    await deferred(interaction, "anomalies", anomalies_report, ticker.upper(), date, threshold)
+
+
+@bot.tree.command(name="botstats", description="Show command queue depth and latency")
+async def botstats(interaction: discord.Interaction):
+    await interaction.response.send_message(bot.job_stats.summary(), ephemeral=True)
+
 
 if __name__ == "__main__":
     if not TOKEN:
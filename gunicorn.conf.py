@@ -0,0 +1,43 @@
+"""Gunicorn settings for serving ``app:app`` in production.
+
+Start with ``gunicorn -c gunicorn.conf.py app:app``. Every value can be tuned
+through the environment. ``kill -HUP <master pid>`` re-reads this file and
+replaces workers gracefully. Because the app is preloaded, picking up new code
+requires a full restart (or ``USR2`` followed by ``WINCH`` on the old master).
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("WEB_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+# Threads per worker; most request time is spent waiting on Polygon/OpenAI
+threads = int(os.getenv("WEB_THREADS", "4"))
+worker_class = "gthread"
+# Import the app once in the master so workers share its memory copy-on-write
+preload_app = True
+keepalive = int(os.getenv("WEB_KEEPALIVE", "5"))
+timeout = int(os.getenv("WEB_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+# Recycle workers now and then to contain leaks in third-party clients
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "2000"))
+max_requests_jitter = max_requests // 10
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    """Prepare the schema and warm shared caches before forking workers."""
+    import cache
+    import db
+    import market
+    import symbols
+
+    db.init_db()
+    cache.get_cache()
+    # Pull in the heavy libraries and build the symbol trie once in the master;
+    # workers rebuild the trie themselves when symbols.py reloads the table
+    import pandas  # noqa: F401
+
+    market._sentiment_analyzer()
+    symbols.get_trie()
+    server.log.info("Database ready, caches warmed")
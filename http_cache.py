@@ -0,0 +1,141 @@
+"""HTTP validators, cache headers and response compression.
+
+``init_app`` gives every response a ``Cache-Control`` policy, a weak ETag and
+gzip or brotli encoding when the client accepts it, and answers matching
+conditional requests with 304. Expensive pages add ``@conditional`` with a
+cheap validator so a revalidation is answered before the view does any work.
+"""
+import gzip
+import hashlib
+import os
+import time
+from functools import wraps
+
+from flask import g, make_response, request
+
+# Pages without their own validator are rebuilt at most this often on revalidation
+PAGE_TTL = int(os.getenv("PAGE_TTL", "30"))
+# Seconds shared caches (nginx) may keep pages served to anonymous visitors
+PUBLIC_MAX_AGE = int(os.getenv("PUBLIC_MAX_AGE", "60"))
+COMPRESS_MIN_BYTES = 500
+COMPRESS_MIMETYPES = {
+    "text/html",
+    "text/plain",
+    "text/css",
+    "application/json",
+    "application/javascript",
+}
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Endpoints whose Cache-Control differs from the defaults
+CACHE_CONTROL = {
+    "healthz": "no-store",
+    "metrics_endpoint": "no-store",
+    "stocks.symbol_autocomplete": "private, max-age=300",
+}
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+
+def time_bucket(seconds=PAGE_TTL):
+    """Return a value that changes every ``seconds``, for time-based validators."""
+    return int(time.time() // seconds)
+
+
+def conditional(validator):
+    """Answer conditional GETs of a view from ``validator`` alone.
+
+    ``validator`` receives the view arguments and returns ``(parts,
+    last_modified)``. ``parts`` is anything whose repr changes when the page
+    would, and ``last_modified`` is an epoch time or ``None``. Together with
+    the user and the full URL they form the ETag. A client that already holds
+    that ETag gets a 304 without the view running.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(*args, **kwargs)
+            parts, last_modified = validator(*args, **kwargs)
+            user = g.get("user")
+            key = repr((request.full_path, user["id"] if user else None, parts))
+            etag = hashlib.sha1(key.encode()).hexdigest()[:32]
+            if request.if_none_match:
+                fresh = request.if_none_match.contains_weak(etag)
+            else:
+                since = request.if_modified_since
+                fresh = bool(last_modified and since and int(last_modified) <= since.timestamp())
+            response = make_response("", 304) if fresh else make_response(view(*args, **kwargs))
+            response.set_etag(etag, weak=True)
+            if last_modified:
+                response.last_modified = int(last_modified)
+            return response
+
+        return wrapped
+
+    return decorator
+
+
+def _cache_control(response):
+    if "Cache-Control" in response.headers:
+        return
+    policy = CACHE_CONTROL.get(request.endpoint)
+    if policy is None:
+        if request.method not in ("GET", "HEAD") or response.status_code not in (200, 304):
+            policy = "no-store"
+        elif g.get("user"):
+            # browsers keep the page but revalidate it on every view
+            policy = "private, no-cache"
+        else:
+            policy = f"public, max-age={PUBLIC_MAX_AGE}"
+    response.headers["Cache-Control"] = policy
+
+
+def _compress(response):
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.mimetype not in COMPRESS_MIMETYPES
+        or "Content-Encoding" in response.headers
+    ):
+        return
+    response.vary.add("Accept-Encoding")
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return
+    encodings = ["br", "gzip"] if brotli is not None else ["gzip"]
+    encoding = request.accept_encodings.best_match(encodings)
+    if encoding == "br":
+        body = brotli.compress(body, quality=BROTLI_QUALITY)
+    elif encoding == "gzip":
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    else:
+        return
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+
+
+def init_app(app):
+    # static files are not fingerprinted, so let browsers reuse them for a day
+    if app.config.get("SEND_FILE_MAX_AGE_DEFAULT") is None:
+        app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 86400
+
+    @app.after_request
+    def cache_headers(response):
+        _cache_control(response)
+        if (
+            request.method in ("GET", "HEAD")
+            and response.status_code == 200
+            and not response.direct_passthrough
+            and not response.headers.get("ETag")
+            and "no-store" not in response.headers["Cache-Control"]
+        ):
+            # the body is already built; a matching ETag still saves the transfer
+            response.add_etag(weak=True)
+            response.make_conditional(request)
+        _compress(response)
+        return response
@@ -0,0 +1,343 @@
+import json
+import math
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from bars import from_stamps, load_bars, to_stamp, to_stamps
+from db import get_db
+
+# Indicator parameters
+SMA_WINDOW = 20
+EMA_FAST = 12
+EMA_SLOW = 26
+MACD_SIGNAL = 9
+RSI_PERIOD = 14
+ATR_PERIOD = 14
+BB_WINDOW = 20
+BB_STDS = 2.0
+VWAP_WINDOW = 20
+COLUMNS = (
+    "sma",
+    "ema_fast",
+    "ema_slow",
+    "rsi",
+    "macd",
+    "macd_signal",
+    "macd_hist",
+    "bb_upper",
+    "bb_lower",
+    "atr",
+    "vwap",
+)
+# Indicators drawn on the price axis of the chart
+OVERLAYS = {
+    "sma": ("sma",),
+    "ema": ("ema_fast", "ema_slow"),
+    "bb": ("bb_upper", "sma", "bb_lower"),
+    "vwap": ("vwap",),
+}
+
+
+def _alpha(span):
+    return 2.0 / (span + 1)
+
+
+def compute(df):
+    """Return ``(indicators, state)`` for an OHLCV frame in one vectorized pass.
+
+    Every recursive indicator is an exponential filter seeded with its first
+    input (``adjust=False``), so ``update`` continues each series from
+    ``state`` exactly as if it had been recomputed.
+    """
+    close = df["Close"].astype(float)
+    high = df["High"].astype(float)
+    low = df["Low"].astype(float)
+    volume = df["Volume"].astype(float)
+
+    ema_fast = close.ewm(alpha=_alpha(EMA_FAST), adjust=False).mean()
+    ema_slow = close.ewm(alpha=_alpha(EMA_SLOW), adjust=False).mean()
+    macd = ema_fast - ema_slow
+    signal = macd.ewm(alpha=_alpha(MACD_SIGNAL), adjust=False).mean()
+
+    diff = close.diff()
+    gain = diff.clip(lower=0).iloc[1:].ewm(alpha=1 / RSI_PERIOD, adjust=False).mean()
+    loss = (-diff).clip(lower=0).iloc[1:].ewm(alpha=1 / RSI_PERIOD, adjust=False).mean()
+    rsi = (100 - 100 / (1 + gain / loss)).where(loss > 0, 100.0).reindex(close.index)
+
+    prev_close = close.shift()
+    true_range = pd.concat(
+        [high - low, (high - prev_close).abs(), (low - prev_close).abs()], axis=1
+    ).max(axis=1)
+    atr = true_range.ewm(alpha=1 / ATR_PERIOD, adjust=False).mean()
+
+    sma = close.rolling(SMA_WINDOW).mean()
+    std = close.rolling(BB_WINDOW).std(ddof=0)
+    typical = (high + low + close) / 3
+    vwap = (typical * volume).rolling(VWAP_WINDOW).sum() / volume.rolling(VWAP_WINDOW).sum()
+
+    out = pd.DataFrame(
+        {
+            "sma": sma,
+            "ema_fast": ema_fast,
+            "ema_slow": ema_slow,
+            "rsi": rsi,
+            "macd": macd,
+            "macd_signal": signal,
+            "macd_hist": macd - signal,
+            "bb_upper": sma + BB_STDS * std,
+            "bb_lower": sma - BB_STDS * std,
+            "atr": atr,
+            "vwap": vwap,
+        },
+        index=df.index,
+    )
+    state = None
+    if len(df):
+        window = max(SMA_WINDOW, BB_WINDOW, VWAP_WINDOW)
+        state = {
+            "n": len(df),
+            "ts": int(df.index[-1].value // 1_000_000),
+            "close": float(close.iloc[-1]),
+            "ema_fast": float(ema_fast.iloc[-1]),
+            "ema_slow": float(ema_slow.iloc[-1]),
+            "signal": float(signal.iloc[-1]),
+            "gain": float(gain.iloc[-1]) if len(gain) else None,
+            "loss": float(loss.iloc[-1]) if len(loss) else None,
+            "atr": float(atr.iloc[-1]),
+            "closes": close.iloc[-window:].tolist(),
+            "pv": (typical * volume).iloc[-window:].tolist(),
+            "volumes": volume.iloc[-window:].tolist(),
+        }
+    return out, state
+
+
+def update(state, bar):
+    """Fold one new bar into ``state``; return ``(values, new_state)``.
+
+    Costs O(1) per bar: the recursive indicators need only their previous
+    value and the windowed ones keep their last ``window`` inputs.
+    """
+    close, high, low, volume = (float(bar[k]) for k in ("Close", "High", "Low", "Volume"))
+    typical = (high + low + close) / 3
+    if state is None:
+        out, new = compute(pd.DataFrame([bar], index=[pd.Timestamp(0)]))
+        # keep the stored stamp, whatever the kind's unit
+        new["ts"] = int(bar["ts"])
+        return out.iloc[-1].to_dict(), new
+    s = dict(state)
+    window = max(SMA_WINDOW, BB_WINDOW, VWAP_WINDOW)
+    prev = s["close"]
+    s["n"] += 1
+    s["ts"] = int(bar["ts"])
+    s["close"] = close
+    s["ema_fast"] += _alpha(EMA_FAST) * (close - s["ema_fast"])
+    s["ema_slow"] += _alpha(EMA_SLOW) * (close - s["ema_slow"])
+    macd = s["ema_fast"] - s["ema_slow"]
+    s["signal"] += _alpha(MACD_SIGNAL) * (macd - s["signal"])
+    gain, loss = max(close - prev, 0.0), max(prev - close, 0.0)
+    if s["gain"] is None:
+        s["gain"], s["loss"] = gain, loss
+    else:
+        s["gain"] += (gain - s["gain"]) / RSI_PERIOD
+        s["loss"] += (loss - s["loss"]) / RSI_PERIOD
+    true_range = max(high - low, abs(high - prev), abs(low - prev))
+    s["atr"] += (true_range - s["atr"]) / ATR_PERIOD
+    s["closes"] = (s["closes"] + [close])[-window:]
+    s["pv"] = (s["pv"] + [typical * volume])[-window:]
+    s["volumes"] = (s["volumes"] + [volume])[-window:]
+
+    closes = s["closes"]
+    sma = std = vwap = math.nan
+    if len(closes) >= SMA_WINDOW:
+        sma = sum(closes[-SMA_WINDOW:]) / SMA_WINDOW
+    if len(closes) >= BB_WINDOW:
+        std = float(np.std(closes[-BB_WINDOW:]))
+    if len(s["volumes"]) >= VWAP_WINDOW and sum(s["volumes"][-VWAP_WINDOW:]):
+        vwap = sum(s["pv"][-VWAP_WINDOW:]) / sum(s["volumes"][-VWAP_WINDOW:])
+    bb_mid = sum(closes[-BB_WINDOW:]) / BB_WINDOW if len(closes) >= BB_WINDOW else math.nan
+    values = {
+        "sma": sma,
+        "ema_fast": s["ema_fast"],
+        "ema_slow": s["ema_slow"],
+        "rsi": 100.0 if s["loss"] == 0 else 100 - 100 / (1 + s["gain"] / s["loss"]),
+        "macd": macd,
+        "macd_signal": s["signal"],
+        "macd_hist": macd - s["signal"],
+        "bb_upper": bb_mid + BB_STDS * std,
+        "bb_lower": bb_mid - BB_STDS * std,
+        "atr": s["atr"],
+        "vwap": vwap,
+    }
+    return values, s
+
+
+def _load_state(ticker, kind):
+    row = get_db().execute(
+        "SELECT state, prev FROM indicator_state WHERE ticker = ? AND kind = ?", (ticker, kind)
+    ).fetchone()
+    if row is None:
+        return None, None
+    return json.loads(row["state"]), json.loads(row["prev"]) if row["prev"] else None
+
+
+def _save(ticker, kind, rows, state, prev):
+    conn = get_db()
+    conn.executemany(
+        f"INSERT OR REPLACE INTO indicators (ticker, kind, ts, {', '.join(COLUMNS)}) "
+        f"VALUES (?, ?, ?, {', '.join('?' * len(COLUMNS))})",
+        [
+            (ticker, kind, ts, *(None if v is None or math.isnan(v) else float(v) for v in values))
+            for ts, values in rows
+        ],
+    )
+    conn.execute(
+        "INSERT OR REPLACE INTO indicator_state (ticker, kind, state, prev) VALUES (?, ?, ?, ?)",
+        (ticker, kind, json.dumps(state), json.dumps(prev) if prev else None),
+    )
+
+
+def rebuild(ticker, kind="1d", commit=True):
+    """Recompute and store every indicator for the ticker's stored bars."""
+    df = load_bars(ticker, kind)
+    if df.empty:
+        return 0
+    out, state = compute(df)
+    # the state before the last bar lets an updated last bar be replayed
+    _, prev = compute(df.iloc[:-1]) if len(df) > 1 else (None, None)
+    stamps = to_stamps(df.index, kind)
+    # refresh compares these with stored stamps, which are in the kind's unit
+    state["ts"] = stamps[-1]
+    if prev is not None:
+        prev["ts"] = stamps[-2]
+    conn = get_db()
+    conn.execute("DELETE FROM indicators WHERE ticker = ? AND kind = ?", (ticker, kind))
+    _save(ticker, kind, zip(stamps, out[list(COLUMNS)].itertuples(index=False)), state, prev)
+    if commit:
+        conn.commit()
+    return len(df)
+
+
+def refresh(ticker, kind="1d", commit=True):
+    """Bring stored indicators up to date with the bar store.
+
+    Only bars at or after the last processed one are read. A rewritten last
+    bar (today's bar while the session is open) is replayed from the state
+    saved before it; new bars are folded in one at a time. Older bars are
+    never re-read, so back-filled or split-adjusted history needs
+    ``rebuild``. Returns the number of bars processed.
+    """
+    state, prev = _load_state(ticker, kind)
+    if state is None:
+        return rebuild(ticker, kind, commit)
+    # plain rows: a DataFrame would cost more than the update itself
+    bars = get_db().execute(
+        "SELECT ts, open, high, low, close, volume FROM bars "
+        "WHERE ticker = ? AND kind = ? AND ts >= ? ORDER BY ts",
+        (ticker, kind, state["ts"]),
+    ).fetchall()
+    if not bars:
+        return 0
+    if bars[0]["ts"] == state["ts"]:
+        # the last processed bar may have changed; replay it
+        state = prev
+    rows = []
+    for bar in bars:
+        values, new_state = update(
+            state,
+            {
+                "ts": bar["ts"],
+                "Open": bar["open"],
+                "High": bar["high"],
+                "Low": bar["low"],
+                "Close": bar["close"],
+                "Volume": bar["volume"],
+            },
+        )
+        prev, state = state, new_state
+        rows.append((bar["ts"], [values[c] for c in COLUMNS]))
+    _save(ticker, kind, rows, state, prev)
+    if commit:
+        get_db().commit()
+    return len(rows)
+
+
+def refresh_all(tickers, kind="1d"):
+    """Refresh many tickers in one transaction; return bars processed."""
+    processed = sum(refresh(ticker, kind, commit=False) for ticker in tickers)
+    get_db().commit()
+    return processed
+
+
+def load_indicators(ticker, kind="1d", start=None):
+    """Return stored indicators as a DataFrame indexed like ``load_bars``."""
+    query = f"SELECT ts, {', '.join(COLUMNS)} FROM indicators WHERE ticker = ? AND kind = ?"
+    params = [ticker, kind]
+    if start is not None:
+        query += " AND ts >= ?"
+        params.append(to_stamp(start, kind))
+    rows = get_db().execute(query + " ORDER BY ts", params).fetchall()
+    return pd.DataFrame(
+        {c: [r[c] for r in rows] for c in COLUMNS},
+        index=from_stamps([r["ts"] for r in rows], kind),
+        dtype=float,
+    )
+
+
+def indicators_for(ticker, kind, data):
+    """Return indicators aligned with ``data``, the ticker's ``kind`` bars.
+
+    Stored indicators are brought up to date first so they are warmed up
+    by the full bar history. Bars missing from the store (a provider that
+    was not saved) are computed from ``data`` directly.
+    """
+    refresh(ticker, kind)
+    stored = load_indicators(ticker, kind, data.index[0]).reindex(data.index)
+    if stored.iloc[-1].isna().all():
+        return compute(data)[0]
+    return stored
+
+
+def overlay_series(ind, overlay):
+    """Return chart lines for ``overlay``, one list per column with ``None`` gaps."""
+    return {
+        column: [None if math.isnan(v) else round(float(v), 2) for v in ind[column]]
+        for column in OVERLAYS.get(overlay, ())
+    }
+
+
+def latest(tickers, kind="1d"):
+    """Return the newest indicator row for each ticker in one query."""
+    if not tickers:
+        return {}
+    rows = get_db().execute(
+        f"SELECT i.ticker, i.ts, {', '.join('i.' + c for c in COLUMNS)} FROM indicators i "
+        "JOIN (SELECT ticker, MAX(ts) AS ts FROM indicators "
+        f"WHERE kind = ? AND ticker IN ({','.join('?' * len(tickers))}) GROUP BY ticker) m "
+        "ON i.ticker = m.ticker AND i.ts = m.ts WHERE i.kind = ?",
+        (kind, *tickers, kind),
+    ).fetchall()
+    return {r["ticker"]: {c: r[c] for c in ("ts",) + COLUMNS} for r in rows}
+
+
+def main():
+    import db
+
+    db.init_db()
+    kind = sys.argv[sys.argv.index("--kind") + 1] if "--kind" in sys.argv else "1d"
+    args = [a for a in sys.argv[1:] if a not in ("--kind", kind, "--rebuild")]
+    tickers = [t.upper() for t in args] or [
+        row["ticker"] for row in get_db().execute("SELECT ticker FROM tickers")
+    ]
+    started = time.perf_counter()
+    if "--rebuild" in sys.argv:
+        bars = sum(rebuild(ticker, kind) for ticker in tickers)
+    else:
+        bars = refresh_all(tickers, kind)
+    elapsed = time.perf_counter() - started
+    print(f"{len(tickers)} tickers, {bars} {kind} bars processed in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+import datetime as dt
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+
+from db import get_db
+from news import NEWS_INTERVAL, ingest, poll
+from market import (
+    analyze_sentiment,
+    fetch_news,
+    fetch_stock_history,
+    gpt_explain_predictions,
+    predict_prices,
+)
+
+# Worker threads started by ``python jobs.py``
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Precomputed results older than this many seconds are recomputed on view
+PRECOMPUTE_TTL = int(os.getenv("PRECOMPUTE_TTL", str(12 * 3600)))
+# Chart settings the forecast is precomputed for (the stock page defaults)
+PRECOMPUTE_PERIOD = "1y"
+PRECOMPUTE_INTERVAL = "1d"
+PRECOMPUTE_DAYS = 5
+# The after-close refresh starts this long after the 16:00 New York close
+CLOSE_TIME = dt.time(16, 15)
+MARKET_TZ = "America/New_York"
+MAX_ATTEMPTS = 3
+# Running jobs older than this are assumed to belong to a dead worker
+STALE_SECONDS = 600
+POLL_SECONDS = 1.0
+
+# Higher priorities run first
+PRIORITY_SCHEDULED = 0
+PRIORITY_NEWS = 5
+PRIORITY_VIEW = 7
+PRIORITY_USER = 10
+
+
+def enqueue(ticker, kind="refresh", priority=PRIORITY_SCHEDULED, delay=0):
+    """Queue ``kind`` for ``ticker`` unless an equal job is already queued.
+
+    A duplicate only raises the queued job's priority and pulls its start time
+    forward, so a user refresh jumps ahead of the nightly batch.
+    """
+    now = time.time()
+    conn = get_db()
+    conn.execute(
+        "INSERT INTO jobs (kind, ticker, priority, status, run_after, created_at) "
+        "VALUES (?, ?, ?, 'queued', ?, ?) "
+        "ON CONFLICT(kind, ticker) WHERE status = 'queued' DO UPDATE SET "
+        "priority = MAX(priority, excluded.priority), "
+        "run_after = MIN(run_after, excluded.run_after)",
+        (kind, ticker, priority, now + delay, now),
+    )
+    conn.commit()
+
+
+def claim():
+    """Atomically mark the most urgent runnable job as running and return it."""
+    now = time.time()
+    conn = get_db()
+    row = conn.execute(
+        "UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1 "
+        "WHERE id = (SELECT id FROM jobs WHERE status = 'queued' AND run_after <= ? "
+        "ORDER BY priority DESC, id LIMIT 1) "
+        "RETURNING id, kind, ticker, priority, attempts",
+        (now, now),
+    ).fetchone()
+    conn.commit()
+    return row
+
+
+def _requeue(conn, job_id, run_after, error=None):
+    """Return job ``job_id`` to the queue, folding it into an equal queued job.
+
+    The same job may have been queued again while it ran. Only one queued
+    row per kind and ticker is allowed, so the old row is then marked
+    ``superseded`` and the queued one inherits its priority and backoff.
+    """
+    # the first write takes the database lock, so no enqueue can slip in between
+    folded = conn.execute(
+        "UPDATE jobs SET priority = MAX(jobs.priority, old.priority), run_after = MAX(jobs.run_after, ?) "
+        "FROM (SELECT kind, ticker, priority FROM jobs WHERE id = ?) AS old "
+        "WHERE jobs.status = 'queued' AND jobs.kind = old.kind AND jobs.ticker = old.ticker",
+        (run_after, job_id),
+    ).rowcount
+    if folded:
+        conn.execute(
+            "UPDATE jobs SET status = 'superseded', finished_at = ?, error = ? WHERE id = ?",
+            (time.time(), error, job_id),
+        )
+    else:
+        conn.execute(
+            "UPDATE jobs SET status = 'queued', run_after = ?, error = ? WHERE id = ?",
+            (run_after, error, job_id),
+        )
+
+
+def finish(job, error=None):
+    """Record the outcome of ``job``, retrying failures with a backoff."""
+    conn = get_db()
+    if error is None:
+        conn.execute(
+            "UPDATE jobs SET status = 'done', finished_at = ?, error = NULL WHERE id = ?",
+            (time.time(), job["id"]),
+        )
+    elif job["attempts"] < MAX_ATTEMPTS:
+        _requeue(conn, job["id"], time.time() + 60 * job["attempts"], error)
+    else:
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', finished_at = ?, error = ? WHERE id = ?",
+            (time.time(), error, job["id"]),
+        )
+    conn.commit()
+
+
+def requeue_stale():
+    """Return jobs left running by a crashed worker to the queue; return how many."""
+    conn = get_db()
+    now = time.time()
+    stale = conn.execute(
+        "SELECT id FROM jobs WHERE status = 'running' AND started_at < ?",
+        (now - STALE_SECONDS,),
+    ).fetchall()
+    for row in stale:
+        _requeue(conn, row["id"], now)
+    conn.commit()
+    return len(stale)
+
+
+def prune(days=7):
+    """Delete finished jobs older than ``days``."""
+    conn = get_db()
+    conn.execute(
+        "DELETE FROM jobs WHERE status IN ('done', 'failed', 'superseded') AND finished_at < ?",
+        (time.time() - days * 86400,),
+    )
+    conn.commit()
+
+
+def news_hash(news):
+    text = "\n".join(f"{n['title']}|{n['link']}" for n in news)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def save_precomputed(ticker, news, sentiment, predictions, reason):
+    conn = get_db()
+    conn.execute(
+        "INSERT OR REPLACE INTO precomputed "
+        "(ticker, computed_at, news, news_hash, sentiment, predictions, reason, period, interval, days) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            ticker,
+            time.time(),
+            json.dumps(news),
+            news_hash(news),
+            sentiment,
+            json.dumps(predictions),
+            reason,
+            PRECOMPUTE_PERIOD,
+            PRECOMPUTE_INTERVAL,
+            PRECOMPUTE_DAYS,
+        ),
+    )
+    conn.commit()
+
+
+def load_precomputed(ticker, max_age=PRECOMPUTE_TTL):
+    """Return the stored forecast for ``ticker`` if younger than ``max_age``."""
+    row = get_db().execute(
+        "SELECT * FROM precomputed WHERE ticker = ?", (ticker,)
+    ).fetchone()
+    if row is None or row["computed_at"] < time.time() - max_age:
+        return None
+    result = dict(row)
+    result["news"] = json.loads(row["news"])
+    result["predictions"] = json.loads(row["predictions"])
+    return result
+
+
+def refresh_ticker(ticker):
+    """Compute and store news, sentiment, forecast and explanation."""
+    from indicators import indicators_for
+
+    data = fetch_stock_history(ticker, period=PRECOMPUTE_PERIOD, interval=PRECOMPUTE_INTERVAL)
+    news = fetch_news(ticker)
+    sentiment = analyze_sentiment(news)
+    ind = indicators_for(ticker, PRECOMPUTE_INTERVAL, data)
+    preds = predict_prices(data, days=PRECOMPUTE_DAYS, sentiment=sentiment, indicators=ind)
+    reason = gpt_explain_predictions(preds, sentiment, news)
+    save_precomputed(ticker, news, sentiment, preds, reason)
+
+
+def queue_if_news_changed(ticker):
+    """Queue a refresh when the ticker's headlines changed since last run."""
+    news = fetch_news(ticker)
+    row = get_db().execute(
+        "SELECT news_hash FROM precomputed WHERE ticker = ?", (ticker,)
+    ).fetchone()
+    if row is None or row["news_hash"] != news_hash(news):
+        enqueue(ticker, "refresh", PRIORITY_NEWS)
+
+
+def check_news(ticker):
+    """Ingest the ticker's news and queue a refresh if its headlines changed."""
+    ingest(ticker)
+    queue_if_news_changed(ticker)
+
+
+HANDLERS = {"refresh": refresh_ticker, "news": check_news}
+
+
+def run_next():
+    """Run one queued job; return ``False`` when nothing was runnable."""
+    job = claim()
+    if job is None:
+        return False
+    try:
+        HANDLERS[job["kind"]](job["ticker"])
+    except Exception as e:
+        finish(job, str(e) or type(e).__name__)
+    else:
+        finish(job)
+    return True
+
+
+def worker(stop):
+    while not stop.is_set():
+        try:
+            ran = run_next()
+        except Exception:
+            # keep the thread alive; the scheduler requeues the job once it goes stale
+            traceback.print_exc()
+            ran = False
+        if not ran:
+            stop.wait(POLL_SECONDS)
+
+
+def last_close(now=None):
+    """Return the epoch time of the most recent after-close refresh point."""
+    from zoneinfo import ZoneInfo
+
+    tz = ZoneInfo(MARKET_TZ)
+    now = now or dt.datetime.now(tz)
+    day = now.date()
+    while True:
+        close = dt.datetime.combine(day, CLOSE_TIME, tz)
+        if day.weekday() < 5 and close <= now:
+            return close.timestamp()
+        day -= dt.timedelta(days=1)
+
+
+def watchlist():
+    return [row["ticker"] for row in get_db().execute("SELECT ticker FROM tickers")]
+
+
+def schedule_after_close():
+    """Queue a refresh for every ticker not computed since the last close."""
+    cutoff = last_close()
+    # skip tickers already computed or attempted since the close
+    fresh = {
+        row["ticker"]
+        for row in get_db().execute(
+            "SELECT ticker FROM precomputed WHERE computed_at >= ? "
+            "UNION SELECT ticker FROM jobs WHERE kind = 'refresh' AND created_at >= ?",
+            (cutoff, cutoff),
+        )
+    }
+    stale = [t for t in watchlist() if t not in fresh]
+    for ticker in stale:
+        enqueue(ticker, "refresh", PRIORITY_SCHEDULED)
+    return len(stale)
+
+
+def schedule_news():
+    """Ingest news for the whole watchlist at once and queue changed tickers."""
+    tickers = watchlist()
+    for ticker, added in poll(tickers).items():
+        if added:
+            queue_if_news_changed(ticker)
+    return len(tickers)
+
+
+def queue_status():
+    rows = get_db().execute(
+        "SELECT kind, status, COUNT(*) AS n FROM jobs GROUP BY kind, status ORDER BY kind, status"
+    ).fetchall()
+    return [(r["kind"], r["status"], r["n"]) for r in rows]
+
+
+def main():
+    import db
+
+    db.init_db()
+    if len(sys.argv) > 1 and sys.argv[1] == "--status":
+        for kind, status, n in queue_status():
+            print(f"{kind:<8} {status:<8} {n}")
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "--enqueue":
+        for ticker in sys.argv[2:]:
+            enqueue(ticker.upper(), "refresh", PRIORITY_USER)
+        print(f"Queued {len(sys.argv) - 2} refresh jobs")
+        return
+
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=worker, args=(stop,), name=f"job-{i}", daemon=True)
+        for i in range(JOB_WORKERS)
+    ]
+    for thread in threads:
+        thread.start()
+    print(f"Job workers started: {JOB_WORKERS}")
+    next_news = 0.0
+    try:
+        while True:
+            # jobs whose worker died, or whose outcome could not be recorded
+            requeued = requeue_stale()
+            if requeued:
+                print(f"Requeued {requeued} stale jobs")
+            queued = schedule_after_close()
+            if queued:
+                print(f"Queued after-close refresh for {queued} tickers")
+            if time.time() >= next_news:
+                schedule_news()
+                prune()
+                next_news = time.time() + NEWS_INTERVAL
+            time.sleep(60)
+    except KeyboardInterrupt:
+        stop.set()
+
+
+if __name__ == "__main__":
+    main()
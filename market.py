@@ -0,0 +1,508 @@
+import os
+import re
+import threading
+import time
+from dotenv import load_dotenv
+
+import cache
+from metrics import timed
+from providers import get_provider
+
+load_dotenv()
+POLYGON_API_KEY = os.getenv("POLYGON_API_KEY")
+# Number of bars shown for each period option
+PERIOD_BARS = {"5d": 5, "1mo": 22, "3mo": 66, "6mo": 132, "1y": 264}
+# Watchlist snapshots are reused for this many seconds
+SNAPSHOT_TTL = 30
+# Seconds a daily history fetched from a remote provider is shared between processes
+HISTORY_TTL = int(os.getenv("HISTORY_TTL", "300"))
+# Seconds a GPT answer is reused for an identical prompt
+GPT_TTL = int(os.getenv("GPT_TTL", "21600"))
+# Tickers per snapshot request, keeping the query string a sane length
+SNAPSHOT_BATCH = 250
+# Days of 1-minute bars fetched the first time a ticker's intraday chart is viewed
+MINUTE_HISTORY_DAYS = int(os.getenv("MINUTE_HISTORY_DAYS", "30"))
+# Seconds before a ticker's 1-minute bars are checked for new minutes again
+MINUTE_SYNC_TTL = int(os.getenv("MINUTE_SYNC_TTL", "60"))
+# Trading days are New York calendar days, extended hours included
+MARKET_TZ = "America/New_York"
+# Fewest complete rows for the indicator regression; shorter histories use AR(1)
+INDICATOR_MIN_ROWS = 30
+# RSI level at or above which the simulation does not open a position
+RSI_OVERBOUGHT = 70
+
+_minute_sync = {}
+_minute_sync_lock = threading.Lock()
+_analyzer = None
+
+
+@timed("history")
+def fetch_stock_history(ticker, period="1y", interval="1d"):
+    """Fetch historical stock prices from the market data provider.
+
+    ``interval`` controls the aggregation resolution (e.g. ``1m``,
+    ``5m``, ``15m``, ``1h``, ``1d``). Bars fetched from a remote provider
+    are also saved to the local bar store. Intraday intervals are served
+    by ``intraday_history`` and cover the last ``PERIOD_BARS[period]``
+    trading days, at most as many as are stored (``MINUTE_HISTORY_DAYS`` on
+    the first view, growing as later views keep them in sync). Remote fetches go through the shared cache
+    for ``HISTORY_TTL`` seconds, so workers do not refetch the same year.
+    """
+    import pandas as pd
+    from bars import DERIVED_INTERVALS, save_bars
+
+    days = PERIOD_BARS.get(period, 5)
+    if interval == "1m" or interval in DERIVED_INTERVALS:
+        return last_trading_days(intraday_history(ticker, interval), days)
+    provider = get_provider()
+
+    def fetch():
+        end_dt = pd.Timestamp.now(tz="UTC")
+        start_dt = end_dt - pd.Timedelta(days=365)
+        df = provider.history(ticker, interval, start_dt, end_dt)
+        if provider.remote:
+            save_bars(ticker, interval, df)
+        return df
+
+    if not provider.remote:
+        return fetch().tail(days)
+    df = cache.get_or_compute(f"history:{ticker}:{interval}", fetch, HISTORY_TTL)
+    if df is None:
+        # another process failed to fetch it; fetch here to report the error
+        df = fetch()
+    return df.tail(days)
+
+
+def sync_minute_bars(ticker):
+    """Fetch 1-minute bars newer than the stored ones from a remote provider.
+
+    The first sync covers ``MINUTE_HISTORY_DAYS``; later ones ask only for
+    minutes after the last stored bar and run at most every
+    ``MINUTE_SYNC_TTL`` seconds per ticker. Errors are raised only while
+    nothing is stored yet, otherwise the stored bars are served.
+    """
+    import pandas as pd
+    from bars import save_bars
+    from db import get_db
+
+    provider = get_provider()
+    now = time.monotonic()
+    with _minute_sync_lock:
+        if not provider.remote or _minute_sync.get(ticker, 0) > now:
+            return
+        _minute_sync[ticker] = now + MINUTE_SYNC_TTL
+    row = get_db().execute(
+        "SELECT MAX(ts) AS ts FROM bars WHERE ticker = ? AND kind = '1m'", (ticker,)
+    ).fetchone()
+    end_dt = pd.Timestamp.now(tz="UTC")
+    if row["ts"] is None:
+        start_dt = end_dt - pd.Timedelta(days=MINUTE_HISTORY_DAYS)
+    else:
+        # the last stored minute may still have been forming; fetch it again
+        start_dt = pd.Timestamp(row["ts"], unit="ms", tz="UTC")
+    try:
+        save_bars(ticker, "1m", provider.history(ticker, "1m", start_dt, end_dt))
+    except Exception:
+        if row["ts"] is None:
+            with _minute_sync_lock:
+                _minute_sync.pop(ticker, None)
+            raise
+
+
+def intraday_history(ticker, interval):
+    """Return stored intraday bars, deriving 5m/15m/1h from 1-minute bars.
+
+    Only the 1-minute series touches the network; every coarser interval is
+    resampled locally and extended incrementally, so switching intervals
+    costs no requests.
+    """
+    from bars import DERIVED_INTERVALS, derive_bars, load_bars
+
+    sync_minute_bars(ticker)
+    if interval in DERIVED_INTERVALS:
+        derive_bars(ticker, interval)
+    df = load_bars(ticker, interval)
+    if df.empty:
+        raise ValueError(f"No {interval} bars for {ticker}")
+    return df[["Open", "High", "Low", "Close", "Volume"]]
+
+
+def fetch_snapshots(tickers):
+    """Return last price and daily change for many tickers at once.
+
+    With Polygon a whole watchlist costs one all-tickers snapshot request
+    per ``SNAPSHOT_BATCH`` tickers. Results are kept in the shared cache for
+    ``SNAPSHOT_TTL`` seconds and only stale tickers are requested again.
+    """
+    try:
+        cached = cache.get_many(f"snapshot:{t}" for t in tickers)
+    except Exception:
+        # an unavailable shared cache only costs the requests it would save
+        cached = {}
+    result = {t: cached[f"snapshot:{t}"] for t in tickers if f"snapshot:{t}" in cached}
+    missing = [t for t in tickers if t not in result]
+    for start in range(0, len(missing), SNAPSHOT_BATCH):
+        batch = missing[start : start + SNAPSHOT_BATCH]
+        fetched = get_provider().snapshots(batch)
+        try:
+            cache.set_many({f"snapshot:{t}": snap for t, snap in fetched.items()}, SNAPSHOT_TTL)
+        except Exception:
+            pass
+        result.update(fetched)
+    return result
+
+
+def last_trading_days(df, days):
+    """Return the rows of ``df`` from its last ``days`` trading days.
+
+    ``df`` holds intraday bars indexed in UTC. Days are New York dates, so
+    evening extended hours stay with their session.
+    """
+    if df.empty:
+        return df
+    index = df.index if df.index.tz is not None else df.index.tz_localize("UTC")
+    sessions = index.tz_convert(MARKET_TZ).normalize()
+    first = sessions.unique()[-days:][0]
+    return df[sessions >= first]
+
+
+def load_tick_bars(ticker, kind, period="1y"):
+    """Return stored volume, dollar or tick bars in the history layout.
+
+    ``period`` selects the last ``PERIOD_BARS[period]`` trading days that
+    have bars; each day holds hundreds of them.
+    """
+    from bars import load_bars
+
+    df = load_bars(ticker, kind)
+    if df.empty:
+        raise ValueError(
+            f"No {kind} bars stored for {ticker}; run python bars.py {ticker}"
+        )
+    return last_trading_days(df, PERIOD_BARS.get(period, 5))
+
+
+def _ask_gpt(prompt, **options):
+    """Return GPT's reply to ``prompt``, or ``None`` without an API key or on error.
+
+    Replies are kept in the shared cache for ``GPT_TTL`` seconds, and only
+    one process asks when several need the same prompt at once.
+    """
+    key = os.getenv("OPENAI_API_KEY")
+    if not key:
+        return None
+
+    def ask():
+        try:
+            import openai
+
+            client = openai.OpenAI(api_key=key)
+            resp = client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0,
+                **options,
+            )
+            return resp.choices[0].message.content
+        except Exception:
+            return None
+
+    return cache.get_or_compute(cache.make_key("gpt", prompt, options), ask, GPT_TTL)
+
+
+@timed("gpt_forecast")
+def gpt_predict_prices(data, days, sentiment, indicators=None):
+    if data is None or data.empty or "Close" not in data:
+        return None
+    closes = [round(float(c), 2) for c in data["Close"].tail(180).tolist()]
+    prompt = (
+        "Predict the next "
+        f"{days} closing prices based on this series: {closes} "
+        f"and an average news sentiment of {sentiment:.3f}. "
+        f"{_indicator_summary(indicators)}"
+        "Respond with numbers only."
+    )
+    text = _ask_gpt(prompt)
+    if text is None:
+        return None
+    nums = re.findall(r"-?\d+\.\d+|-?\d+", text)
+    out = [float(n) for n in nums][:days]
+    if len(out) == days:
+        return out
+    return None
+
+
+def _indicator_summary(indicators):
+    """Describe the latest indicator values for a GPT prompt."""
+    if indicators is None or indicators.empty:
+        return ""
+    last = indicators.iloc[-1]
+    if last[["rsi", "macd_hist", "atr"]].isna().any():
+        return ""
+    return (
+        f"Latest indicators: RSI(14) {last['rsi']:.1f}, "
+        f"MACD histogram {last['macd_hist']:.3f}, ATR(14) {last['atr']:.3f}. "
+    )
+
+
+def _indicator_forecast(closes, indicators, days, sentiment):
+    """Forecast with a least-squares model of the next close change.
+
+    The features are the last change, RSI distance from 50 and the MACD
+    histogram relative to price. Indicators are only known up to today,
+    so their contribution halves with every step ahead.
+    """
+    import numpy as np
+
+    ind = indicators.reindex(closes.index)
+    diffs = closes.diff()
+    features = np.column_stack(
+        [
+            np.ones(len(closes)),
+            diffs,
+            (ind["rsi"] - 50) / 50,
+            ind["macd_hist"] / closes,
+        ]
+    )
+    target = diffs.shift(-1).to_numpy()
+    rows = ~np.isnan(features).any(axis=1) & ~np.isnan(target)
+    if rows.sum() < INDICATOR_MIN_ROWS or np.isnan(features[-1]).any():
+        return None
+    coef, *_ = np.linalg.lstsq(features[rows], target[rows], rcond=None)
+
+    current_price = float(closes.iloc[-1])
+    last = features[-1].copy()
+    predictions = []
+    for _ in range(days):
+        next_diff = float(last @ coef)
+        if sentiment > 0.1:
+            next_diff *= 1.05
+        elif sentiment < -0.1:
+            next_diff *= 0.95
+        current_price += next_diff
+        predictions.append(current_price)
+        last[1] = next_diff
+        last[2:] *= 0.5
+    return predictions
+
+
+@timed("forecast")
+def predict_prices(data, days=5, sentiment=0.0, indicators=None):
+    """Predict future close prices using GPT or an AR(1) fallback.
+
+    ``indicators`` (see ``indicators.indicators_for``) adds RSI and MACD
+    to the GPT prompt and to the fallback regression.
+    """
+    if data is None or data.empty or "Close" not in data:
+        return []
+
+    preds = gpt_predict_prices(data, days, sentiment, indicators)
+    if preds is not None:
+        return preds
+
+    closes = data["Close"]
+    if len(closes) < 3:
+        return []
+
+    if indicators is not None:
+        preds = _indicator_forecast(closes.astype(float), indicators, days, sentiment)
+        if preds is not None:
+            return preds
+
+    diffs = closes.diff().dropna()
+    x = diffs.iloc[:-1]
+    y = diffs.iloc[1:]
+    if len(x) == 0:
+        return []
+
+    x_mean = x.mean()
+    y_mean = y.mean()
+    denom = ((x - x_mean) ** 2).sum()
+    slope = ((x - x_mean) * (y - y_mean)).sum() / denom if denom != 0 else 0.0
+    intercept = y_mean - slope * x_mean
+
+    current_price = closes.iloc[-1]
+    last_diff = diffs.iloc[-1]
+    predictions = []
+    for _ in range(days):
+        next_diff = intercept + slope * last_diff
+        if sentiment > 0.1:
+            next_diff *= 1.05
+        elif sentiment < -0.1:
+            next_diff *= 0.95
+        current_price += next_diff
+        predictions.append(float(current_price))
+        last_diff = next_diff
+    return predictions
+
+
+@timed("news")
+def fetch_news(ticker):
+    """Return recent news articles for the given ticker from the news store.
+
+    ``python news.py`` (or the job scheduler) keeps the store filled. A
+    ticker that was never polled is ingested once here so a first view is
+    not empty.
+    """
+    from news import ingest, recent_news, was_polled
+
+    if not was_polled(ticker):
+        try:
+            ingest(ticker)
+        except Exception:
+            pass
+    return recent_news(ticker)
+
+
+@timed("gpt_sentiment")
+def gpt_sentiment(news):
+    """Return sentiment score using GPT if API key set."""
+    if not news:
+        return None
+    text = "\n".join(n["title"] for n in news)
+    prompt = (
+        "Give a single sentiment score between -1 and 1 for these headlines:"
+        f"\n{text}\nScore:"
+    )
+    out = _ask_gpt(prompt)
+    if out is None:
+        return None
+    match = re.search(r"-?\d+\.\d+|-?\d+", out)
+    if match:
+        return float(match.group())
+    return None
+
+
+def _sentiment_analyzer():
+    """Return a shared VADER analyzer; loading its lexicon is slow."""
+    global _analyzer
+    if _analyzer is None:
+        from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+
+        _analyzer = SentimentIntensityAnalyzer()
+    return _analyzer
+
+
+@timed("sentiment")
+def analyze_sentiment(news):
+    """Return sentiment score averaged over news titles or via GPT."""
+    if not news:
+        return 0.0
+    score = gpt_sentiment(news)
+    if score is not None:
+        return score
+    analyzer = _sentiment_analyzer()
+    scores = [analyzer.polarity_scores(n["title"])["compound"] for n in news]
+    return sum(scores) / len(scores)
+
+
+def sentiment_to_label(score):
+    """Return human readable sentiment label."""
+    if score > 0.1:
+        return "긍정적"
+    if score < -0.1:
+        return "부정적"
+    return "보통"
+
+
+@timed("gpt_explain")
+def gpt_explain_predictions(predictions, sentiment, news):
+    """Return GPT reasoning for the predicted prices if possible."""
+    if not predictions:
+        return ""
+    titles = "\n".join(n["title"] for n in news) if news else ""
+    prompt = (
+        "다음 종가 예측 값들을 참고하여 왜 이런 결과가 예상되는지 200토큰으로 간단히 말해 "
+        "한국어로 설명해줘."
+        f"\n예측: {predictions}\n뉴스 감정: {sentiment:.3f}\n"
+        f"제목들:\n{titles}"
+    )
+    return (_ask_gpt(prompt, max_tokens=300) or "").strip()
+
+
+@timed("simulation")
+def run_simulation(data, predictions, balance, indicators=None):
+    """Simulate adaptive trading based on predicted prices.
+
+    With ``indicators`` no position is opened while the latest RSI is at or
+    above ``RSI_OVERBOUGHT``.
+    """
+    if data is None or data.empty or "Close" not in data or not predictions:
+        return [], [], ""
+    import pandas as pd
+
+    last_date = data.index[-1]
+    start_price = float(data["Close"].iloc[-1])
+    current_price = start_price
+    no_buy_expected = not any(p > start_price for p in predictions)
+    cash = balance
+    shares = 0.0
+    trades = []
+    results = []
+    bought = False
+    rsi = None
+    if indicators is not None and not indicators.empty:
+        rsi = indicators["rsi"].iloc[-1]
+    overbought = rsi is not None and rsi >= RSI_OVERBOUGHT
+
+    for i, price in enumerate(predictions, start=1):
+        date = (last_date + pd.Timedelta(days=i)).strftime("%Y-%m-%d")
+        action = None
+
+        if (
+            price > current_price
+            and price > start_price
+            and cash >= current_price
+            and not overbought
+        ):
+            # Buy as price expected to rise beyond the starting price
+            shares_to_buy = cash / current_price
+            cash -= shares_to_buy * current_price
+            shares += shares_to_buy
+            action = "BUY"
+            bought = True
+        elif price < current_price and shares > 0:
+            # Sell if price expected to drop
+            cash += shares * current_price
+            shares = 0
+            action = "SELL"
+
+        value = cash + shares * price
+        results.append({"date": date, "value": value})
+
+        if action:
+            trades.append(
+                {
+                    "date": date,
+                    "action": action,
+                    "shares": shares,
+                    "price": current_price,
+                    "value": value,
+                }
+            )
+
+        current_price = price
+
+    # Final sell if still holding shares
+    if shares > 0:
+        cash += shares * current_price
+        trades.append(
+            {
+                "date": (last_date + pd.Timedelta(days=len(predictions))).strftime(
+                    "%Y-%m-%d"
+                ),
+                "action": "SELL",
+                "shares": shares,
+                "price": current_price,
+                "value": cash,
+            }
+        )
+        shares = 0
+
+    if bought and not no_buy_expected:
+        note = ""
+    elif overbought and not no_buy_expected:
+        note = f"RSI {rsi:.1f}로 과매수 구간이라 해당기간내에 매수하지 않았습니다."
+    else:
+        note = "지속적인 하락새로 인한 해당기간내에 매수의견이 없습니다."
+    return results, trades, note
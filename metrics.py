@@ -0,0 +1,147 @@
+"""In-process latency histograms and counters.
+
+Functions wrapped with ``timed`` record how long each stage takes. Inside a
+Flask request the stage times are also summed per request and sent back in a
+``Server-Timing`` header. ``render`` formats everything in the Prometheus text
+format for ``/metrics``. Each process, including each Gunicorn worker, keeps
+its own numbers.
+"""
+import functools
+import sys
+import threading
+import time
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+HELP = {
+    "stage_duration_seconds": ("histogram", "Time spent in an instrumented stage"),
+    "stage_errors_total": ("counter", "Instrumented stage calls that raised"),
+    "http_request_duration_seconds": ("histogram", "Request latency by endpoint"),
+    "polygon_requests_total": ("counter", "Polygon REST requests by endpoint"),
+    "polygon_response_bytes_total": ("counter", "Polygon response body bytes by endpoint"),
+    "tick_trades_total": ("counter", "Trades downloaded by fetch_ticks"),
+}
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def observe(name, seconds, **labels):
+    """Add one ``seconds`` sample to histogram ``name``."""
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [[0] * len(BUCKETS), 0.0, 0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                hist[0][i] += 1
+                break
+        hist[1] += seconds
+        hist[2] += 1
+
+
+def inc(name, value=1, **labels):
+    """Increase counter ``name`` by ``value``."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def _request_timings():
+    # only touch Flask when it is loaded and a request is active
+    flask = sys.modules.get("flask")
+    if flask is None or not flask.has_request_context():
+        return None
+    if "timings" not in flask.g:
+        flask.g.timings = {}
+    return flask.g.timings
+
+
+class timed:
+    """Time a stage; use as ``with timed("name"):`` or ``@timed("name")``."""
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        observe("stage_duration_seconds", elapsed, stage=self.stage)
+        if exc_type is not None:
+            inc("stage_errors_total", stage=self.stage)
+        timings = _request_timings()
+        if timings is not None:
+            timings[self.stage] = timings.get(self.stage, 0.0) + elapsed
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(self.stage):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+
+def _labels(pairs, extra=()):
+    items = list(pairs) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+def render():
+    """Return all metrics in the Prometheus text exposition format."""
+    with _lock:
+        histograms = {k: (list(v[0]), v[1], v[2]) for k, v in _histograms.items()}
+        counters = dict(_counters)
+    lines = []
+    for name, (kind, text) in HELP.items():
+        lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "histogram":
+            for (metric, labels), (buckets, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, n in zip(BUCKETS, buckets):
+                    cumulative += n
+                    lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {count}")
+                lines.append(f"{name}_sum{_labels(labels)} {total}")
+                lines.append(f"{name}_count{_labels(labels)} {count}")
+        else:
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def init_app(app):
+    """Time every request and attach the ``Server-Timing`` breakdown."""
+    from flask import g, request
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def add_server_timing(response):
+        started = g.get("request_started")
+        if started is None:
+            return response
+        total = time.perf_counter() - started
+        observe("http_request_duration_seconds", total, endpoint=request.endpoint or "unknown")
+        parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in g.get("timings", {}).items()]
+        parts.append(f"total;dur={total * 1000:.1f}")
+        response.headers["Server-Timing"] = ", ".join(parts)
+        return response
@@ -0,0 +1,228 @@
+"""News ingestion into SQLite with deduplication and a full-text index.
+
+``poll`` fetches headlines for many tickers concurrently and stores each
+article once. An article is a duplicate when its normalized URL or its
+normalized title was seen before, so syndicated copies of a story collapse
+into one row that is linked to every ticker it mentions. Titles are indexed
+in ``news_fts`` for ``search``, and ``recent_news`` serves the stock page
+from the per-ticker time index without any network access.
+
+    python news.py                 # poll every saved ticker every NEWS_INTERVAL
+    python news.py poll AAPL MSFT  # poll once
+    python news.py search "rate cut" [--ticker AAPL]
+"""
+import calendar
+import hashlib
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from db import get_db
+from providers import get_provider
+
+# Tickers fetched concurrently by ``poll``
+NEWS_WORKERS = int(os.getenv("NEWS_WORKERS", "8"))
+# Seconds between polls of every saved ticker
+NEWS_INTERVAL = int(os.getenv("NEWS_INTERVAL", "900"))
+# Articles requested per ticker and poll
+NEWS_FETCH_LIMIT = 50
+# Articles shown on a stock page
+NEWS_LIMIT = 5
+RSS_URL = "https://feeds.finance.yahoo.com/rss/2.0/headline?s={ticker}&region=US&lang=en-US"
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def url_hash(url):
+    """Hash ``url`` ignoring scheme, ``www.``, fragment and a trailing slash."""
+    url = url.strip().split("#", 1)[0]
+    url = re.sub(r"^[a-z]+://(www\.)?", "", url, flags=re.IGNORECASE)
+    host, _, rest = url.partition("/")
+    key = host.lower() + "/" + rest.rstrip("/")
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def title_hash(title):
+    """Hash ``title`` ignoring case, punctuation and spacing."""
+    key = " ".join(_WORD_RE.findall(title.casefold()))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def _rss_news(ticker, limit=NEWS_FETCH_LIMIT):
+    """Return headlines from the Yahoo Finance RSS feed."""
+    import feedparser
+
+    feed = feedparser.parse(RSS_URL.format(ticker=ticker))
+    news = []
+    for entry in feed.entries[:limit]:
+        published = entry.get("published_parsed")
+        news.append(
+            {
+                "title": entry.title,
+                "link": entry.link,
+                "publisher": entry.get("source", {}).get("title"),
+                "published": calendar.timegm(published) if published else None,
+            }
+        )
+    return news
+
+
+def store(ticker, articles):
+    """Store ``articles`` for ``ticker``; return how many were new to it."""
+    conn = get_db()
+    now = time.time()
+    added = 0
+    for a in articles:
+        if not a.get("title") or not a.get("link"):
+            continue
+        u, t = url_hash(a["link"]), title_hash(a["title"])
+        published = a.get("published") or int(now)
+        # insert first: a concurrent poll of another ticker may store the same story
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO news (url_hash, title_hash, url, title, publisher, published_at, fetched_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (u, t, a["link"], a["title"], a.get("publisher"), published, now),
+        )
+        if cur.rowcount:
+            news_id = cur.lastrowid
+            conn.execute(
+                "INSERT INTO news_fts (rowid, title, publisher) VALUES (?, ?, ?)",
+                (news_id, a["title"], a.get("publisher") or ""),
+            )
+        else:
+            row = conn.execute(
+                "SELECT id, published_at FROM news WHERE url_hash = ? OR title_hash = ?", (u, t)
+            ).fetchone()
+            news_id, published = row["id"], row["published_at"]
+        added += conn.execute(
+            "INSERT OR IGNORE INTO news_tickers (ticker, published_at, news_id) VALUES (?, ?, ?)",
+            (ticker, published, news_id),
+        ).rowcount
+    conn.commit()
+    return added
+
+
+def ingest(ticker):
+    """Fetch and store new headlines for ``ticker``; return the number added.
+
+    Only articles newer than the ticker's latest stored one are requested.
+    A remote provider that returns nothing (or fails) falls back to the
+    Yahoo RSS feed; the local provider never touches the network.
+    """
+    conn = get_db()
+    row = conn.execute(
+        "SELECT MAX(published_at) AS latest FROM news_tickers WHERE ticker = ?", (ticker,)
+    ).fetchone()
+    provider = get_provider()
+    error = None
+    try:
+        articles = provider.news(ticker, limit=NEWS_FETCH_LIMIT, since=row["latest"])
+    except Exception as e:
+        articles, error = [], str(e)
+    if not articles and provider.remote and (error or row["latest"] is None):
+        try:
+            articles, error = _rss_news(ticker), None
+        except Exception as e:
+            error = error or str(e)
+    added = store(ticker, articles)
+    conn.execute(
+        "INSERT OR REPLACE INTO news_polls (ticker, polled_at, added, error) VALUES (?, ?, ?, ?)",
+        (ticker, time.time(), added, error),
+    )
+    conn.commit()
+    return added
+
+
+def poll(tickers, workers=NEWS_WORKERS):
+    """Ingest news for ``tickers`` concurrently; return ``{ticker: added}``.
+
+    Each thread uses its own database connection. Requests go through the
+    shared Polygon rate limiter, so ``workers`` bounds the connections in
+    flight rather than the request rate.
+    """
+    if not tickers:
+        return {}
+    with ThreadPoolExecutor(max(1, min(workers, len(tickers)))) as pool:
+        return dict(zip(tickers, pool.map(ingest, tickers)))
+
+
+def _rows(rows):
+    return [
+        {
+            "title": r["title"],
+            "link": r["url"],
+            "publisher": r["publisher"],
+            "published": r["published_at"],
+        }
+        for r in rows
+    ]
+
+
+def recent_news(ticker, limit=NEWS_LIMIT):
+    """Return the newest stored articles for ``ticker``."""
+    rows = get_db().execute(
+        "SELECT n.title, n.url, n.publisher, n.published_at FROM news_tickers t "
+        "JOIN news n ON n.id = t.news_id WHERE t.ticker = ? "
+        "ORDER BY t.published_at DESC LIMIT ?",
+        (ticker, limit),
+    ).fetchall()
+    return _rows(rows)
+
+
+def was_polled(ticker):
+    row = get_db().execute("SELECT 1 FROM news_polls WHERE ticker = ?", (ticker,)).fetchone()
+    return row is not None
+
+
+def _fts_query(text):
+    # quote each word so user input never reaches FTS5 query syntax
+    return " ".join('"' + w.replace('"', '""') + '"' for w in text.split())
+
+
+def search(text, ticker=None, limit=50):
+    """Return stored articles whose title or publisher match every word of ``text``."""
+    if not text.strip():
+        return []
+    query = (
+        "SELECT n.title, n.url, n.publisher, n.published_at FROM news_fts "
+        "JOIN news n ON n.id = news_fts.rowid WHERE news_fts MATCH ?"
+    )
+    params = [_fts_query(text)]
+    if ticker:
+        query += " AND n.id IN (SELECT news_id FROM news_tickers WHERE ticker = ?)"
+        params.append(ticker)
+    rows = get_db().execute(query + " ORDER BY n.published_at DESC LIMIT ?", (*params, limit))
+    return _rows(rows.fetchall())
+
+
+def _watchlist():
+    return [row["ticker"] for row in get_db().execute("SELECT ticker FROM tickers")]
+
+
+def main():
+    import db
+
+    db.init_db()
+    args = sys.argv[1:]
+    if args and args[0] == "search":
+        ticker = args[args.index("--ticker") + 1].upper() if "--ticker" in args else None
+        words = [a for a in args[1:] if a not in ("--ticker", ticker)]
+        for n in search(" ".join(words), ticker):
+            when = time.strftime("%Y-%m-%d %H:%M", time.gmtime(n["published"]))
+            print(f"{when}  {n['title']}  ({n['publisher'] or ''})")
+        return
+    if args and args[0] == "poll":
+        added = poll([t.upper() for t in args[1:]] or _watchlist())
+        print(f"{sum(added.values())} new articles for {len(added)} tickers")
+        return
+    while True:
+        started = time.time()
+        added = poll(_watchlist())
+        print(f"{sum(added.values())} new articles for {len(added)} tickers in {time.time() - started:.1f}s")
+        time.sleep(NEWS_INTERVAL)
+
+
+if __name__ == "__main__":
+    main()
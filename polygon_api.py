@@ -0,0 +1,63 @@
+import os
+import threading
+import time
+
+import metrics
+
+POLYGON_API_KEY = os.getenv("POLYGON_API_KEY")
+POLYGON_BASE_URL = os.getenv("POLYGON_BASE_URL", "https://api.polygon.io")
+# Requests per second allowed across the whole process (0 disables throttling)
+POLYGON_RATE_LIMIT = float(os.getenv("POLYGON_RATE_LIMIT", "0"))
+# Maximum number of Polygon requests in flight at once
+POLYGON_MAX_CONCURRENCY = int(os.getenv("POLYGON_MAX_CONCURRENCY", "8"))
+
+_session = None
+_slots = threading.BoundedSemaphore(POLYGON_MAX_CONCURRENCY)
+_rate_lock = threading.Lock()
+_next_request_at = 0.0
+
+
+def _throttle():
+    """Block until the shared rate limit allows another request."""
+    global _next_request_at
+    if POLYGON_RATE_LIMIT <= 0:
+        return
+    with _rate_lock:
+        now = time.monotonic()
+        wait = _next_request_at - now
+        _next_request_at = max(now, _next_request_at) + 1.0 / POLYGON_RATE_LIMIT
+    if wait > 0:
+        time.sleep(wait)
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        with _rate_lock:
+            if _session is None:
+                import requests
+
+                _session = requests.Session()
+    return _session
+
+
+def get_json(url, params=None, timeout=10, endpoint="other"):
+    """GET a Polygon URL and return the decoded JSON body.
+
+    ``url`` may be a path relative to ``POLYGON_BASE_URL`` or an absolute
+    ``next_url`` cursor. All callers share one rate limit and connection pool.
+    ``endpoint`` labels the request and byte counters in ``metrics``.
+    """
+    if not POLYGON_API_KEY:
+        raise ValueError("POLYGON_API_KEY not set")
+    if not url.startswith("http"):
+        url = POLYGON_BASE_URL + url
+    params = dict(params or {})
+    params["apiKey"] = POLYGON_API_KEY
+    with _slots:
+        _throttle()
+        with metrics.timed(f"polygon_{endpoint}"):
+            resp = _get_session().get(url, params=params, timeout=timeout)
+    metrics.inc("polygon_requests_total", endpoint=endpoint)
+    metrics.inc("polygon_response_bytes_total", len(resp.content), endpoint=endpoint)
+    return resp.json()
@@ -0,0 +1,293 @@
+"""Multi-asset portfolio simulation over daily bars in the local bar store.
+
+Prices are held as a ``(tickers, time)`` matrix. Forecasts, weights,
+rebalance growth and the daily value curve are computed for every ticker
+and date at once, so the cost grows with the number of array operations
+rather than with tickers × days.
+"""
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+from db import get_db
+
+# Trailing bars used to fit each ticker's AR(1) forecast of daily changes
+PORTFOLIO_LOOKBACK = int(os.getenv("PORTFOLIO_LOOKBACK", "60"))
+# Largest weight any single ticker may receive at a rebalance
+PORTFOLIO_MAX_WEIGHT = float(os.getenv("PORTFOLIO_MAX_WEIGHT", "0.2"))
+# Cost of trading, in basis points of the value traded
+PORTFOLIO_COST_BPS = float(os.getenv("PORTFOLIO_COST_BPS", "5"))
+# Weight multiplier per unit of news sentiment (-1..1)
+SENTIMENT_TILT = 0.5
+# Calendar periods a rebalance happens at the first bar of, and bars per period
+REBALANCE = {"weekly": ("W", 5), "monthly": ("M", 21), "quarterly": ("Q", 63)}
+TRADING_DAYS = 252
+
+
+def load_prices(tickers, kind="1d", start=None):
+    """Return ``(tickers, dates, prices)`` with prices shaped ``(tickers, time)``.
+
+    Gaps are forward-filled; bars before a ticker's first one stay NaN.
+    Tickers without any stored bars are dropped.
+    """
+    query = (
+        f"SELECT ticker, ts, close FROM bars WHERE kind = ? "
+        f"AND ticker IN ({','.join('?' * len(tickers))})"
+    )
+    params = [kind, *tickers]
+    if start is not None:
+        query += " AND ts >= ?"
+        params.append(int(pd.Timestamp(start).value // 1_000_000))
+    cursor = get_db().cursor()
+    # plain tuples; building a Row per bar dominates for large universes
+    cursor.row_factory = None
+    rows = cursor.execute(query, params).fetchall()
+    if not rows:
+        return [], pd.DatetimeIndex([]), np.empty((0, 0))
+    names, stamps, closes = zip(*rows)
+    names = np.array(names)
+    stamps = np.array(stamps, dtype=np.int64)
+    closes = np.array(closes, dtype=np.float64)
+    found, row_idx = np.unique(names, return_inverse=True)
+    times, col_idx = np.unique(stamps, return_inverse=True)
+    prices = np.full((len(found), len(times)), np.nan)
+    prices[row_idx, col_idx] = closes
+    # forward fill along time: index of the last valid column at each position
+    valid = ~np.isnan(prices)
+    last = np.where(valid, np.arange(len(times)), 0)
+    np.maximum.accumulate(last, axis=1, out=last)
+    prices = np.take_along_axis(prices, last, axis=1)
+    prices[np.cumsum(valid, axis=1) == 0] = np.nan
+    return found.tolist(), pd.to_datetime(times, unit="ms"), prices
+
+
+def _rolling_sum(values, window):
+    """Trailing ``window`` sums along time; NaN until the window is full."""
+    csum = np.cumsum(np.nan_to_num(values), axis=1)
+    out = np.full(values.shape, np.nan)
+    out[:, window - 1 :] = csum[:, window - 1 :]
+    out[:, window:] -= csum[:, :-window]
+    return out
+
+
+def expected_returns(prices, horizon, lookback=PORTFOLIO_LOOKBACK):
+    """Forecast every ticker's return over ``horizon`` bars from each date.
+
+    This is the AR(1) model of ``market.predict_prices`` fitted on a trailing
+    ``lookback`` window of daily changes. The rolling regression sums come
+    from cumulative sums, and the forecast is iterated ``horizon`` times over
+    the whole matrix.
+    """
+    diffs = np.diff(prices, axis=1, prepend=np.nan)
+    x = np.roll(diffs, 1, axis=1)
+    x[:, 0] = np.nan
+    pairs = ~np.isnan(x) & ~np.isnan(diffs)
+    x0, y0 = np.where(pairs, x, 0.0), np.where(pairs, diffs, 0.0)
+    n = _rolling_sum(pairs.astype(float), lookback)
+    sx, sy = _rolling_sum(x0, lookback), _rolling_sum(y0, lookback)
+    sxx, sxy = _rolling_sum(x0 * x0, lookback), _rolling_sum(x0 * y0, lookback)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        denom = sxx - sx * sx / n
+        slope = np.where(denom > 0, (sxy - sx * sy / n) / denom, 0.0)
+        intercept = (sy - slope * sx) / n
+        last_diff = np.nan_to_num(diffs)
+        total = np.zeros(prices.shape)
+        for _ in range(horizon):
+            last_diff = intercept + slope * last_diff
+            total += last_diff
+        out = total / prices
+    out[n < lookback - 1] = np.nan
+    return out
+
+
+def target_weights(forecast, sentiment, max_weight=PORTFOLIO_MAX_WEIGHT):
+    """Allocate to positive forecasts in proportion to their size.
+
+    ``forecast`` is ``(tickers, rebalances)``. Sentiment scales each
+    ticker's forecast by ``1 + SENTIMENT_TILT * sentiment``. Weights are
+    capped at ``max_weight``, and whatever cannot be placed stays in cash.
+    """
+    score = np.nan_to_num(forecast, nan=0.0) * (1 + SENTIMENT_TILT * sentiment)[:, None]
+    score = np.clip(score, 0.0, None)
+    total = score.sum(axis=0)
+    weights = np.divide(score, total, out=np.zeros_like(score), where=total > 0)
+    # redistribute the excess over the cap, a few passes suffice
+    for _ in range(10):
+        capped = weights >= max_weight
+        excess = np.clip(weights - max_weight, 0.0, None).sum(axis=0)
+        weights = np.minimum(weights, max_weight)
+        free = np.where(capped, 0.0, weights)
+        free_total = free.sum(axis=0)
+        weights += np.divide(free, free_total, out=np.zeros_like(free), where=free_total > 0) * excess
+        if np.all(excess < 1e-12):
+            break
+    return np.minimum(weights, max_weight)
+
+
+def latest_sentiment(tickers):
+    """Return the precomputed news sentiment for each ticker (0 if none)."""
+    rows = get_db().execute(
+        f"SELECT ticker, sentiment FROM precomputed "
+        f"WHERE ticker IN ({','.join('?' * len(tickers))})",
+        tickers,
+    ).fetchall()
+    found = {r["ticker"]: r["sentiment"] or 0.0 for r in rows}
+    return np.array([found.get(t, 0.0) for t in tickers])
+
+
+def simulate_portfolio(
+    tickers,
+    seed=10000.0,
+    years=3,
+    rebalance="monthly",
+    max_weight=PORTFOLIO_MAX_WEIGHT,
+    cost_bps=PORTFOLIO_COST_BPS,
+    sentiment=None,
+):
+    """Simulate a forecast-weighted portfolio of ``tickers`` over stored daily bars.
+
+    At the first bar of every ``rebalance`` period, weights are reset from
+    each ticker's forecast return to the next rebalance. Holdings then drift
+    with prices until the following one. ``sentiment`` defaults to the
+    latest precomputed news sentiment, which is known only today and so is
+    applied unchanged to every rebalance. The benchmark is an equal-weight
+    buy-and-hold of the same tickers.
+    """
+    if rebalance not in REBALANCE:
+        raise ValueError(f"Unknown rebalance schedule: {rebalance}")
+    if not tickers:
+        raise ValueError("No tickers to simulate")
+    freq, horizon = REBALANCE[rebalance]
+    start = pd.Timestamp.now("UTC").tz_localize(None) - pd.DateOffset(years=years)
+    # extra history so forecasts are fitted from the first simulated day
+    warmup = pd.Timedelta(days=int((PORTFOLIO_LOOKBACK + 2) * 365 / TRADING_DAYS) + 7)
+    names, dates, prices = load_prices(tickers, "1d", start - warmup)
+    if not names:
+        raise ValueError("No daily bars stored for these tickers")
+    if sentiment is None:
+        sentiment = latest_sentiment(names)
+    else:
+        sentiment = np.array([sentiment.get(t, 0.0) for t in names])
+
+    forecast = expected_returns(prices, horizon)
+    first = int((dates < start).sum())
+    periods = dates[first:].to_period(freq)
+    starts = np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]]) + first
+    ends = np.r_[starts[1:], len(dates) - 1]
+    if len(dates) - first < 2:
+        raise ValueError("Not enough daily bars in the simulation window")
+
+    weights = target_weights(forecast[:, starts], sentiment, max_weight)
+    weights[np.isnan(prices[:, starts])] = 0.0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio = np.nan_to_num(prices[:, ends] / prices[:, starts], nan=1.0)
+    cash = 1.0 - weights.sum(axis=0)
+    growth = (weights * ratio).sum(axis=0) + cash
+    # weights each segment drifts to, which the next rebalance trades from
+    drifted = np.divide(weights * ratio, growth, out=np.zeros_like(weights), where=growth > 0)
+    previous = np.column_stack([np.zeros(len(names)), drifted[:, :-1]])
+    turnover = np.abs(weights - previous).sum(axis=0)
+    after_cost = 1.0 - cost_bps / 10000 * turnover
+    # portfolio value right after each rebalance's trades
+    value_at = seed * np.cumprod(after_cost * np.r_[1.0, growth[:-1]])
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        shares = np.nan_to_num(weights * value_at / prices[:, starts])
+    segment = np.searchsorted(starts, np.arange(first, len(dates)), side="right") - 1
+    held = np.nan_to_num(prices[:, first:])
+    values = (shares[:, segment] * held).sum(axis=0) + (cash * value_at)[segment]
+
+    base = prices[:, first]
+    alive = ~np.isnan(base)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        bench_ratio = np.nan_to_num(prices[alive, first:] / base[alive, None], nan=1.0)
+    benchmark = seed * bench_ratio.mean(axis=0) if alive.any() else np.full(len(values), seed)
+
+    last = weights[:, -1]
+    holdings = [
+        {
+            "ticker": names[i],
+            "weight": float(last[i]),
+            "shares": float(shares[i, -1]),
+            "price": float(prices[i, starts[-1]]),
+            "forecast": float(forecast[i, starts[-1]]),
+        }
+        for i in np.argsort(-last)
+        if last[i] > 0
+    ]
+    return {
+        "tickers": names,
+        "dates": dates[first:].strftime("%Y-%m-%d").tolist(),
+        "values": values.tolist(),
+        "benchmark": benchmark.tolist(),
+        "holdings": holdings,
+        "stats": {
+            **performance(values),
+            "benchmark_return": float(benchmark[-1] / seed - 1),
+            "rebalances": int(len(starts)),
+            "avg_turnover": float(turnover.mean()),
+            "costs": float((value_at / after_cost * (1 - after_cost)).sum()),
+        },
+    }
+
+
+def performance(values):
+    """Return total return, CAGR, volatility, Sharpe and max drawdown."""
+    values = np.asarray(values, dtype=np.float64)
+    returns = np.diff(values) / values[:-1]
+    years = max(len(returns) / TRADING_DAYS, 1 / TRADING_DAYS)
+    vol = float(returns.std() * np.sqrt(TRADING_DAYS)) if len(returns) > 1 else 0.0
+    mean = float(returns.mean() * TRADING_DAYS) if len(returns) else 0.0
+    peak = np.maximum.accumulate(values)
+    return {
+        "final_value": float(values[-1]),
+        "total_return": float(values[-1] / values[0] - 1),
+        "cagr": float((values[-1] / values[0]) ** (1 / years) - 1),
+        "volatility": vol,
+        "sharpe": mean / vol if vol > 0 else 0.0,
+        "max_drawdown": float((values / peak - 1).min()),
+    }
+
+
+def main():
+    import db
+
+    db.init_db()
+
+    def option(name, default):
+        if name in sys.argv:
+            return type(default)(sys.argv[sys.argv.index(name) + 1])
+        return default
+
+    options = ("--seed", "--years", "--rebalance", "--max-weight", "--json")
+    tickers = [
+        a.upper()
+        for i, a in enumerate(sys.argv[1:], start=1)
+        if not a.startswith("--") and sys.argv[i - 1] not in options
+    ] or [row["ticker"] for row in get_db().execute("SELECT ticker FROM tickers")]
+    result = simulate_portfolio(
+        tickers,
+        seed=option("--seed", 10000.0),
+        years=option("--years", 3),
+        rebalance=option("--rebalance", "monthly"),
+        max_weight=option("--max-weight", PORTFOLIO_MAX_WEIGHT),
+    )
+    stats = result["stats"]
+    print(
+        f"{len(result['tickers'])} tickers, {result['dates'][0]} ~ {result['dates'][-1]}, "
+        f"{stats['rebalances']} rebalances"
+    )
+    for key in ("final_value", "total_return", "benchmark_return", "cagr", "volatility", "sharpe", "max_drawdown"):
+        print(f"{key:<18} {stats[key]:,.4f}")
+    for h in result["holdings"][:20]:
+        print(f"{h['ticker']:<8} {h['weight']:6.1%}  {h['shares']:12.4f} @ {h['price']:.2f}")
+    out = option("--json", "")
+    if out:
+        with open(out, "w") as f:
+            json.dump(result, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+"""Market data providers and bulk import of local OHLCV and tick files.
+
+``get_provider()`` returns the backend selected by ``MARKET_DATA_PROVIDER``:
+
+* ``polygon`` (default) calls the Polygon REST API.
+* ``local`` serves only what is stored on disk: the ``bars`` table for
+  history and snapshots and ``TICK_CACHE_DIR`` for ticks. It never touches
+  the network, so simulations and backtests run at disk speed.
+
+Every provider returns the same shapes: history as an OHLCV DataFrame, news as
+``title``/``link``/``publisher``/``published`` dicts (newest first, published
+as epoch seconds), snapshots keyed by ticker, and ticks as
+``ts``/``price``/``size`` arrays.
+
+Load years of data for the local backend with:
+
+    python providers.py import-bars FILE [--ticker T] [--interval 1d]
+    python providers.py import-ticks FILE [--ticker T]
+"""
+import os
+import re
+import sys
+import time
+
+import polygon_api
+
+MARKET_DATA_PROVIDER = os.getenv("MARKET_DATA_PROVIDER", "polygon")
+# Most bars Polygon returns for one aggregates request
+AGGS_LIMIT = 50000
+# Rows parsed per step when importing CSV or Parquet files
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "1000000"))
+
+# Accepted column names, lower-cased, for each field of an imported file
+BAR_COLUMNS = {
+    "ts": ("timestamp", "datetime", "date", "time", "t"),
+    "ticker": ("ticker", "symbol", "sym"),
+    "Open": ("open", "o"),
+    "High": ("high", "h"),
+    "Low": ("low", "l"),
+    "Close": ("close", "c"),
+    "Volume": ("volume", "v"),
+    "VWAP": ("vwap", "vw"),
+    "Trades": ("trades", "transactions", "n"),
+}
+TICK_COLUMNS = {
+    "ts": ("sip_timestamp", "timestamp", "ts", "time", "t"),
+    "ticker": ("ticker", "symbol", "sym"),
+    "price": ("price", "p"),
+    "size": ("size", "volume", "s"),
+}
+
+_provider = None
+
+
+def _epoch(iso):
+    """Parse an ISO 8601 timestamp (``Z`` suffix allowed) to epoch seconds."""
+    import datetime as dt
+
+    if not iso:
+        return None
+    try:
+        return int(dt.datetime.fromisoformat(iso.replace("Z", "+00:00")).timestamp())
+    except ValueError:
+        return None
+
+
+class PolygonProvider:
+    """Market data from the Polygon REST API."""
+
+    name = "polygon"
+    remote = True
+
+    def history(self, ticker, interval, start, end):
+        import pandas as pd
+
+        # ``1m``, ``5m``, ``1h``, ``1d`` map to ``range/{multiplier}/{timespan}``
+        m = re.match(r"(\d+)([a-zA-Z]+)", interval)
+        multiplier = int(m.group(1)) if m else 1
+        unit = m.group(2).lower() if m else "d"
+        unit_map = {"m": "minute", "min": "minute", "h": "hour", "d": "day"}
+        timespan = unit_map.get(unit, "day")
+        if timespan == "day":
+            bounds = start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+        else:
+            # intraday ranges take millisecond bounds, so an update asks only for new bars
+            bounds = int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+        url = f"/v2/aggs/ticker/{ticker}/range/{multiplier}/{timespan}/{bounds[0]}/{bounds[1]}"
+        params = {"adjusted": "true", "sort": "asc", "limit": AGGS_LIMIT}
+        data = polygon_api.get_json(url, params=params, endpoint="aggs")
+        # Polygon sometimes returns a "DELAYED" status even when data is valid,
+        # so treat it the same as "OK" when results are present.
+        if data.get("status") not in ("OK", "DELAYED") or not data.get("results"):
+            raise ValueError(f"Polygon error: {data}")
+        results = data["results"]
+        df = pd.DataFrame(
+            {
+                "Open": [r.get("o") for r in results],
+                "High": [r.get("h") for r in results],
+                "Low": [r.get("l") for r in results],
+                "Close": [r.get("c") for r in results],
+                "Volume": [r.get("v") for r in results],
+            },
+            index=pd.to_datetime([r.get("t") for r in results], unit="ms"),
+        )
+        return df.sort_index()
+
+    def news(self, ticker, limit=5, since=None):
+        params = {"ticker": ticker, "limit": limit, "order": "desc", "sort": "published_utc"}
+        if since:
+            params["published_utc.gt"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(since))
+        data = polygon_api.get_json("/v2/reference/news", params=params, endpoint="news")
+        news = []
+        for item in data.get("results", []):
+            title = item.get("title", "")
+            link = item.get("article_url")
+            publisher = item.get("publisher", {}).get("name")
+            if title and link:
+                news.append(
+                    {
+                        "title": title,
+                        "link": link,
+                        "publisher": publisher,
+                        "published": _epoch(item.get("published_utc")),
+                    }
+                )
+        return news
+
+    def snapshots(self, tickers):
+        data = polygon_api.get_json(
+            "/v2/snapshot/locale/us/markets/stocks/tickers",
+            params={"tickers": ",".join(tickers)},
+            endpoint="snapshot",
+        )
+        result = {}
+        for item in data.get("tickers") or []:
+            last = (item.get("lastTrade") or {}).get("p")
+            if not last:
+                last = (item.get("day") or {}).get("c") or (item.get("prevDay") or {}).get("c")
+            result[item.get("ticker")] = {
+                "price": last,
+                "change": item.get("todaysChange"),
+                "change_pct": item.get("todaysChangePerc"),
+                "minute": item.get("min") or {},
+            }
+        return result
+
+    def ticks(self, ticker, date):
+        import numpy as np
+        from anomalies import fetch_ticks
+
+        trades = fetch_ticks(ticker, date)
+        return {
+            "ts": np.array([t.get("sip_timestamp", 0) for t in trades], dtype=np.int64),
+            "price": np.array([t.get("price", 0.0) for t in trades], dtype=np.float64),
+            "size": np.array([t.get("size", 0) for t in trades], dtype=np.float64),
+        }
+
+
+class LocalProvider:
+    """Market data imported into ``stocks.db`` and the tick cache."""
+
+    name = "local"
+    remote = False
+
+    def history(self, ticker, interval, start, end):
+        from bars import load_bars
+
+        # everything up to ``end``: imported archives may stop long before today
+        df = load_bars(ticker, interval)
+        df = df[df.index <= (end.tz_localize(None) if end.tzinfo else end)]
+        if df.empty:
+            raise ValueError(
+                f"No local {interval} bars for {ticker}; import them with "
+                "python providers.py import-bars FILE"
+            )
+        return df[["Open", "High", "Low", "Close", "Volume"]]
+
+    def news(self, ticker, limit=5, since=None):
+        return []
+
+    def snapshots(self, tickers):
+        from bars import load_sparklines
+
+        result = {}
+        for ticker, closes in load_sparklines(tickers, "1d", 2).items():
+            last = closes[-1]
+            prev = closes[-2] if len(closes) > 1 else None
+            change = last - prev if prev else None
+            result[ticker] = {
+                "price": last,
+                "change": change,
+                "change_pct": change / prev * 100 if prev else None,
+                "minute": {},
+            }
+        return result
+
+    def ticks(self, ticker, date):
+        import numpy as np
+
+        # cached days are served before a provider is asked, so nothing is left
+        empty = np.array([], dtype=np.float64)
+        return {"ts": np.array([], dtype=np.int64), "price": empty, "size": empty}
+
+
+PROVIDERS = {"polygon": PolygonProvider, "local": LocalProvider}
+
+
+def get_provider():
+    """Return the shared provider selected by ``MARKET_DATA_PROVIDER``."""
+    global _provider
+    if _provider is None:
+        if MARKET_DATA_PROVIDER not in PROVIDERS:
+            raise ValueError(f"Unknown MARKET_DATA_PROVIDER: {MARKET_DATA_PROVIDER}")
+        _provider = PROVIDERS[MARKET_DATA_PROVIDER]()
+    return _provider
+
+
+def _read_chunks(path, chunk_rows=IMPORT_CHUNK_ROWS):
+    """Yield DataFrames of at most ``chunk_rows`` rows from a CSV or Parquet file."""
+    import pandas as pd
+
+    if path.endswith((".parquet", ".pq")):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Reading Parquet files requires pyarrow (pip install pyarrow)")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_rows)
+
+
+def _normalize(df, columns, required):
+    """Rename known column aliases to canonical names and check ``required``."""
+    lower = {c.lower(): c for c in df.columns}
+    renames = {}
+    for field, aliases in columns.items():
+        for alias in aliases:
+            if alias in lower:
+                renames[lower[alias]] = field
+                break
+    df = df.rename(columns=renames)
+    missing = [f for f in required if f not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    return df
+
+
+def _to_ns(values):
+    """Convert a timestamp column (epoch numbers or strings) to int64 ns UTC."""
+    import numpy as np
+    import pandas as pd
+
+    if pd.api.types.is_numeric_dtype(values):
+        raw = values.to_numpy(dtype=np.int64)
+        top = int(np.abs(raw).max()) if len(raw) else 0
+        # pick the epoch unit from the magnitude: ns, us, ms or s
+        for limit, scale in ((1e17, 1), (1e14, 1_000), (1e11, 1_000_000)):
+            if top >= limit:
+                return raw * scale
+        return raw * 1_000_000_000
+    return pd.to_datetime(values, utc=True).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+
+
+def import_bars(path, ticker=None, interval="1d"):
+    """Stream an OHLCV file into the ``bars`` table; return rows imported."""
+    import pandas as pd
+    from bars import save_bars
+
+    required = ["ts", "Open", "High", "Low", "Close", "Volume"]
+    total = 0
+    for chunk in _read_chunks(path):
+        chunk = _normalize(chunk, BAR_COLUMNS, required if ticker else required + ["ticker"])
+        chunk.index = pd.to_datetime(_to_ns(chunk["ts"]), unit="ns")
+        groups = [(ticker, chunk)] if ticker else chunk.groupby("ticker", sort=False)
+        for symbol, rows in groups:
+            save_bars(str(symbol).upper(), interval, rows)
+            total += len(rows)
+    return total
+
+
+def _write_tick_day(ticker, date, parts, written):
+    import numpy as np
+    from anomalies import TICK_CACHE_DIR
+
+    path = os.path.join(TICK_CACHE_DIR, ticker, f"{date}.npz")
+    ticks = {k: np.concatenate([p[k] for p in parts]) for k in ("ts", "price", "size")}
+    if (ticker, date) in written and os.path.exists(path):
+        # an unsorted file revisited this day; merge with what was written
+        with np.load(path) as cached:
+            ticks = {k: np.concatenate([cached[k], ticks[k]]) for k in ticks}
+    order = np.argsort(ticks["ts"], kind="stable")
+    ticks = {k: v[order] for k, v in ticks.items()}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp.npz"
+    np.savez_compressed(tmp, **ticks)
+    os.replace(tmp, path)
+    # bins derived from the old ticks are stale now
+    bins = os.path.join(TICK_CACHE_DIR, ticker, f"{date}.bins.npz")
+    if os.path.exists(bins):
+        os.remove(bins)
+    written.add((ticker, date))
+
+
+def import_ticks(path, ticker=None):
+    """Stream a trades file into the tick cache, one file per ticker and day.
+
+    Trades are grouped by session date in New York time. Days are written as
+    soon as the file has moved past them, so a time-sorted file never holds
+    more than about a day per ticker in memory.
+    """
+    import numpy as np
+    import pandas as pd
+    from anomalies import SESSION_TZ
+
+    required = ["ts", "price", "size"] if ticker else ["ts", "price", "size", "ticker"]
+    pending = {}
+    written = set()
+    total = 0
+    for chunk in _read_chunks(path):
+        chunk = _normalize(chunk, TICK_COLUMNS, required)
+        ts = _to_ns(chunk["ts"])
+        # New York calendar day as datetime64[D]; formatting per row is slow
+        local = pd.to_datetime(ts, unit="ns", utc=True).tz_convert(SESSION_TZ).tz_localize(None)
+        frame = pd.DataFrame(
+            {
+                "ticker": ticker or chunk["ticker"].astype(str).str.upper(),
+                "date": local.to_numpy().astype("datetime64[D]"),
+                "ts": ts,
+                "price": chunk["price"].to_numpy(dtype=np.float64),
+                "size": chunk["size"].to_numpy(dtype=np.float64),
+            }
+        )
+        for (symbol, day), rows in frame.groupby(["ticker", "date"], sort=False):
+            date = str(np.datetime64(day, "D"))
+            pending.setdefault((symbol, date), []).append(
+                {k: rows[k].to_numpy() for k in ("ts", "price", "size")}
+            )
+            total += len(rows)
+        current = str(frame["date"].min().to_datetime64().astype("datetime64[D]"))
+        for key in [k for k in pending if k[1] < current]:
+            _write_tick_day(*key, pending.pop(key), written)
+    for key, parts in pending.items():
+        _write_tick_day(*key, parts, written)
+    return total, len(written)
+
+
+def main():
+    import db
+
+    if len(sys.argv) < 3 or sys.argv[1] not in ("import-bars", "import-ticks"):
+        print("Usage: python providers.py import-bars FILE [--ticker T] [--interval 1d]")
+        print("       python providers.py import-ticks FILE [--ticker T]")
+        return
+    db.init_db()
+    path = sys.argv[2]
+    ticker = sys.argv[sys.argv.index("--ticker") + 1].upper() if "--ticker" in sys.argv else None
+    started = time.perf_counter()
+    if sys.argv[1] == "import-bars":
+        interval = sys.argv[sys.argv.index("--interval") + 1] if "--interval" in sys.argv else "1d"
+        rows = import_bars(path, ticker, interval)
+        print(f"Imported {rows} {interval} bars in {time.perf_counter() - started:.1f}s")
+    else:
+        rows, days = import_ticks(path, ticker)
+        print(f"Imported {rows} trades into {days} ticker-days in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
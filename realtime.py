@@ -0,0 +1,214 @@
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+
+POLYGON_API_KEY = os.getenv("POLYGON_API_KEY")
+POLYGON_WS_URL = os.getenv("POLYGON_WS_URL", "wss://socket.polygon.io/stocks")
+REALTIME_THRESHOLD = float(os.getenv("REALTIME_THRESHOLD", "3.0"))
+# Completed minutes required before a ticker can raise alerts
+WARMUP_MINUTES = 30
+# Gaps longer than this (e.g. overnight) are not counted as empty minutes
+MAX_GAP_MINUTES = 5
+NS_PER_MINUTE = 60_000_000_000
+
+
+class _TickerState:
+    __slots__ = ("minute", "count", "n", "mean", "m2", "limit", "alerted")
+
+    def __init__(self):
+        self.minute = None
+        self.count = 0
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.limit = math.inf
+        self.alerted = False
+
+
+class OnlineDetector:
+    """Flag minutes whose trade count jumps above a running baseline.
+
+    Every ticker keeps the current minute's count and a Welford running mean
+    and variance of its completed minutes, so each trade costs O(1). The alert
+    limit is recomputed once per minute; a trade only increments a counter and
+    compares it against that limit, alerting the first time it is crossed.
+    """
+
+    def __init__(self, threshold=REALTIME_THRESHOLD, warmup=WARMUP_MINUTES, on_alert=None):
+        self.threshold = threshold
+        self.warmup = warmup
+        self.on_alert = on_alert or print_alert
+        self.states = {}
+        self.trades = 0
+        self.alerts = 0
+
+    def _fold(self, state, count):
+        state.n += 1
+        delta = count - state.mean
+        state.mean += delta / state.n
+        state.m2 += delta * (count - state.mean)
+
+    def _roll(self, state, minute):
+        if state.minute is not None:
+            self._fold(state, state.count)
+            gap = minute - state.minute - 1
+            if 0 < gap <= MAX_GAP_MINUTES:
+                for _ in range(gap):
+                    self._fold(state, 0)
+        state.minute = minute
+        state.count = 0
+        state.alerted = False
+        if state.n >= self.warmup:
+            std = math.sqrt(state.m2 / (state.n - 1))
+            # Trade counts are at least Poisson-noisy
+            std = max(std, math.sqrt(max(state.mean, 1.0)))
+            state.limit = state.mean + self.threshold * std
+        else:
+            state.limit = math.inf
+
+    def observe(self, ticker, ts_ns, count=1):
+        """Record ``count`` trades for ``ticker`` at ``ts_ns`` nanoseconds."""
+        self.trades += count
+        state = self.states.get(ticker)
+        if state is None:
+            state = self.states[ticker] = _TickerState()
+        minute = ts_ns // NS_PER_MINUTE
+        if minute != state.minute:
+            if state.minute is not None and minute < state.minute:
+                return None  # late trade for an already closed minute
+            self._roll(state, minute)
+        state.count += count
+        if state.count > state.limit and not state.alerted:
+            state.alerted = True
+            self.alerts += 1
+            std = (state.limit - state.mean) / self.threshold
+            alert = {
+                "ticker": ticker,
+                "minute": minute * NS_PER_MINUTE,
+                "count": state.count,
+                "mean": state.mean,
+                "std": std,
+                "zscore": (state.count - state.mean) / std,
+            }
+            self.on_alert(alert)
+            return alert
+        return None
+
+
+def print_alert(alert):
+    ts = time.strftime("%Y-%m-%d %H:%M", time.gmtime(alert["minute"] / 1e9))
+    print(
+        f"[ALERT] {alert['ticker']} {ts}Z {alert['count']} trades "
+        f"(mean {alert['mean']:.1f}, z {alert['zscore']:.1f})"
+    )
+
+
+def replay(detector, tickers, date, speed=0.0):
+    """Feed cached ticks for ``date`` through ``detector`` in timestamp order.
+
+    ``speed`` replays at that multiple of real time; 0 replays as fast as
+    possible.
+    """
+    import numpy as np
+    from anomalies import load_ticks
+
+    names = []
+    stamps = []
+    for i, ticker in enumerate(tickers):
+        ts = load_ticks(ticker, date)["ts"]
+        names.append(ticker)
+        stamps.append((ts, np.full(len(ts), i, dtype=np.int32)))
+    if not stamps:
+        return
+    ts = np.concatenate([s[0] for s in stamps])
+    owner = np.concatenate([s[1] for s in stamps])
+    order = np.argsort(ts, kind="stable")
+    ts = ts[order].tolist()
+    owner = owner[order].tolist()
+    if not ts:
+        return
+
+    started = time.monotonic()
+    first = ts[0]
+    observe = detector.observe
+    for stamp, idx in zip(ts, owner):
+        if speed > 0:
+            wait = (stamp - first) / 1e9 / speed - (time.monotonic() - started)
+            if wait > 0:
+                time.sleep(wait)
+        observe(names[idx], stamp)
+
+
+async def stream(detector, tickers):
+    """Consume Polygon's real-time trade websocket until cancelled."""
+    import aiohttp
+
+    if not POLYGON_API_KEY:
+        raise ValueError("POLYGON_API_KEY not set")
+    observe = detector.observe
+    last_report = time.monotonic()
+    async with aiohttp.ClientSession() as session:
+        async with session.ws_connect(POLYGON_WS_URL, heartbeat=30) as ws:
+            await ws.send_json({"action": "auth", "params": POLYGON_API_KEY})
+            await ws.send_json(
+                {"action": "subscribe", "params": ",".join(f"T.{t}" for t in tickers)}
+            )
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    break
+                lag = 0.0
+                for event in json.loads(msg.data):
+                    if event.get("ev") != "T":
+                        if event.get("ev") == "status":
+                            print(event.get("message"))
+                        continue
+                    ts_ns = event["t"] * 1_000_000
+                    observe(event["sym"], ts_ns)
+                    lag = time.time() - ts_ns / 1e9
+                now = time.monotonic()
+                if now - last_report >= 60:
+                    print(
+                        f"{detector.trades} trades, {detector.alerts} alerts, "
+                        f"lag {lag:.2f}s across {len(detector.states)} tickers"
+                    )
+                    last_report = now
+
+
+def main():
+    args = sys.argv[1:]
+    date = None
+    if args and args[0] == "--replay":
+        if len(args) < 2:
+            print("Usage: python realtime.py --replay YYYY-MM-DD [TICKER ...]")
+            return
+        date = args[1]
+        args = args[2:]
+    tickers = [t.upper() for t in args]
+    if not tickers:
+        from db import get_db
+
+        conn = get_db()
+        tickers = [row["ticker"] for row in conn.execute("SELECT ticker FROM tickers")]
+    if not tickers:
+        print("Usage: python realtime.py [--replay YYYY-MM-DD] TICKER [TICKER ...]")
+        return
+
+    detector = OnlineDetector()
+    if date:
+        started = time.perf_counter()
+        replay(detector, tickers, date)
+        elapsed = time.perf_counter() - started
+        print(
+            f"Replayed {detector.trades} trades for {len(tickers)} tickers in "
+            f"{elapsed:.2f}s ({detector.trades / max(elapsed, 1e-9):,.0f} trades/s), "
+            f"{detector.alerts} alerts"
+        )
+    else:
+        asyncio.run(stream(detector, tickers))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 import sys
-from stocks import (
+from market import (
     fetch_news,
     analyze_sentiment,
     predict_prices,
@@ -8,6 +8,8 @@ from stocks import (
 
 def simulate(ticker, balance=10000, days=5):
     """Run an adaptive trading simulation using predicted prices."""
+    from indicators import indicators_for
+
     data = fetch_stock_history(ticker, period='6mo')
     if data.empty or 'Close' not in data:
         print('No data available for', ticker)
@@ -15,7 +17,8 @@ def simulate(ticker, balance=10000, days=5):
     last_close = float(data['Close'].iloc[-1])
     news = fetch_news(ticker)
     sentiment = analyze_sentiment(news)
-    predictions = predict_prices(data, days=days, sentiment=sentiment)
+    ind = indicators_for(ticker, '1d', data)
+    predictions = predict_prices(data, days=days, sentiment=sentiment, indicators=ind)
     if not predictions:
         print('Unable to generate predictions')
         return
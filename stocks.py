@@ -1,33 +1,49 @@
 from flask import (
     Blueprint,
+    jsonify,
     render_template_string,
     request,
     redirect,
     url_for,
 )
 import os
-import re
-import requests
-import feedparser
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
-import openai
-import pandas as pd
+import datetime as dt
 from dotenv import load_dotenv
-from anomalies import detect_anomalies
+from market import (  # noqa: F401  re-exported for existing importers
+    fetch_stock_history,
+    fetch_snapshots,
+    load_tick_bars,
+    gpt_predict_prices,
+    predict_prices,
+    fetch_news,
+    gpt_sentiment,
+    analyze_sentiment,
+    sentiment_to_label,
+    gpt_explain_predictions,
+    run_simulation,
+    SNAPSHOT_TTL,
+)
+from symbols import TICKER_RE, autocomplete, is_known, search_names
+from jobs import PRIORITY_USER, PRIORITY_VIEW, enqueue, load_precomputed
 
 load_dotenv()
 # Placeholder image used for social previews
 OG_IMAGE_URL = os.getenv("LOGO")
-POLYGON_API_KEY = os.getenv("POLYGON_API_KEY")
 
 from db import get_db
 from auth import login_required
+from metrics import timed
+from http_cache import conditional, time_bucket
 
 bp = Blueprint("stocks", __name__)
 
 
-def canvas_chart_block(dates, opens, highs, lows, closes, chart_type):
-    """Return HTML for a canvas-based stock chart."""
+def canvas_chart_block(dates, opens, highs, lows, closes, chart_type, overlays=None):
+    """Return HTML for a canvas-based stock chart.
+
+    ``overlays`` maps a label to a series aligned with ``dates`` (``None``
+    where undefined) that is drawn as a line over the prices.
+    """
     template = """
 <canvas id=\"chart\" width=\"800\" height=\"400\"></canvas>
 <script>
@@ -37,6 +53,8 @@ const highs = {{ highs|tojson }};
 const lows = {{ lows|tojson }};
 const closes = {{ closes|tojson }};
 const chartType = "{{ chart_type }}";
+const overlays = {{ overlays|tojson }};
+const overlayColors = ['orange', 'purple', 'teal', 'brown'];
 let offset = 0;
 let scale = 1;
 const canvas = document.getElementById('chart');
@@ -48,8 +66,9 @@ function draw(){
     ctx.clearRect(0, 0, canvas.width, canvas.height);
     const chartWidth = canvas.width - paddingRight;
     const chartHeight = canvas.height - paddingBottom;
-    const min = Math.min(...lows);
-    const max = Math.max(...highs);
+    const overlayValues = Object.values(overlays).flat().filter(v => v !== null);
+    const min = Math.min(...lows, ...overlayValues);
+    const max = Math.max(...highs, ...overlayValues);
     const range = max - min || 1;
     const step = chartWidth / (dates.length * scale);
     if(chartType === 'line'){
@@ -79,6 +98,23 @@ function draw(){
             ctx.fillRect(x - step*0.3, rectY, step*0.6, rectH);
         });
     }
+    Object.entries(overlays).forEach(([label, values], n)=>{
+        ctx.strokeStyle = overlayColors[n % overlayColors.length];
+        ctx.beginPath();
+        let drawing = false;
+        values.forEach((v,i)=>{
+            if(v === null){drawing = false; return;}
+            const x = (i - offset) * step;
+            const y = chartHeight - ((v - min) / range) * chartHeight;
+            if(drawing){ctx.lineTo(x,y);}else{ctx.moveTo(x,y); drawing = true;}
+        });
+        ctx.stroke();
+        ctx.fillStyle = ctx.strokeStyle;
+        ctx.font = '10px sans-serif';
+        ctx.textAlign = 'left';
+        ctx.textBaseline = 'top';
+        ctx.fillText(label, 4, 4 + n * 12);
+    });
     // axes
     ctx.strokeStyle = '#000';
     ctx.beginPath();
@@ -172,315 +208,25 @@ canvas.addEventListener('touchend', () => {drag=false; pinch=null;});
         lows=lows,
         closes=closes,
         chart_type=chart_type,
+        overlays=overlays or {},
     )
 
 
-def fetch_stock_history(ticker, period="1y", interval="1d"):
-    """Fetch historical stock prices from Polygon.io.
+def sparkline_points(closes, width=120, height=28, low=None, high=None):
+    """Return SVG polyline points scaling ``closes`` into the given box.
 
-    ``interval`` controls the aggregation resolution (e.g. ``1m``,
-    ``5m``, ``15m``, ``1h``, ``1d``) which maps to Polygon's
-    ``range/{multiplier}/{timespan}`` URL segments.
+    ``low`` and ``high`` fix the vertical scale, e.g. to share it between lines.
     """
-    if not POLYGON_API_KEY:
-        raise ValueError("POLYGON_API_KEY not set")
-
-    end_dt = pd.Timestamp.utcnow()
-    start_dt = end_dt - pd.Timedelta(days=365)
-
-    m = re.match(r"(\d+)([a-zA-Z]+)", interval)
-    multiplier = int(m.group(1)) if m else 1
-    unit = m.group(2).lower() if m else "d"
-    unit_map = {"m": "minute", "min": "minute", "h": "hour", "d": "day"}
-    timespan = unit_map.get(unit, "day")
-
-    url = (
-        f"https://api.polygon.io/v2/aggs/ticker/{ticker}/range/"
-        f"{multiplier}/{timespan}/"
-        f"{start_dt.strftime('%Y-%m-%d')}/{end_dt.strftime('%Y-%m-%d')}"
-    )
-    params = {"adjusted": "true", "sort": "asc", "apiKey": POLYGON_API_KEY}
-    resp = requests.get(url, params=params, timeout=10)
-    data = resp.json()
-    # Polygon sometimes returns a "DELAYED" status even when data is valid,
-    # so treat it the same as "OK" when results are present.
-    if data.get("status") not in ("OK", "DELAYED") or not data.get("results"):
-        raise ValueError(f"Polygon error: {data}")
-
-    results = data.get("results", [])
-    df = pd.DataFrame(
-        {
-            "Open": [r.get("o") for r in results],
-            "High": [r.get("h") for r in results],
-            "Low": [r.get("l") for r in results],
-            "Close": [r.get("c") for r in results],
-            "Volume": [r.get("v") for r in results],
-        },
-        index=pd.to_datetime([r.get("t") for r in results], unit="ms"),
-    )
-    df = df.sort_index()
-    days_map = {"5d": 5, "1mo": 22, "3mo": 66, "6mo": 132, "1y": 264}
-    days = days_map.get(period, 5)
-    return df.tail(days)
-
-
-def gpt_predict_prices(data, days, sentiment):
-    key = os.getenv("OPENAI_API_KEY")
-    if not key or data is None or data.empty or "Close" not in data:
-        return None
-    try:
-        client = openai.OpenAI(api_key=key)
-        closes = [round(float(c), 2) for c in data["Close"].tail(180).tolist()]
-        prompt = (
-            "Predict the next "
-            f"{days} closing prices based on this series: {closes} "
-            f"and an average news sentiment of {sentiment:.3f}. "
-            "Respond with numbers only."
-        )
-        resp = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0,
-        )
-        text = resp.choices[0].message.content
-        nums = re.findall(r"-?\d+\.\d+|-?\d+", text)
-        out = [float(n) for n in nums][:days]
-        if len(out) == days:
-            return out
-    except Exception:
-        pass
-    return None
-
-
-def predict_prices(data, days=5, sentiment=0.0):
-    """Predict future close prices using GPT or an AR(1) fallback."""
-    if data is None or data.empty or "Close" not in data:
-        return []
-
-    preds = gpt_predict_prices(data, days, sentiment)
-    if preds is not None:
-        return preds
-
-    closes = data["Close"]
-    if len(closes) < 3:
-        return []
-
-    diffs = closes.diff().dropna()
-    x = diffs.iloc[:-1]
-    y = diffs.iloc[1:]
-    if len(x) == 0:
-        return []
-
-    x_mean = x.mean()
-    y_mean = y.mean()
-    denom = ((x - x_mean) ** 2).sum()
-    slope = ((x - x_mean) * (y - y_mean)).sum() / denom if denom != 0 else 0.0
-    intercept = y_mean - slope * x_mean
-
-    current_price = closes.iloc[-1]
-    last_diff = diffs.iloc[-1]
-    predictions = []
-    for _ in range(days):
-        next_diff = intercept + slope * last_diff
-        if sentiment > 0.1:
-            next_diff *= 1.05
-        elif sentiment < -0.1:
-            next_diff *= 0.95
-        current_price += next_diff
-        predictions.append(float(current_price))
-        last_diff = next_diff
-    return predictions
-
-
-def fetch_news(ticker):
-    """Return a list of recent news articles for the given ticker.
-
-    Uses Polygon.io's reference news endpoint when a ``POLYGON_API_KEY`` is
-    configured. If the key is missing or the request fails, headlines are
-    retrieved from the Yahoo Finance RSS feed instead.
-    """
-    news = []
-    if POLYGON_API_KEY:
-        try:
-            params = {
-                "ticker": ticker,
-                "limit": 5,
-                "apiKey": POLYGON_API_KEY,
-            }
-            resp = requests.get(
-                "https://api.polygon.io/v2/reference/news", params=params, timeout=10
-            )
-            data = resp.json()
-            for item in data.get("results", []):
-                title = item.get("title", "")
-                link = item.get("article_url")
-                publisher = item.get("publisher", {}).get("name")
-                if title and link:
-                    news.append({"title": title, "link": link, "publisher": publisher})
-            if news:
-                return news
-        except Exception:
-            pass
-
-    # Fallback to Yahoo RSS feed if Polygon request fails
-    try:
-        feed_url = f"https://feeds.finance.yahoo.com/rss/2.0/headline?s={ticker}&region=US&lang=en-US"
-        feed = feedparser.parse(feed_url)
-        for entry in feed.entries[:5]:
-            news.append(
-                {
-                    "title": entry.title,
-                    "link": entry.link,
-                    "publisher": entry.get("source", {}).get("title"),
-                }
-            )
-    except Exception:
-        pass
-    return news
-
-
-def gpt_sentiment(news):
-    """Return sentiment score using GPT if API key set."""
-    key = os.getenv("OPENAI_API_KEY")
-    if not key or not news:
-        return None
-    try:
-        client = openai.OpenAI(api_key=key)
-        text = "\n".join(n["title"] for n in news)
-        prompt = (
-            "Give a single sentiment score between -1 and 1 for these headlines:"
-            f"\n{text}\nScore:"
-        )
-        resp = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0,
-        )
-        out = resp.choices[0].message.content.strip()
-        match = re.search(r"-?\d+\.\d+|-?\d+", out)
-        if match:
-            return float(match.group())
-    except Exception:
-        pass
-    return None
-
-
-def analyze_sentiment(news):
-    """Return sentiment score averaged over news titles or via GPT."""
-    if not news:
-        return 0.0
-    score = gpt_sentiment(news)
-    if score is not None:
-        return score
-    analyzer = SentimentIntensityAnalyzer()
-    scores = [analyzer.polarity_scores(n["title"])["compound"] for n in news]
-    return sum(scores) / len(scores)
-
-
-def sentiment_to_label(score):
-    """Return human readable sentiment label."""
-    if score > 0.1:
-        return "긍정적"
-    if score < -0.1:
-        return "부정적"
-    return "보통"
-
-
-def gpt_explain_predictions(predictions, sentiment, news):
-    """Return GPT reasoning for the predicted prices if possible."""
-    key = os.getenv("OPENAI_API_KEY")
-    if not key or not predictions:
-        return ""
-    try:
-        client = openai.OpenAI(api_key=key)
-        titles = "\n".join(n["title"] for n in news) if news else ""
-        prompt = (
-            "다음 종가 예측 값들을 참고하여 왜 이런 결과가 예상되는지 200토큰으로 간단히 말해 "
-            "한국어로 설명해줘."
-            f"\n예측: {predictions}\n뉴스 감정: {sentiment:.3f}\n"
-            f"제목들:\n{titles}"
-        )
-        resp = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=300,
-            temperature=0,
-        )
-        return resp.choices[0].message.content.strip()
-    except Exception:
+    if len(closes) < 2:
         return ""
-
-
-def run_simulation(data, predictions, balance):
-    """Simulate adaptive trading based on predicted prices."""
-    if data is None or data.empty or "Close" not in data or not predictions:
-        return [], [], ""
-
-    last_date = data.index[-1]
-    start_price = float(data["Close"].iloc[-1])
-    current_price = start_price
-    no_buy_expected = not any(p > start_price for p in predictions)
-    cash = balance
-    shares = 0.0
-    trades = []
-    results = []
-    bought = False
-
-    for i, price in enumerate(predictions, start=1):
-        date = (last_date + pd.Timedelta(days=i)).strftime("%Y-%m-%d")
-        action = None
-
-        if price > current_price and price > start_price and cash >= current_price:
-            # Buy as price expected to rise beyond the starting price
-            shares_to_buy = cash / current_price
-            cash -= shares_to_buy * current_price
-            shares += shares_to_buy
-            action = "BUY"
-            bought = True
-        elif price < current_price and shares > 0:
-            # Sell if price expected to drop
-            cash += shares * current_price
-            shares = 0
-            action = "SELL"
-
-        value = cash + shares * price
-        results.append({"date": date, "value": value})
-
-        if action:
-            trades.append(
-                {
-                    "date": date,
-                    "action": action,
-                    "shares": shares,
-                    "price": current_price,
-                    "value": value,
-                }
-            )
-
-        current_price = price
-
-    # Final sell if still holding shares
-    if shares > 0:
-        cash += shares * current_price
-        trades.append(
-            {
-                "date": (last_date + pd.Timedelta(days=len(predictions))).strftime(
-                    "%Y-%m-%d"
-                ),
-                "action": "SELL",
-                "shares": shares,
-                "price": current_price,
-                "value": cash,
-            }
-        )
-        shares = 0
-
-    note = (
-        ""
-        if bought and not no_buy_expected
-        else "지속적인 하락새로 인한 해당기간내에 매수의견이 없습니다."
+    low = min(closes) if low is None else low
+    high = max(closes) if high is None else high
+    span = (high - low) or 1.0
+    step = width / (len(closes) - 1)
+    return " ".join(
+        f"{i * step:.1f},{height - (c - low) / span * height:.1f}"
+        for i, c in enumerate(closes)
     )
-    return results, trades, note
 
 
 index_template = """
@@ -502,6 +248,7 @@ index_template = """
   <div class=\"container\">
     <a class=\"navbar-brand\" href=\"{{ url_for('stocks.index') }}\">Ai-Trade</a>
     <div class=\"d-flex\">
+      <a class=\"btn btn-outline-light btn-sm me-3\" href=\"{{ url_for('stocks.portfolio_view') }}\">포트폴리오</a>
       <span class=\"navbar-text me-3\">로그인: {{ g.user['username'] }}</span>
       <a class=\"btn btn-outline-light btn-sm\" href=\"{{ url_for('auth.logout') }}\">로그아웃</a>
     </div>
@@ -512,7 +259,8 @@ index_template = """
   <h1 class=\"mb-4\">저장된 티커</h1>
   <form method=\"post\" class=\"row gy-2 gx-2 align-items-center mb-3\">
     <div class=\"col-auto\">
-      <input name=\"ticker\" class=\"form-control\" placeholder=\"티커 추가\">
+      <input name=\"ticker\" class=\"form-control\" placeholder=\"티커 추가\" list=\"symbol-options\" autocomplete=\"off\">
+      <datalist id=\"symbol-options\"></datalist>
     </div>
     <div class=\"col-auto\">
         <button class=\"btn btn-success\" type=\"submit\">추가</button>
@@ -529,12 +277,45 @@ index_template = """
   </form>
   <ul class=\"list-group\">
     {% for t in tickers %}
-      <li class=\"list-group-item\"><a href=\"{{ url_for('stocks.stock', ticker=t) }}\">{{ t }}</a></li>
+      {% set q = quotes.get(t) %}
+      <li class=\"list-group-item d-flex align-items-center\">
+        <a class=\"me-auto\" href=\"{{ url_for('stocks.stock', ticker=t) }}\">{{ t }}</a>
+        {% if sparklines.get(t) %}
+        <svg class=\"me-3\" width=\"120\" height=\"28\"><polyline fill=\"none\" stroke=\"#0d6efd\" stroke-width=\"1.5\" points=\"{{ sparklines[t] }}\"/></svg>
+        {% endif %}
+        {% if q and q.price %}
+        <span class=\"me-3\">{{ '{:.2f}'.format(q.price) }}</span>
+        {% if q.change_pct is not none %}
+        <span class=\"{{ 'text-success' if q.change_pct >= 0 else 'text-danger' }}\">{{ '{:+.2f}'.format(q.change_pct) }}%</span>
+        {% endif %}
+        {% endif %}
+      </li>
     {% else %}
       <li class=\"list-group-item\">저장된 티커가 없습니다.</li>
     {% endfor %}
   </ul>
 </div>
+<script>
+const tickerInput = document.querySelector('input[name=ticker]');
+const symbolOptions = document.getElementById('symbol-options');
+let suggestTimer = null;
+tickerInput.addEventListener('input', () => {
+  clearTimeout(suggestTimer);
+  suggestTimer = setTimeout(async () => {
+    const q = tickerInput.value.trim();
+    if (!q) { symbolOptions.innerHTML = ''; return; }
+    const resp = await fetch('{{ url_for('stocks.symbol_autocomplete') }}?q=' + encodeURIComponent(q));
+    const items = await resp.json();
+    symbolOptions.innerHTML = '';
+    items.forEach(item => {
+      const opt = document.createElement('option');
+      opt.value = item.ticker;
+      opt.label = item.name || '';
+      symbolOptions.appendChild(opt);
+    });
+  }, 150);
+});
+</script>
 </body>
 </html>
 """
@@ -579,7 +360,7 @@ template = """
       </div>
       <div class=\"col-auto\">
         <select name=\"interval\" class=\"form-select\" onchange=\"this.form.submit()\">
-          {% for i in ['1m','5m','15m','1h','1d'] %}
+          {% for i in ['1m','5m','15m','1h','1d','volume','dollar','tick'] %}
           <option value=\"{{ i }}\" {% if i == interval %}selected{% endif %}>{{ i }}</option>
           {% endfor %}
         </select>
@@ -590,8 +371,22 @@ template = """
           <option value=\"candlestick\" {% if chart_type == 'candlestick' %}selected{% endif %}>캔들스틱</option>
         </select>
       </div>
+      <div class=\"col-auto\">
+        <select name=\"overlay\" class=\"form-select\" onchange=\"this.form.submit()\">
+          {% for value, label in [('', '보조지표 없음'), ('sma', 'SMA 20'), ('ema', 'EMA 12/26'), ('bb', '볼린저 밴드'), ('vwap', 'VWAP 20')] %}
+          <option value=\"{{ value }}\" {% if value == overlay %}selected{% endif %}>{{ label }}</option>
+          {% endfor %}
+        </select>
+      </div>
     </form>
     {{ chart_html|safe }}
+    {% if latest_indicators %}
+    <p class=\"text-muted small\">
+      RSI(14) {{ '{:.1f}'.format(latest_indicators.rsi) }} ·
+      MACD {{ '{:.2f}'.format(latest_indicators.macd) }} / 시그널 {{ '{:.2f}'.format(latest_indicators.macd_signal) }} ·
+      ATR(14) {{ '{:.2f}'.format(latest_indicators.atr) }}
+    </p>
+    {% endif %}
     <div class=\"table-responsive\">
       <table class=\"table table-striped\">
         <thead>
@@ -658,6 +453,9 @@ template = """
     <div class=\"alert alert-info mt-3\">{{ note }}</div>
     {% endif %}
     <h2 class=\"mt-4\">평균 뉴스 감정: {{ sentiment_label }}</h2>
+    <form method=\"post\" action=\"{{ url_for('stocks.refresh_stock', ticker=ticker) }}\">
+      <button type=\"submit\" class=\"btn btn-outline-secondary btn-sm\">분석 새로고침</button>
+    </form>
     <h2 class=\"mt-4\">최근 뉴스</h2>
     <ul>
       {% for n in news %}
@@ -666,6 +464,11 @@ template = """
       <li>최근 뉴스를 찾을 수 없습니다.</li>
       {% endfor %}
     </ul>
+    <form method=\"get\" action=\"{{ url_for('stocks.news_search') }}\" class=\"input-group mb-3\">
+      <input type=\"hidden\" name=\"ticker\" value=\"{{ ticker }}\">
+      <input name=\"q\" class=\"form-control\" placeholder=\"{{ ticker }} 뉴스 기록 검색\">
+      <button class=\"btn btn-outline-secondary\" type=\"submit\">검색</button>
+    </form>
   {% endif %}
 </div>
 </body>
@@ -673,49 +476,110 @@ template = """
 """
 
 
+def _index_validator():
+    # the watchlist rows plus the snapshot cache window
+    count, last_id = get_db().execute("SELECT COUNT(*), MAX(id) FROM tickers").fetchone()
+    return (count, last_id, time_bucket(SNAPSHOT_TTL)), None
+
+
+def _stock_validator(ticker):
+    row = get_db().execute(
+        "SELECT computed_at FROM precomputed WHERE ticker = ?", (ticker,)
+    ).fetchone()
+    return (row["computed_at"] if row else None, time_bucket()), None
+
+
+def _anomalies_validator(ticker):
+    from anomalies import TICK_CACHE_DIR, _is_complete, session_today
+
+    date = request.args.get("date") or session_today()
+    path = os.path.join(TICK_CACHE_DIR, ticker, f"{date}.bins.npz")
+    if not os.path.exists(path) or not _is_complete(date):
+        return (date, time_bucket()), None
+    # a finished day only changes when its bins or the baseline do
+    row = get_db().execute(
+        "SELECT dates FROM anomaly_baselines WHERE ticker = ?", (ticker,)
+    ).fetchone()
+    mtime = os.path.getmtime(path)
+    return (date, mtime, row["dates"] if row else None), mtime
+
+
 @bp.route("/", methods=["GET", "POST"])
 @login_required
+@conditional(_index_validator)
 def index():
     conn = get_db()
     cursor = conn.cursor()
     message = None
     if request.method == "POST":
         ticker = request.form.get("ticker", "").upper().strip()
-        if ticker:
+        if ticker and (not TICKER_RE.match(ticker) or not is_known(ticker)):
+            message = "Unknown ticker symbol."
+        elif ticker:
             try:
                 cursor.execute("INSERT INTO tickers (ticker) VALUES (?)", (ticker,))
                 conn.commit()
-                conn.close()
                 return redirect(url_for("stocks.index"))
             except Exception:
                 message = "Ticker already saved."
-    search = request.args.get("q", "").upper()
+    search = request.args.get("q", "").upper().strip()
     if search:
+        # prefix range scan on the unique ticker index plus company name matches
+        by_name = [r["ticker"] for r in search_names(search, limit=50)]
         cursor.execute(
-            "SELECT ticker FROM tickers WHERE ticker LIKE ?", (f"%{search}%",)
+            "SELECT ticker FROM tickers WHERE (ticker >= ? AND ticker < ?) "
+            f"OR ticker IN ({','.join('?' * len(by_name)) or 'NULL'})",
+            (search, search + "\uffff", *by_name),
         )
     else:
         cursor.execute("SELECT ticker FROM tickers")
     tickers = [row["ticker"] for row in cursor.fetchall()]
-    conn.close()
+    try:
+        quotes = fetch_snapshots(tickers) if tickers else {}
+    except Exception:
+        quotes = {}
+    from bars import load_sparklines
+
+    sparklines = {
+        t: sparkline_points(closes) for t, closes in load_sparklines(tickers).items()
+    }
     return render_template_string(
-        index_template, tickers=tickers, search=search, message=message
+        index_template,
+        tickers=tickers,
+        search=search,
+        message=message,
+        quotes=quotes,
+        sparklines=sparklines,
     )
 
 
+@bp.route("/symbols/autocomplete")
+@login_required
+def symbol_autocomplete():
+    """Return JSON symbol suggestions for the ``q`` prefix or name fragment."""
+    return jsonify(autocomplete(request.args.get("q", "")))
+
+
 @bp.route("/stock/<ticker>", methods=["GET", "POST"])
 @login_required
+@conditional(_stock_validator)
 def stock(ticker):
+    from bars import TICK_BAR_KINDS
+
     period = request.args.get("period", "1y")
     interval = request.args.get("interval", "1d")
     chart_type = request.args.get("chart_type", "line")
+    overlay = request.args.get("overlay", "")
     seed = 10000.0
     days = 5
     if request.method == "POST":
         seed = float(request.form.get("seed", 10000))
         days = int(request.form.get("days", 5))
     try:
-        data = fetch_stock_history(ticker, period=period, interval=interval)
+        if interval in TICK_BAR_KINDS:
+            data = load_tick_bars(ticker, interval, period=period)
+        else:
+            data = fetch_stock_history(ticker, period=period, interval=interval)
         if data.empty:
             raise ValueError("No data found for ticker")
 
@@ -725,53 +589,82 @@ def stock(ticker):
         lows = data["Low"].astype(float).round(2).tolist()
         closes = data["Close"].astype(float).round(2).tolist()
 
-        chart_html = canvas_chart_block(dates, opens, highs, lows, closes, chart_type)
-        news = fetch_news(ticker)
-        sentiment = analyze_sentiment(news)
+        from indicators import indicators_for, overlay_series
+
+        try:
+            ind = indicators_for(ticker, interval, data)
+        except Exception:
+            ind = None
+        overlays = overlay_series(ind, overlay) if ind is not None else {}
+        latest_indicators = None
+        if ind is not None and not ind[["rsi", "macd", "atr"]].iloc[-1].isna().any():
+            latest_indicators = ind.iloc[-1].to_dict()
+        chart_html = canvas_chart_block(
+            dates, opens, highs, lows, closes, chart_type, overlays
+        )
+        precomputed = load_precomputed(ticker)
+        if precomputed is not None:
+            news = precomputed["news"]
+            sentiment = precomputed["sentiment"]
+        else:
+            news = fetch_news(ticker)
+            sentiment = analyze_sentiment(news)
+            # have the worker prepare the next view of this ticker
+            enqueue(ticker, "refresh", PRIORITY_VIEW)
         sentiment_label_val = sentiment_to_label(sentiment)
-        preds = predict_prices(data, days=days, sentiment=sentiment)
-        reason = gpt_explain_predictions(preds, sentiment, news)
+        preds, reason = [], ""
+        simulation, trades, note = [], [], ""
+        if request.method == "POST":
+            # predictions are only shown with a simulation
+            if precomputed is not None and (period, interval, days) == (
+                precomputed["period"],
+                precomputed["interval"],
+                precomputed["days"],
+            ):
+                preds = precomputed["predictions"]
+                reason = precomputed["reason"]
+            else:
+                preds = predict_prices(
+                    data, days=days, sentiment=sentiment, indicators=ind
+                )
+                reason = gpt_explain_predictions(preds, sentiment, news)
+            simulation, trades, note = run_simulation(data, preds, seed, indicators=ind)
         if not reason:
             reason = (
                 f"최근 {sentiment_label_val} 뉴스 감정({sentiment:.3f})과 "
                 "과거 가격 추세를 고려해 예측했습니다."
             )
-        simulation, trades, note = (
-            run_simulation(data, preds, seed)
-            if request.method == "POST"
-            else ([], [], "")
-        )
         profit_graph_html = ""
-        if simulation:
-            preds = predict_prices(data, days=days, sentiment=sentiment)
-            reason = gpt_explain_predictions(preds, sentiment, news)
 
-        return render_template_string(
-            template,
-            ticker=ticker,
-            data=data,
-            period=period,
-            interval=interval,
-            chart_type=chart_type,
-            chart_html=chart_html,
-            dates=dates,
-            opens=opens,
-            highs=highs,
-            lows=lows,
-            closes=closes,
-            predictions=preds,
-            prediction_reason=reason,
-            news=news,
-            sentiment=sentiment,
-            sentiment_label=sentiment_label_val,
-            simulation=simulation,
-            trades=trades,
-            profit_graph=profit_graph_html,
-            seed=seed,
-            days=days,
-            note=note,
-            error=None,
-        )
+        with timed("render"):
+            return render_template_string(
+                template,
+                ticker=ticker,
+                data=data,
+                period=period,
+                interval=interval,
+                chart_type=chart_type,
+                overlay=overlay,
+                latest_indicators=latest_indicators,
+                chart_html=chart_html,
+                dates=dates,
+                opens=opens,
+                highs=highs,
+                lows=lows,
+                closes=closes,
+                predictions=preds,
+                prediction_reason=reason,
+                news=news,
+                sentiment=sentiment,
+                sentiment_label=sentiment_label_val,
+                simulation=simulation,
+                trades=trades,
+                profit_graph=profit_graph_html,
+                seed=seed,
+                days=days,
+                note=note,
+                error=None,
+            )
     except Exception as e:
         return render_template_string(
             template,
@@ -780,6 +673,8 @@ def stock(ticker):
             period=period,
             interval=interval,
             chart_type=chart_type,
+            overlay=overlay,
+            latest_indicators=None,
             chart_html="",
             dates=[],
             opens=[],
@@ -800,17 +695,269 @@ def stock(ticker):
             error=str(e),
         )
 
+@bp.route("/stock/<ticker>/refresh", methods=["POST"])
+@login_required
+def refresh_stock(ticker):
+    """Queue a high-priority recomputation of the ticker's forecast."""
+    enqueue(ticker.upper(), "refresh", PRIORITY_USER)
+    return redirect(url_for("stocks.stock", ticker=ticker))
+
+
+@bp.route("/news")
+@login_required
+def news_search():
+    """Full-text search over stored news, optionally for one ticker."""
+    from news import search
+
+    q = request.args.get("q", "").strip()
+    ticker = request.args.get("ticker", "").upper().strip()
+    error = None
+    try:
+        results = search(q, ticker or None) if q else []
+    except Exception as e:
+        results = []
+        error = str(e)
+    template_html = """
+    <!doctype html>
+    <html lang='ko'>
+    <head>
+    <meta charset='utf-8'>
+    <meta name='viewport' content='width=device-width, initial-scale=1'>
+    <link href='https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css' rel='stylesheet'>
+    <title>뉴스 검색</title>
+    </head>
+    <body class='container py-4'>
+    <h1><a href='{{ url_for('stocks.index') }}'>Ai-Trade</a> 뉴스 검색</h1>
+    {% if error %}<div class='alert alert-danger'>{{ error }}</div>{% endif %}
+    <form method='get' class='row gy-2 gx-2 align-items-center mb-3'>
+      <div class='col'><input name='q' class='form-control' placeholder='검색어' value='{{ q }}'></div>
+      <div class='col-auto'><input name='ticker' class='form-control' placeholder='티커 (선택)' value='{{ ticker }}'></div>
+      <div class='col-auto'><button class='btn btn-primary' type='submit'>검색</button></div>
+    </form>
+    <ul class='list-group'>
+    {% for n in results %}
+      <li class='list-group-item'>
+        <small class='text-muted'>{{ n.published }}</small>
+        <a href='{{ n.link }}' target='_blank'>{{ n.title }}</a>{% if n.publisher %} ({{ n.publisher }}){% endif %}
+      </li>
+    {% else %}
+      {% if q %}<li class='list-group-item'>검색 결과가 없습니다.</li>{% endif %}
+    {% endfor %}
+    </ul>
+    </body>
+    </html>
+    """
+    for n in results:
+        n["published"] = dt.datetime.fromtimestamp(n["published"], dt.timezone.utc).strftime("%Y-%m-%d %H:%M")
+    return render_template_string(
+        template_html, q=q, ticker=ticker, results=results, error=error
+    )
+
+
+@bp.route("/portfolio", methods=["GET", "POST"])
+@login_required
+def portfolio_view():
+    """Simulate a forecast-weighted portfolio of the saved tickers."""
+    from portfolio import PORTFOLIO_MAX_WEIGHT, REBALANCE, simulate_portfolio
+
+    labels = {"weekly": "매주", "monthly": "매월", "quarterly": "분기"}
+    rebalances = [(value, labels.get(value, value)) for value in REBALANCE]
+    form = {
+        "seed": request.values.get("seed", "10000"),
+        "years": request.values.get("years", "3"),
+        "rebalance": request.values.get("rebalance", "monthly"),
+        "max_weight": request.values.get("max_weight", str(PORTFOLIO_MAX_WEIGHT)),
+        "tickers": request.values.get("tickers", ""),
+    }
+    result, error = None, None
+    chart = {}
+    if request.method == "POST":
+        try:
+            tickers = [t.strip().upper() for t in form["tickers"].split(",") if t.strip()]
+            if not tickers:
+                tickers = [r["ticker"] for r in get_db().execute("SELECT ticker FROM tickers")]
+            result = simulate_portfolio(
+                tickers,
+                seed=float(form["seed"]),
+                years=int(form["years"]),
+                rebalance=form["rebalance"],
+                max_weight=float(form["max_weight"]),
+            )
+            # both curves share one scale so they can be compared
+            low = min(min(result["values"]), min(result["benchmark"]))
+            high = max(max(result["values"]), max(result["benchmark"]))
+            for name in ("values", "benchmark"):
+                chart[name] = sparkline_points(result[name], 800, 240, low, high)
+        except Exception as e:
+            error = str(e)
+    template_html = """
+    <!doctype html>
+    <html lang='ko'>
+    <head>
+    <meta charset='utf-8'>
+    <meta name='viewport' content='width=device-width, initial-scale=1'>
+    <link href='https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css' rel='stylesheet'>
+    <title>포트폴리오 시뮬레이션</title>
+    </head>
+    <body class='container py-4'>
+    <h1><a href='{{ url_for('stocks.index') }}'>Ai-Trade</a> 포트폴리오 시뮬레이션</h1>
+    {% if error %}<div class='alert alert-danger'>{{ error }}</div>{% endif %}
+    <form method='post' class='row gy-2 gx-2 align-items-center mb-3'>
+      <div class='col-auto'><input name='seed' class='form-control' placeholder='시드' value='{{ form.seed }}'></div>
+      <div class='col-auto'><input name='years' class='form-control' placeholder='기간(년)' value='{{ form.years }}'></div>
+      <div class='col-auto'>
+        <select name='rebalance' class='form-select'>
+          {% for value, label in rebalances %}
+          <option value='{{ value }}' {% if value == form.rebalance %}selected{% endif %}>{{ label }} 리밸런싱</option>
+          {% endfor %}
+        </select>
+      </div>
+      <div class='col-auto'><input name='max_weight' class='form-control' placeholder='종목당 최대 비중' value='{{ form.max_weight }}'></div>
+      <div class='col'><input name='tickers' class='form-control' placeholder='티커 (쉼표 구분, 비우면 저장된 전체)' value='{{ form.tickers }}'></div>
+      <div class='col-auto'><button class='btn btn-warning' type='submit'>시뮬레이션 하기</button></div>
+    </form>
+    {% if result %}
+    {% set s = result.stats %}
+    <p>{{ result.tickers|length }}개 종목, {{ result.dates[0] }} ~ {{ result.dates[-1] }}, 리밸런싱 {{ s.rebalances }}회</p>
+    <svg width='800' height='240' class='border mb-2'>
+      <polyline fill='none' stroke='#adb5bd' stroke-width='1.5' points='{{ chart.benchmark }}'/>
+      <polyline fill='none' stroke='#0d6efd' stroke-width='1.5' points='{{ chart["values"] }}'/>
+    </svg>
+    <p class='text-muted small'>파란색: 포트폴리오, 회색: 동일 비중 보유</p>
+    <table class='table table-sm w-auto'>
+    <tr><th>최종 가치</th><td>{{ '{:,.2f}'.format(s.final_value) }}</td></tr>
+    <tr><th>수익률</th><td>{{ '{:.2%}'.format(s.total_return) }} (동일 비중 {{ '{:.2%}'.format(s.benchmark_return) }})</td></tr>
+    <tr><th>연환산 수익률</th><td>{{ '{:.2%}'.format(s.cagr) }}</td></tr>
+    <tr><th>변동성</th><td>{{ '{:.2%}'.format(s.volatility) }}</td></tr>
+    <tr><th>샤프 지수</th><td>{{ '{:.2f}'.format(s.sharpe) }}</td></tr>
+    <tr><th>최대 낙폭</th><td>{{ '{:.2%}'.format(s.max_drawdown) }}</td></tr>
+    <tr><th>거래 비용</th><td>{{ '{:,.2f}'.format(s.costs) }}</td></tr>
+    </table>
+    <h2 class='mt-4'>현재 보유 종목</h2>
+    <table class='table table-sm'>
+    <tr><th>티커</th><th>비중</th><th>수량</th><th>가격</th><th>예상 수익률</th></tr>
+    {% for h in result.holdings %}
+    <tr>
+      <td><a href='{{ url_for('stocks.stock', ticker=h.ticker) }}'>{{ h.ticker }}</a></td>
+      <td>{{ '{:.1%}'.format(h.weight) }}</td><td>{{ '{:.4f}'.format(h.shares) }}</td>
+      <td>{{ '{:.2f}'.format(h.price) }}</td><td>{{ '{:+.2%}'.format(h.forecast) }}</td>
+    </tr>
+    {% else %}
+    <tr><td colspan='5'>예상 수익률이 양수인 종목이 없어 현금으로 보유합니다.</td></tr>
+    {% endfor %}
+    </table>
+    {% endif %}
+    </body>
+    </html>
+    """
+    return render_template_string(
+        template_html,
+        form=form,
+        rebalances=rebalances,
+        result=result,
+        chart=chart,
+        error=error,
+    )
+
+
+def _float_arg(name, default):
+    """Return a numeric form or query value, or ``default`` if missing or invalid."""
+    try:
+        return float(request.values.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+@bp.route("/anomalies/scan", methods=["GET", "POST"])
+@login_required
+def anomaly_scan():
+    """Run or display the ranked anomaly scan across all saved tickers."""
+    from anomalies import load_scan, scan_watchlist, session_today
+
+    date = request.values.get("date") or session_today()
+    threshold = _float_arg("threshold", 3.0)
+    error = None
+    try:
+        if request.method == "POST":
+            scan_watchlist(date, threshold)
+        rows, timings = load_scan(date)
+    except Exception as e:
+        rows, timings = [], []
+        error = str(e)
+    template_html = """
+    <!doctype html>
+    <html lang='ko'>
+    <head>
+    <meta charset='utf-8'>
+    <meta name='viewport' content='width=device-width, initial-scale=1'>
+    <link href='https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css' rel='stylesheet'>
+    <title>관심 종목 이상 탐지</title>
+    </head>
+    <body class='container py-4'>
+    <h1>{{ date }} 관심 종목 거래 이상 탐지</h1>
+    {% if error %}<div class='alert alert-danger'>{{ error }}</div>{% endif %}
+    <form method='post' class='row gy-2 gx-2 align-items-center mb-3'>
+      <div class='col-auto'><input name='date' class='form-control' value='{{ date }}'></div>
+      <div class='col-auto'><input name='threshold' class='form-control' value='{{ threshold }}'></div>
+      <div class='col-auto'><button class='btn btn-warning' type='submit'>전체 스캔</button></div>
+    </form>
+    <table class='table table-sm'>
+    <tr><th>티커</th><th>시간</th><th>거래 수</th><th>예상</th><th>z</th></tr>
+    {% for r in rows %}
+    <tr>
+      <td><a href='{{ url_for('stocks.show_anomalies', ticker=r.ticker, date=date, threshold=threshold) }}'>{{ r.ticker }}</a></td>
+      <td>{{ r.time }}</td><td>{{ r.count }}</td>
+      <td>{{ '{:.1f}'.format(r.expected) }}</td><td>{{ '{:.1f}'.format(r.zscore) }}</td>
+    </tr>
+    {% else %}
+    <tr><td colspan='5'>저장된 스캔 결과가 없습니다.</td></tr>
+    {% endfor %}
+    </table>
+    {% if timings %}
+    <h2 class='mt-4'>종목별 처리 시간</h2>
+    <table class='table table-sm'>
+    <tr><th>티커</th><th>초</th><th>이상 구간</th><th>오류</th></tr>
+    {% for t in timings %}
+    <tr><td>{{ t.ticker }}</td><td>{{ '{:.2f}'.format(t.seconds) }}</td><td>{{ t.anomalies }}</td><td>{{ t.error or '' }}</td></tr>
+    {% endfor %}
+    </table>
+    {% endif %}
+    </body>
+    </html>
+    """
+    return render_template_string(
+        template_html,
+        date=date,
+        threshold=threshold,
+        rows=rows,
+        timings=timings,
+        error=error,
+    )
+
+
 @bp.route("/anomalies/<ticker>")
 @login_required
+@conditional(_anomalies_validator)
 def show_anomalies(ticker):
     """Display high trade count periods for the given ticker."""
-    date = request.args.get("date") or pd.Timestamp.utcnow().strftime("%Y-%m-%d")
-    threshold = float(request.args.get("threshold", 3.0))
+    from anomalies import RESOLUTIONS, detect_anomalies, session_today
+
+    date = request.args.get("date") or session_today()
+    threshold = _float_arg("threshold", 3.0)
+    resolution = request.args.get("resolution", "1min")
+    time_format = "%H:%M:%S" if RESOLUTIONS.get(resolution, 60) < 60 else "%H:%M"
     try:
-        anomalies, mean, std = detect_anomalies(ticker, date, threshold)
+        anomalies, mean, std = detect_anomalies(ticker, date, threshold, resolution)
         rows = [
-            {"time": ts.strftime("%H:%M"), "count": int(cnt)}
-            for ts, cnt in anomalies.items()
+            {
+                "time": ts.strftime(time_format),
+                "count": int(row["count"]),
+                "volume": float(row["volume"]),
+                "vwap": float(row["vwap"]),
+                "expected": float(row["expected"]),
+                "zscore": float(row["zscore"]),
+            }
+            for ts, row in anomalies.iterrows()
         ]
     except Exception as e:
         rows = []
@@ -829,12 +976,27 @@ def show_anomalies(ticker):
     </head>
     <body class='container py-4'>
     <h1>{{ ticker }} {{ date }} 거래 이상 탐지</h1>
+    <form method='get' class='row gy-2 gx-2 align-items-center mb-3'>
+      <input type='hidden' name='date' value='{{ date }}'>
+      <input type='hidden' name='threshold' value='{{ threshold }}'>
+      <div class='col-auto'>
+        <select name='resolution' class='form-select' onchange='this.form.submit()'>
+          {% for r in resolutions %}
+          <option value='{{ r }}' {% if r == resolution %}selected{% endif %}>{{ r }}</option>
+          {% endfor %}
+        </select>
+      </div>
+    </form>
     {% if error %}<div class='alert alert-danger'>{{ error }}</div>{% endif %}
-    <p>평균 {{ mean:.2f }}건, 표준편차 {{ std:.2f }} 기준 {{ threshold }}배 이상인 구간</p>
+    <p>같은 시각 평균 {{ '{:.2f}'.format(mean) }}건, 표준편차 {{ '{:.2f}'.format(std) }} 기준 {{ threshold }}배 이상인 구간</p>
     <table class='table table-sm'>
-    <tr><th>시간</th><th>거래 수</th></tr>
+    <tr><th>시간</th><th>거래 수</th><th>거래량</th><th>VWAP</th><th>예상</th><th>z</th></tr>
     {% for r in rows %}
-    <tr><td>{{ r.time }}</td><td>{{ r.count }}</td></tr>
+    <tr>
+      <td>{{ r.time }}</td><td>{{ r.count }}</td><td>{{ r.volume|int }}</td>
+      <td>{{ '{:.2f}'.format(r.vwap) }}</td>
+      <td>{{ '{:.1f}'.format(r.expected) }}</td><td>{{ '{:.1f}'.format(r.zscore) }}</td>
+    </tr>
     {% endfor %}
     </table>
     </body>
@@ -848,5 +1010,7 @@ def show_anomalies(ticker):
         mean=mean,
         std=std,
         threshold=threshold,
+        resolution=resolution,
+        resolutions=list(RESOLUTIONS),
         error=error,
     )
@@ -0,0 +1,175 @@
+import re
+import threading
+import time
+
+import polygon_api
+from db import get_db
+
+# Maximum suggestions returned by ``autocomplete``
+AUTOCOMPLETE_LIMIT = 10
+TICKER_RE = re.compile(r"^[A-Z][A-Z0-9.\-]{0,9}$")
+# Seconds between checks of the symbols table for a reload by another process
+TRIE_CHECK_SECONDS = 60
+
+
+class PrefixTrie:
+    """Map key prefixes to the best ``limit`` values inserted under them.
+
+    Each node keeps its own short result list, filled in insertion order, so
+    inserting keys shortest-first makes a lookup a walk down ``len(prefix)``
+    nodes with no further searching.
+    """
+
+    def __init__(self, limit=AUTOCOMPLETE_LIMIT):
+        self.limit = limit
+        self.root = ({}, [])
+
+    def insert(self, key, value):
+        node = self.root
+        for ch in key:
+            children, matches = node
+            if len(matches) < self.limit:
+                matches.append(value)
+            node = children.get(ch)
+            if node is None:
+                node = children[ch] = ({}, [])
+        if len(node[1]) < self.limit:
+            node[1].append(value)
+
+    def search(self, prefix):
+        node = self.root
+        for ch in prefix:
+            node = node[0].get(ch)
+            if node is None:
+                return []
+        return list(node[1])
+
+
+_trie = None
+_trie_version = None
+_trie_checked = 0.0
+_trie_lock = threading.Lock()
+
+
+def _symbols_version():
+    # a reload replaces rows, and replaced rows get new rowids
+    row = get_db().execute("SELECT COUNT(*), MAX(rowid) FROM symbols").fetchone()
+    return tuple(row)
+
+
+def _build_trie():
+    conn = get_db()
+    rows = conn.execute("SELECT ticker, name FROM symbols WHERE active = 1").fetchall()
+    trie = PrefixTrie()
+    for row in sorted(rows, key=lambda r: (len(r["ticker"]), r["ticker"])):
+        trie.insert(row["ticker"], {"ticker": row["ticker"], "name": row["name"]})
+    return trie
+
+
+def get_trie():
+    """Return the process-wide symbol trie, building it on first use.
+
+    Workers inherit the trie from the preloaded master, so every
+    ``TRIE_CHECK_SECONDS`` the symbols table is checked and the trie rebuilt
+    if ``symbols.py`` loaded new symbols in another process.
+    """
+    global _trie, _trie_version, _trie_checked
+    now = time.monotonic()
+    if _trie is not None and now < _trie_checked + TRIE_CHECK_SECONDS:
+        return _trie
+    with _trie_lock:
+        if _trie is None or now >= _trie_checked + TRIE_CHECK_SECONDS:
+            version = _symbols_version()
+            if _trie is None or version != _trie_version:
+                _trie = _build_trie()
+                _trie_version = version
+            _trie_checked = now
+        return _trie
+
+
+def _fts_query(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def search_names(text, limit=AUTOCOMPLETE_LIMIT):
+    """Return symbols whose ticker or company name contains ``text``."""
+    if len(text) < 3:
+        return []
+    conn = get_db()
+    rows = conn.execute(
+        "SELECT ticker, name FROM symbols_fts WHERE symbols_fts MATCH ? ORDER BY rank LIMIT ?",
+        (_fts_query(text), limit),
+    ).fetchall()
+    return [{"ticker": r["ticker"], "name": r["name"]} for r in rows]
+
+
+def autocomplete(text, limit=AUTOCOMPLETE_LIMIT):
+    """Return ticker prefix matches, topped up with company name matches."""
+    text = text.strip()
+    if not text:
+        return []
+    results = get_trie().search(text.upper())[:limit]
+    if len(results) < limit:
+        seen = {r["ticker"] for r in results}
+        for r in search_names(text, limit):
+            if r["ticker"] not in seen:
+                results.append(r)
+                if len(results) == limit:
+                    break
+    return results
+
+
+def is_known(ticker):
+    """Return True if ``ticker`` is a reference symbol or none are loaded."""
+    conn = get_db()
+    if conn.execute("SELECT 1 FROM symbols LIMIT 1").fetchone() is None:
+        return True
+    return (
+        conn.execute("SELECT 1 FROM symbols WHERE ticker = ?", (ticker,)).fetchone()
+        is not None
+    )
+
+
+def load_reference_tickers(market="stocks"):
+    """Bulk load Polygon's reference tickers into the symbols table."""
+    global _trie
+    rows = []
+    url = "/v3/reference/tickers"
+    params = {"market": market, "active": "true", "limit": 1000}
+    while True:
+        data = polygon_api.get_json(url, params=params, endpoint="reference")
+        for item in data.get("results", []):
+            rows.append(
+                (
+                    item.get("ticker"),
+                    item.get("name"),
+                    item.get("market"),
+                    item.get("type"),
+                    item.get("primary_exchange"),
+                    1 if item.get("active", True) else 0,
+                )
+            )
+        url = data.get("next_url")
+        if not url:
+            break
+        params = None
+
+    conn = get_db()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO symbols (ticker, name, market, type, exchange, active) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.execute("DELETE FROM symbols_fts")
+        conn.execute("INSERT INTO symbols_fts (ticker, name) SELECT ticker, name FROM symbols")
+    with _trie_lock:
+        _trie = None
+    return len(rows)
+
+
+if __name__ == "__main__":
+    import db
+
+    db.init_db()
+    print(f"Loaded {load_reference_tickers()} reference tickers")
@@ -0,0 +1,45 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Point ``db`` at a fresh database for the duration of a test."""
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "stocks.db"))
+    db._reset_after_fork()
+    db.init_db()
+    yield db.get_db()
+    db.get_db().close()
+    db._reset_after_fork()
+
+
+@pytest.fixture
+def shared_cache(tmp_path, monkeypatch):
+    """Give ``cache`` a fresh on-disk backend for the duration of a test."""
+    import cache
+
+    backend = cache.DiskCache(str(tmp_path / "cache.db"))
+    monkeypatch.setattr(cache, "_cache", backend)
+    return backend
+
+
+@pytest.fixture
+def client(database):
+    """A test client logged in as a fresh user."""
+    import auth
+    from app import app
+
+    database.execute("INSERT INTO users (username, password_hash, is_verified) VALUES ('tester', '', 1)")
+    database.commit()
+    auth._user_cache.clear()
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        with client.session_transaction() as session:
+            session["user_id"] = 1
+        yield client
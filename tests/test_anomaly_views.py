@@ -0,0 +1,34 @@
+import datetime as dt
+from zoneinfo import ZoneInfo
+
+import pytest
+
+
+@pytest.mark.parametrize("query", ["", "?threshold=", "?threshold=abc"])
+def test_scan_view_falls_back_to_default_threshold(client, query):
+    resp = client.get("/anomalies/scan" + query + ("&" if query else "?") + "date=2024-01-02")
+    assert resp.status_code == 200
+    assert b"value='3.0'" in resp.data
+
+
+def test_scan_view_keeps_valid_threshold(client):
+    resp = client.get("/anomalies/scan?threshold=2.5&date=2024-01-02")
+    assert resp.status_code == 200
+    assert b"value='2.5'" in resp.data
+
+
+def test_ticker_view_tolerates_bad_threshold(client):
+    resp = client.get("/anomalies/AAPL?threshold=abc&date=2024-01-02")
+    assert resp.status_code == 200
+
+
+def test_scan_view_defaults_to_the_new_york_date(client):
+    def today():
+        return dt.datetime.now(ZoneInfo("America/New_York")).strftime("%Y-%m-%d")
+
+    # the date may roll over while the request runs
+    dates = {today()}
+    resp = client.get("/anomalies/scan")
+    dates.add(today())
+    assert resp.status_code == 200
+    assert any(f"name='date' class='form-control' value='{d}'".encode() in resp.data for d in dates)
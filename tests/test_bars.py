@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+
+import db
+import indicators
+from bars import BarBuilder, load_bars, save_bars
+
+
+def burst_bars():
+    # ten 100-share prints 0.2 ms apart: every trade closes its own bar
+    start = pd.Timestamp("2024-01-02 14:30").value
+    ts = start + np.arange(10, dtype=np.int64) * 200_000
+    price = 100 + np.arange(10) * 0.01
+    builder = BarBuilder("volume", 100)
+    builder.update(ts, price, np.full(10, 100.0))
+    builder.flush()
+    return builder.frame()
+
+
+def test_bars_within_one_millisecond_are_all_stored(database):
+    df = burst_bars()
+    assert len(df) == 10
+    save_bars("AAPL", "volume", df)
+    stored = load_bars("AAPL", "volume")
+    assert len(stored) == 10
+    assert stored.index.equals(df.index)
+    np.testing.assert_allclose(stored["Close"], df["Close"])
+    # a rebuild of the same day replaces rather than duplicates
+    save_bars("AAPL", "volume", df)
+    assert len(load_bars("AAPL", "volume")) == 10
+    after = load_bars("AAPL", "volume", start=df.index[5])
+    assert after.index.equals(df.index[5:])
+
+
+def test_indicators_on_tick_bars_keep_every_bar(database):
+    df = burst_bars()
+    save_bars("AAPL", "volume", df.iloc[:6])
+    indicators.refresh("AAPL", "volume")
+    save_bars("AAPL", "volume", df.iloc[6:])
+    indicators.refresh("AAPL", "volume")
+    stored = indicators.indicators_for("AAPL", "volume", load_bars("AAPL", "volume"))
+    expected = indicators.compute(df)[0][list(indicators.COLUMNS)]
+    assert stored.index.equals(df.index)
+    np.testing.assert_allclose(stored.to_numpy(), expected.to_numpy(), rtol=1e-9)
+
+
+def test_millisecond_tick_bars_are_migrated(database):
+    database.execute(
+        "INSERT INTO bars (ticker, kind, ts, open, high, low, close, volume) "
+        "VALUES ('AAPL', 'tick', 1704205800123, 1, 1, 1, 1, 1), "
+        "('AAPL', '1d', 1704153600000, 1, 1, 1, 1, 1)"
+    )
+    database.commit()
+    db.init_db()
+    db.init_db()
+    assert load_bars("AAPL", "tick").index[0] == pd.Timestamp("2024-01-02 14:30:00.123")
+    assert load_bars("AAPL", "1d").index[0] == pd.Timestamp("2024-01-02")
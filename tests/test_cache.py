@@ -0,0 +1,177 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import cache
+
+
+@pytest.mark.parametrize(
+    "df",
+    [
+        pd.DataFrame(
+            {"Close": [1.5, 2.5, np.nan], "Volume": [10, 20, 30], "note": ["a", "b", "c"]},
+            index=pd.DatetimeIndex(
+                ["2024-01-02", "2024-01-03", "2024-01-04"], name="Date"
+            ).as_unit("ms"),
+        ),
+        pd.DataFrame(
+            {"Close": [1.0, 2.0]},
+            index=pd.DatetimeIndex(["2024-01-02 09:30", "2024-01-02 09:31"]).tz_localize(
+                "America/New_York"
+            ),
+        ),
+        pd.DataFrame({"weight": [0.25, 0.75]}, index=["AAPL", "MSFT"]),
+        pd.DataFrame(columns=["Close"], dtype=float),
+    ],
+)
+def test_dataframe_round_trip(df):
+    back = cache.decode(cache.encode(df))
+    pd.testing.assert_frame_equal(back, df, check_index_type=False)
+    if isinstance(df.index, pd.DatetimeIndex):
+        assert back.index.dtype == df.index.dtype
+
+
+def test_array_and_plain_round_trip():
+    array = np.arange(12, dtype="f4").reshape(3, 4)
+    back = cache.decode(cache.encode(array))
+    assert back.dtype == array.dtype and np.array_equal(back, array)
+    back[0, 0] = 1  # decoded arrays are writable copies
+    arrays = cache.decode(cache.encode({"x": np.arange(3), "y": np.ones(2, dtype=bool)}))
+    assert np.array_equal(arrays["x"], [0, 1, 2]) and arrays["y"].dtype == bool
+    assert cache.decode(cache.encode(b"\x00raw")) == b"\x00raw"
+    value = {"price": 1.5, "tickers": ["AAPL"], "none": None}
+    assert cache.decode(cache.encode(value)) == value
+
+
+def test_object_arrays_are_rejected():
+    with pytest.raises(TypeError):
+        cache.encode(np.array([object()]))
+
+
+def test_get_set_expiry_and_eviction(shared_cache):
+    cache.set("a", {"v": 1})
+    assert cache.get("a") == {"v": 1}
+    cache.set("short", 1, ttl=-1)
+    assert cache.get("short", "miss") == "miss"
+    shared_cache.max_bytes = 3000
+    for i in range(10):
+        cache.set(f"big{i}", np.zeros(100))
+    shared_cache.evict()
+    assert shared_cache.stats()["bytes"] <= 3000
+    assert cache.get("big9") is not None and cache.get("big0") is None
+
+
+def test_import_market_skips_numpy():
+    code = "import sys, market; print('numpy' in sys.modules or 'pandas' in sys.modules)"
+    root = os.path.dirname(os.path.abspath(cache.__file__))
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=root)
+    assert out.stdout.strip() == "False", out.stderr
+
+
+def run_threads(n, target):
+    threads = [cache.threading.Thread(target=target) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def test_single_flight_threads(shared_cache):
+    calls, results = [], []
+
+    def compute():
+        calls.append(1)
+        cache.time.sleep(0.2)
+        return {"v": 42}
+
+    run_threads(8, lambda: results.append(cache.get_or_compute("k", compute, 60)))
+    assert len(calls) == 1
+    assert results == [{"v": 42}] * 8
+    assert not cache._flights
+
+
+def test_single_flight_shares_none_and_errors(shared_cache):
+    calls, results = [], []
+
+    def fail():
+        calls.append(1)
+        cache.time.sleep(0.2)
+        return None
+
+    run_threads(6, lambda: results.append(cache.get_or_compute("none", fail)))
+    assert len(calls) == 1 and results == [None] * 6
+
+    def boom():
+        calls.append(1)
+        cache.time.sleep(0.2)
+        raise RuntimeError("down")
+
+    def ask():
+        try:
+            cache.get_or_compute("boom", boom)
+        except RuntimeError as e:
+            results.append(str(e))
+
+    calls.clear()
+    results.clear()
+    run_threads(6, ask)
+    assert len(calls) == 1 and results == ["down"] * 6
+    assert not cache._flights
+    # nothing was cached, so a later call computes again
+    assert cache.get_or_compute("none", lambda: 1) == 1
+
+
+def _compute_in_process(args):
+    path, log, value = args
+    cache._cache = cache.DiskCache(path)
+
+    def compute():
+        with open(log, "a") as f:
+            f.write("x")
+        cache.time.sleep(0.5)
+        return value
+
+    return cache.get_or_compute("shared", compute, 60)
+
+
+@pytest.mark.parametrize("value", [{"v": 1}, None])
+def test_single_flight_processes(tmp_path, value):
+    import multiprocessing
+
+    path, log = str(tmp_path / "cache.db"), tmp_path / "calls"
+    log.write_text("")
+    cache.DiskCache(path)
+    with multiprocessing.get_context("fork").Pool(4) as pool:
+        results = pool.map(_compute_in_process, [(path, str(log), value)] * 4)
+    assert results == [value] * 4
+    assert log.read_text() == "x"
+
+
+class BrokenBackend:
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise cache.sqlite3.OperationalError("attempt to write a readonly database")
+
+        return fail
+
+
+def test_backend_errors_count_as_misses(monkeypatch):
+    import market
+
+    class Provider:
+        remote = True
+
+        def snapshots(self, tickers):
+            return {t: {"price": 1.0} for t in tickers}
+
+    monkeypatch.setattr(cache, "_cache", BrokenBackend())
+    monkeypatch.setattr(market, "get_provider", Provider)
+    assert cache.get_or_compute("k", lambda: 7) == 7
+    assert market.fetch_snapshots(["AAPL", "MSFT"]) == {
+        "AAPL": {"price": 1.0},
+        "MSFT": {"price": 1.0},
+    }
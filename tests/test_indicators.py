@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+import indicators
+from bars import load_bars, save_bars
+
+
+def make_bars(n, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 + rng.normal(0, 1, n).cumsum()
+    spread = rng.uniform(0.1, 1.0, n)
+    return pd.DataFrame(
+        {
+            "Open": close + rng.normal(0, 0.2, n),
+            "High": close + spread,
+            "Low": close - spread,
+            "Close": close,
+            "Volume": rng.integers(1_000, 10_000, n).astype(float),
+        },
+        index=pd.bdate_range("2024-01-01", periods=n),
+    )
+
+
+def test_incremental_refresh_matches_full_recompute(database):
+    bars = make_bars(120)
+    save_bars("AAPL", "1d", bars.iloc[:80])
+    indicators.rebuild("AAPL")
+
+    # the session's last bar is rewritten, then new bars arrive one by one
+    revised = bars.iloc[:80].copy()
+    revised.iloc[-1, revised.columns.get_loc("Close")] += 1.5
+    save_bars("AAPL", "1d", revised.iloc[-1:])
+    indicators.refresh("AAPL")
+    for i in range(80, 120, 10):
+        save_bars("AAPL", "1d", bars.iloc[i : i + 10])
+        indicators.refresh("AAPL")
+
+    stored = indicators.load_indicators("AAPL")
+    expected = indicators.compute(load_bars("AAPL", "1d"))[0][list(indicators.COLUMNS)]
+    assert len(stored) == 120
+    np.testing.assert_allclose(stored.to_numpy(), expected.to_numpy(), rtol=1e-9, atol=1e-9)
+
+
+def test_update_matches_compute():
+    bars = make_bars(60, seed=1)
+    _, state = indicators.compute(bars.iloc[:40])
+    for ts, row in bars.iloc[40:].iterrows():
+        values, state = indicators.update(state, {**row.to_dict(), "ts": ts.value // 1_000_000})
+    expected = indicators.compute(bars)[0].iloc[-1]
+    for column in indicators.COLUMNS:
+        assert np.isclose(values[column], expected[column], rtol=1e-9), column
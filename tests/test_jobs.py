@@ -0,0 +1,100 @@
+import time
+
+import jobs
+
+
+def statuses(conn):
+    return [tuple(r) for r in conn.execute("SELECT id, status FROM jobs ORDER BY id")]
+
+
+def test_failed_retry_folds_into_job_queued_while_running(database, monkeypatch):
+    def handler(ticker):
+        jobs.enqueue(ticker, "refresh", jobs.PRIORITY_USER)
+        raise RuntimeError("upstream down")
+
+    monkeypatch.setitem(jobs.HANDLERS, "refresh", handler)
+    jobs.enqueue("AAPL", "refresh")
+    assert jobs.run_next()
+    assert statuses(database) == [(1, "superseded"), (2, "queued")]
+    row = database.execute("SELECT priority, run_after FROM jobs WHERE id = 2").fetchone()
+    assert row["priority"] == jobs.PRIORITY_USER
+    # the queued job inherits the failed attempt's backoff
+    assert row["run_after"] > time.time() + 30
+
+
+def test_failed_retry_without_duplicate_is_requeued(database, monkeypatch):
+    def handler(ticker):
+        raise RuntimeError("upstream down")
+
+    monkeypatch.setitem(jobs.HANDLERS, "refresh", handler)
+    jobs.enqueue("AAPL", "refresh")
+    assert jobs.run_next()
+    assert statuses(database) == [(1, "queued")]
+
+
+def test_requeue_stale_folds_into_queued_job(database):
+    jobs.enqueue("AAPL", "refresh")
+    jobs.claim()
+    database.execute("UPDATE jobs SET started_at = 0")
+    jobs.enqueue("AAPL", "refresh", jobs.PRIORITY_VIEW)
+    jobs.enqueue("MSFT", "refresh")
+    database.execute("UPDATE jobs SET status = 'running', started_at = 0 WHERE ticker = 'MSFT'")
+    database.commit()
+    jobs.requeue_stale()
+    assert statuses(database) == [(1, "superseded"), (2, "queued"), (3, "queued")]
+
+
+def test_worker_survives_errors(database, monkeypatch):
+    calls = []
+
+    def run_next():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+        stop.set()
+        return True
+
+    stop = jobs.threading.Event()
+    monkeypatch.setattr(jobs, "run_next", run_next)
+    monkeypatch.setattr(jobs, "POLL_SECONDS", 0)
+    jobs.worker(stop)
+    assert len(calls) == 2
+
+
+def test_job_left_running_is_requeued_once_stale(database, monkeypatch):
+    def broken_finish(job, error=None):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setitem(jobs.HANDLERS, "refresh", lambda ticker: None)
+    monkeypatch.setattr(jobs, "finish", broken_finish)
+    jobs.enqueue("AAPL", "refresh")
+    try:
+        jobs.run_next()
+    except RuntimeError:
+        pass
+    monkeypatch.undo()
+    assert statuses(database) == [(1, "running")]
+    assert jobs.requeue_stale() == 0
+    database.execute("UPDATE jobs SET started_at = ?", (time.time() - jobs.STALE_SECONDS - 1,))
+    database.commit()
+    assert jobs.requeue_stale() == 1
+    monkeypatch.setitem(jobs.HANDLERS, "refresh", lambda ticker: None)
+    assert jobs.run_next()
+    assert statuses(database) == [(1, "done")]
+
+
+def test_scheduler_loop_requeues_stale_jobs(database, monkeypatch):
+    jobs.enqueue("AAPL", "refresh")
+    jobs.claim()
+    database.execute("UPDATE jobs SET started_at = 0")
+    database.commit()
+
+    def stop(seconds):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(jobs, "JOB_WORKERS", 0)
+    monkeypatch.setattr(jobs.sys, "argv", ["jobs.py"])
+    monkeypatch.setattr(jobs.time, "sleep", stop)
+    monkeypatch.setattr(jobs, "schedule_news", lambda: 0)
+    jobs.main()
+    assert statuses(database) == [(1, "queued")]
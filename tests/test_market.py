@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+import bars
+import market
+from bars import save_bars
+from market import load_tick_bars
+
+
+def test_tick_bars_are_selected_by_trading_day(database):
+    frames = []
+    for day in pd.bdate_range("2024-01-01", periods=10):
+        stamps = day + pd.Timedelta(hours=14, minutes=30) + pd.to_timedelta(np.arange(390), unit="min")
+        frames.append(
+            pd.DataFrame(
+                {"Open": 1.0, "High": 1.0, "Low": 1.0, "Close": 1.0, "Volume": 100.0},
+                index=stamps,
+            )
+        )
+    save_bars("AAPL", "volume", pd.concat(frames))
+
+    week = load_tick_bars("AAPL", "volume", period="5d")
+    assert len(week) == 5 * 390
+    assert week.index.normalize().nunique() == 5
+    assert week.index[-1] == frames[-1].index[-1]
+    # asking for more days than stored returns everything
+    assert len(load_tick_bars("AAPL", "volume", period="1mo")) == 10 * 390
+
+
+def minute_bars(days, seed=0):
+    """1-minute bars for ``days`` New York sessions, 4:00 to 20:00 with gaps."""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for day in days:
+        open_ = pd.Timestamp(day).tz_localize(market.MARKET_TZ) + pd.Timedelta(hours=4)
+        stamps = open_ + pd.to_timedelta(np.sort(rng.choice(960, 700, replace=False)), unit="min")
+        close = 100 + rng.normal(0, 0.1, len(stamps)).cumsum()
+        frames.append(
+            pd.DataFrame(
+                {
+                    "Open": close + rng.normal(0, 0.05, len(stamps)),
+                    "High": close + 0.1,
+                    "Low": close - 0.1,
+                    "Close": close,
+                    "Volume": rng.integers(1, 1000, len(stamps)).astype(float),
+                    "VWAP": close,
+                    "Trades": rng.integers(1, 50, len(stamps)).astype(float),
+                },
+                index=stamps.tz_convert("UTC").tz_localize(None),
+            )
+        )
+    return pd.concat(frames)
+
+
+def pandas_resample(df, minutes):
+    grouped = df.resample(f"{minutes}min")
+    out = pd.DataFrame(
+        {
+            "Open": grouped["Open"].first(),
+            "High": grouped["High"].max(),
+            "Low": grouped["Low"].min(),
+            "Close": grouped["Close"].last(),
+            "Volume": grouped["Volume"].sum(),
+            "VWAP": (df["VWAP"] * df["Volume"]).resample(f"{minutes}min").sum() / grouped["Volume"].sum(),
+            "Trades": grouped["Trades"].sum(),
+        }
+    )
+    return out[grouped["Close"].count() > 0]
+
+
+def test_resample_bars_matches_pandas():
+    df = minute_bars(["2024-01-02", "2024-01-03"])
+    for minutes in bars.DERIVED_INTERVALS.values():
+        ours = bars.resample_bars(df, minutes)
+        expected = pandas_resample(df, minutes)
+        assert ours.index.equals(expected.index.as_unit(ours.index.unit))
+        np.testing.assert_allclose(ours.to_numpy(), expected.to_numpy(), rtol=1e-12)
+
+
+def test_derive_bars_extends_incrementally(database):
+    df = minute_bars(["2024-01-02", "2024-01-03"])
+    # stop mid-bucket so the newest 15m bar is rebuilt on the next pass
+    cut = df.index.searchsorted(pd.Timestamp("2024-01-02 18:07"))
+    save_bars("AAPL", "1m", df.iloc[:cut])
+    bars.derive_bars("AAPL", "15m")
+    save_bars("AAPL", "1m", df.iloc[cut:])
+    bars.derive_bars("AAPL", "15m")
+    stored = bars.load_bars("AAPL", "15m")
+    expected = bars.resample_bars(df, 15)
+    assert stored.index.equals(expected.index.as_unit(stored.index.unit))
+    np.testing.assert_allclose(stored.to_numpy(dtype=float), expected.to_numpy(), rtol=1e-12)
+
+
+class LocalOnly:
+    remote = False
+
+
+def test_intraday_periods_select_trading_days(database, monkeypatch):
+    monkeypatch.setattr(market, "get_provider", LocalOnly)
+    days = pd.bdate_range("2024-01-02", periods=8)
+    save_bars("AAPL", "1m", minute_bars(days))
+
+    for interval in ("1m", "5m"):
+        week = market.fetch_stock_history("AAPL", period="5d", interval=interval)
+        sessions = week.index.tz_localize("UTC").tz_convert(market.MARKET_TZ).normalize()
+        # evening bars after midnight UTC stay with their New York session
+        assert sessions.nunique() == 5
+        assert sessions[0] == days[3].tz_localize(market.MARKET_TZ)
+    # longer periods return every stored day
+    month = market.fetch_stock_history("AAPL", period="1mo", interval="1m")
+    assert len(month) == 8 * 700
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bars import save_bars
+from portfolio import REBALANCE, expected_returns, load_prices, simulate_portfolio, target_weights
+
+
+def daily_bars(ticker, closes, dates):
+    frame = pd.DataFrame(
+        {"Open": closes, "High": closes, "Low": closes, "Close": closes, "Volume": 1000.0},
+        index=dates,
+    )
+    save_bars(ticker, "1d", frame)
+
+
+def random_walks(count, days, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=pd.Timestamp.now("UTC").tz_localize(None).normalize(), periods=days)
+    steps = rng.normal(0.0005, 0.015, (count, days))
+    # a little autocorrelation so the AR(1) forecasts take both signs
+    steps[:, 1:] += 0.3 * steps[:, :-1]
+    return dates, 100 * np.exp(steps.cumsum(axis=1))
+
+
+def reference_values(tickers, seed, years, rebalance, max_weight, cost_bps):
+    """Walk the simulation one day at a time, trading whole positions."""
+    freq, horizon = REBALANCE[rebalance]
+    start = pd.Timestamp.now("UTC").tz_localize(None) - pd.DateOffset(years=years)
+    names, dates, prices = load_prices(tickers, "1d")
+    forecast = expected_returns(prices, horizon)
+    sentiment = np.zeros(len(names))
+    first = int((dates < start).sum())
+
+    shares = np.zeros(len(names))
+    cash = seed
+    values = []
+    for day in range(first, len(dates)):
+        price = prices[:, day]
+        held = np.nan_to_num(shares * price)
+        value = cash + held.sum()
+        if day == first or dates[day].to_period(freq) != dates[day - 1].to_period(freq):
+            weights = target_weights(forecast[:, [day]], sentiment, max_weight)[:, 0]
+            weights[np.isnan(price)] = 0.0
+            current = held / value if day > first else np.zeros(len(names))
+            value *= 1 - cost_bps / 10000 * np.abs(weights - current).sum()
+            with np.errstate(invalid="ignore", divide="ignore"):
+                shares = np.nan_to_num(weights * value / price)
+            cash = value * (1 - weights.sum())
+        values.append(cash + np.nan_to_num(shares * price).sum())
+    return np.array(values)
+
+
+def test_simulate_portfolio_matches_daily_loop(database):
+    dates, closes = random_walks(6, 600)
+    tickers = [f"T{i}" for i in range(6)]
+    for ticker, series in zip(tickers, closes):
+        daily_bars(ticker, series, dates)
+    # a ticker listed partway through the window
+    daily_bars("LATE", closes[0, 400:] * 0.5, dates[400:])
+    tickers.append("LATE")
+
+    for rebalance in REBALANCE:
+        result = simulate_portfolio(
+            tickers, seed=10000.0, years=1, rebalance=rebalance, max_weight=0.3, cost_bps=10, sentiment={}
+        )
+        expected = reference_values(tickers, 10000.0, 1, rebalance, 0.3, 10)
+        np.testing.assert_allclose(result["values"], expected, rtol=1e-11)
+        assert result["stats"]["costs"] > 0
+
+
+def test_weights_are_capped_and_the_rest_is_cash(database):
+    dates, closes = random_walks(3, 400, seed=1)
+    for i, series in enumerate(closes):
+        daily_bars(f"T{i}", series, dates)
+
+    weights = target_weights(np.array([[0.1], [0.01], [0.01]]), np.zeros(3), 0.5)
+    np.testing.assert_allclose(weights[:, 0], [0.5, 0.25, 0.25])
+
+    result = simulate_portfolio(["T0", "T1", "T2"], years=1, max_weight=0.2, sentiment={})
+    assert result["holdings"]
+    assert all(0 < h["weight"] <= 0.2 + 1e-12 for h in result["holdings"])
+    # three tickers at no more than 20% each leave at least 40% in cash
+    assert sum(h["weight"] for h in result["holdings"]) <= 0.6 + 1e-12
+
+
+def test_no_positive_forecast_stays_in_cash(database):
+    dates = pd.bdate_range(end=pd.Timestamp.now("UTC").tz_localize(None).normalize(), periods=400)
+    daily_bars("DOWN", np.linspace(200, 100, len(dates)), dates)
+
+    result = simulate_portfolio(["DOWN"], seed=5000.0, years=1, sentiment={})
+    assert result["holdings"] == []
+    np.testing.assert_allclose(result["values"], 5000.0)
+    assert result["stats"]["costs"] == 0
+    assert result["stats"]["benchmark_return"] < 0
+
+
+def test_unknown_rebalance_is_rejected(database):
+    with pytest.raises(ValueError, match="daily"):
+        simulate_portfolio(["AAPL"], rebalance="daily")
+
+
+def test_view_offers_every_rebalance_schedule(client):
+    resp = client.get("/portfolio?rebalance=quarterly")
+    assert resp.status_code == 200
+    for value in REBALANCE:
+        assert f"<option value='{value}'".encode() in resp.data
+    assert b"<option value='quarterly' selected>" in resp.data
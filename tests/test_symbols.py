@@ -0,0 +1,28 @@
+import symbols
+
+
+def add_symbol(conn, ticker, name):
+    conn.execute(
+        "INSERT OR REPLACE INTO symbols (ticker, name, market, type, exchange, active) "
+        "VALUES (?, ?, 'stocks', 'CS', 'XNAS', 1)",
+        (ticker, name),
+    )
+    conn.commit()
+
+
+def test_trie_picks_up_symbols_loaded_by_another_process(database, monkeypatch):
+    monkeypatch.setattr(symbols, "_trie", None)
+    add_symbol(database, "AAPL", "Apple Inc.")
+    assert [r["ticker"] for r in symbols.get_trie().search("A")] == ["AAPL"]
+
+    # a reload elsewhere does not reset this process's trie
+    add_symbol(database, "AMZN", "Amazon.com Inc.")
+    add_symbol(database, "AAPL", "Apple Inc")
+    assert [r["ticker"] for r in symbols.get_trie().search("A")] == ["AAPL"]
+
+    monkeypatch.setattr(symbols, "TRIE_CHECK_SECONDS", 0)
+    trie = symbols.get_trie()
+    assert [r["ticker"] for r in trie.search("A")] == ["AAPL", "AMZN"]
+    assert trie.search("AAPL")[0]["name"] == "Apple Inc"
+    # unchanged symbols keep the built trie
+    assert symbols.get_trie() is trie